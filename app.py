@@ -1,10 +1,34 @@
+import os
+import queue
 import streamlit as st
-import fitz  # PyMuPDF
-from docx import Document as DocxDocument
-from docx import Document
-from openai import AzureOpenAI
-import io
 import time
+from contextlib import nullcontext
+
+from dcf.aio import agenerate_dcf, get_event_loop_thread
+from dcf.cache import ResultCache
+from dcf.export import save_dcf_to_txt, word_document
+from dcf.extraction import UnsupportedFormatError, extract_upload
+from dcf.history import HistoryStore
+from dcf.llm import (
+    DEFAULT_DEPLOYMENT, DEFAULT_ENDPOINT, StreamStats, TokenUsage, configure_rate_limit, get_rate_limiter
+)
+from dcf.jobs import DONE, FAILED, QUEUED, STATUS_LABELS, JobQueue, JobStore
+from dcf.memo import MemoCache, content_hash
+from dcf.mapreduce import DEFAULT_MAX_WORKERS
+from dcf.pipeline import prepare_generation
+from dcf.prompts import PROMPT_VERSION
+from dcf.retrieval import RETRIEVAL_TOP_K
+from dcf.router import Route, get_router, parse_routes
+from dcf.timing import StageTimer, stage_rows
+
+# Intervalle minimal entre deux rafraîchissements de l'aperçu en streaming
+PREVIEW_REFRESH_SECONDS = 0.15
+# Attente maximale d'un événement de la génération avant de vérifier si elle est terminée
+EVENT_POLL_SECONDS = 0.1
+# Intervalle de rafraîchissement de l'état d'un travail en arrière-plan
+JOB_POLL_SECONDS = 2
+# Nombre de générations listées dans l'historique de la barre latérale
+HISTORY_LIST_SIZE = 10
 
 # Configuration de la page
 st.set_page_config(
@@ -14,419 +38,461 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# CSS personnalisé qui respecte les couleurs du config.toml
-st.markdown("""
-<style>
-    :root {
-        --primary-color: #4CAF50;
-        --secondary-color: #e3f2fd;
-        --background-color: #f8f9fa;
-        --text-color: #2c3e50;
-        --accent-color: #2196F3;
-        --border-color: #ced4da;
-    }
-    
-    .stApp {
-        background-color: var(--background-color);
-        color: var(--text-color);
-        font-family: 'sans serif';
-    }
-    
-    .stTextInput>div>div>input, 
-    .stTextArea>div>div>textarea,
-    .stSelectbox>div>div>select {
-        background-color: white !important;
-        color: var(--text-color) !important;
-        border: 1px solid var(--border-color) !important;
-        border-radius: 6px !important;
-        padding: 8px 12px !important;
-    }
-    
-    .stTextInput>div>div>input:focus, 
-    .stTextArea>div>div>textarea:focus {
-        border-color: var(--primary-color) !important;
-        box-shadow: 0 0 0 2px rgba(76, 175, 80, 0.2) !important;
-    }
-    
-    .stButton>button {
-        background-color: var(--primary-color) !important;
-        color: white !important;
-        border: none !important;
-        border-radius: 6px !important;
-        padding: 10px 24px !important;
-        font-weight: 500 !important;
-        transition: all 0.3s ease !important;
-    }
-    
-    .stButton>button:hover {
-        background-color: #3e8e41 !important;
-        transform: translateY(-1px);
-        box-shadow: 0 2px 5px rgba(0,0,0,0.1);
-    }
-    
-    .stFileUploader>div>div>button {
-        background-color: var(--primary-color) !important;
-        color: white !important;
-        border-radius: 6px !important;
-    }
-    
-    .sidebar .sidebar-content {
-        background-color: var(--secondary-color) !important;
-        border-right: 1px solid var(--border-color);
-    }
-    
-    h1, h2, h3, h4, h5, h6 {
-        color: var(--text-color) !important;
-    }
-    
-    .stProgress>div>div>div>div {
-        background-color: var(--primary-color) !important;
-    }
-    
-    .stAlert {
-        background-color: var(--secondary-color) !important;
-        border-left: 4px solid var(--primary-color);
-    }
-    
-    .stMarkdown {
-        color: var(--text-color) !important;
-    }
-    
-    .download-btn {
-        background-color: var(--accent-color) !important;
-        margin-top: 10px !important;
+# Feuille de style personnalisée (couleurs du config.toml), lue une fois par processus et intégrée à la
+# page. Si le service des fichiers statiques est activé (server.enableStaticServing), le navigateur la
+# télécharge une fois et la garde en cache : à réserver aux versions de Streamlit dont la route statique
+# sert les .css en text/css (les anciennes versions les servent en text/plain, que le navigateur ignore)
+STYLESHEET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "style.css")
+STYLESHEET_URL = "app/static/style.css"
+
+@st.cache_resource
+def load_stylesheet():
+    with open(STYLESHEET_PATH, encoding="utf-8") as f:
+        return f.read()
+
+def inject_stylesheet():
+    if st.get_option("server.enableStaticServing"):
+        st.markdown(f'<link rel="stylesheet" href="{STYLESHEET_URL}">', unsafe_allow_html=True)
+    else:
+        st.markdown(f"<style>{load_stylesheet()}</style>", unsafe_allow_html=True)
+
+inject_stylesheet()
+
+@st.cache_resource
+def get_memo():
+    """Mémoïsation partagée par les sessions du processus (extractions, prompts, exports)"""
+    return MemoCache()
+
+def upload_hash(uploaded_file):
+    """Empreinte du contenu d'un fichier uploadé, calculée une fois par session"""
+    hashes = st.session_state.setdefault("upload_hashes", {})
+    if uploaded_file.file_id not in hashes:
+        hashes.clear()
+        hashes[uploaded_file.file_id] = content_hash(uploaded_file)
+    return hashes[uploaded_file.file_id]
+
+def read_document(uploaded_file):
+    """Lit un fichier uploadé et renvoie son texte et, pour un PDF, la position de début de chaque page
+
+    Le résultat est mémorisé par empreinte du contenu, pour la session (dernier
+    fichier lu) et pour le processus : un fichier déjà lu n'est pas réanalysé.
+    Les fichiers volumineux sont lus depuis une copie sur disque, et les
+    lectures simultanées se partagent un budget mémoire (voir dcf.uploads).
+    """
+    key = ("extract", upload_hash(uploaded_file), uploaded_file.type)
+    last = st.session_state.get("last_document")
+    try:
+        if last and last[0] == key:
+            document = last[1]
+        else:
+            document = get_memo().get_or_compute(key, lambda: extract_upload(
+                uploaded_file, uploaded_file.type,
+                on_wait=lambda: st.info("Plusieurs fichiers volumineux sont en cours de lecture : votre fichier est en file d'attente...")
+            ))
+            st.session_state["last_document"] = (key, document)
+        show_ocr_report(document.ocr)
+        return document.text, document.page_offsets
+    except UnsupportedFormatError:
+        st.error("Format non supporté. Utilisez un fichier .pdf, .txt ou .docx.")
+        return None, None
+    except Exception as e:
+        st.error(f"Erreur lors de la lecture du fichier: {str(e)}")
+        return None, None
+
+def show_ocr_report(report):
+    """Indique combien de pages scannées ont été lues par OCR, et en combien de temps"""
+    if report is None:
+        return
+    if report.pages or report.cached:
+        st.caption(
+            f"🔎 OCR : {report.pages + report.cached} pages scannées lues en {report.seconds:.1f} s"
+            + (f" (dont {report.cached} depuis le cache)" if report.cached else "")
+        )
+    if report.unavailable:
+        st.warning(
+            f"{report.unavailable} pages scannées n'ont pas pu être lues : "
+            "l'OCR Tesseract n'est pas installé sur le serveur (ou la langue demandée manque)."
+        )
+
+def read_file(uploaded_file):
+    """Lit le contenu d'un fichier uploadé (PDF, TXT ou DOCX)"""
+    return read_document(uploaded_file)[0]
+
+def show_generation_error(error):
+    """Présente une erreur de génération (dcf.aio.GenerationError)"""
+    message = f"{error.message} Détail : {error.detail}" if error.detail else error.message
+    if error.retryable:
+        message += " Vous pouvez relancer la génération dans quelques instants."
+    st.error(message)
+
+def _cancel_generation():
+    st.session_state["generation_cancelled"] = True
+
+def call_gpt(cdc_text, api_key, endpoint, deployment, prepared, page_offsets, lineage, max_workers, chunked=True,
+             incremental=False, retrieval=False, structured=False, pre_extract=False, read_cache=True,
+             streaming=False, timer=None, router=None, usage=None):
+    """Génère le DCF par dcf.aio.agenerate_dcf en affichant sa progression, et renvoie le GenerationResult
+
+    La génération (cache, mode, requêtes, historique) s'exécute sur la boucle
+    asynchrone partagée du processus. Ses événements (avancement des phases,
+    fragments du DCF en streaming) sont relayés par une file et affichés ici :
+    seul le thread du script peut modifier la page.
+    """
+    labels = {
+        "map": "Analyse des segments du CDC",
+        "merge": "Fusion des analyses",
+        "reduce": "Rédaction du DCF",
+        "outline": "Plan du DCF",
+        "sections": "Rédaction des sections",
+        "generation": "Génération du DCF structuré",
+        "repair": "Reprise des sections invalides"
     }
+    # Un clic relance le script : Streamlit interrompt l'attente ci-dessous et
+    # l'annulation de la génération coupe les requêtes en cours chez Azure
+    st.button("Annuler la génération", on_click=_cancel_generation)
+    status_text = st.empty()
+    progress_bar = st.progress(0) if prepared[1] != "direct" else None
+    metrics_text = st.empty()
+    preview = st.empty()
+    status_text.text(" Génération en cours...")
+
+    events = queue.Queue()
+    future = get_event_loop_thread().submit(agenerate_dcf(
+        cdc_text, api_key, endpoint, deployment, page_offsets=page_offsets, chunked=chunked,
+        max_workers=max_workers, cache=get_result_cache(), read_cache=read_cache, timer=timer, usage=usage,
+        on_progress=lambda phase, done, total: events.put(("progress", (phase, done, total))),
+        incremental=incremental, lineage=lineage, router=router, retrieval=retrieval, structured=structured,
+        pre_extract=pre_extract, prepared=prepared,
+        on_delta=(lambda delta: events.put(("delta", delta))) if streaming else None,
+        history=get_history(), memo=get_memo()
+    ))
+    stats = StreamStats()
+    parts = []
+    last_refresh = 0.0
+    try:
+        while True:
+            try:
+                kind, payload = events.get(timeout=EVENT_POLL_SECONDS)
+            except queue.Empty:
+                # Les événements précèdent la fin de la génération : la file est vide pour de bon
+                if future.done():
+                    break
+                continue
+            if kind == "progress":
+                phase, done, total = payload
+                status_text.text(f" {labels.get(phase, phase)}... {done}/{total}")
+                progress_bar.progress(done / total if total else 1.0)
+                if phase == "reduce" and done == 0:
+                    # Le DCF n'est rédigé qu'à l'appel final : le premier token est attendu à partir d'ici
+                    stats = StreamStats()
+                continue
+            stats.record(payload)
+            parts.append(payload)
+            if stats.last_token_at - last_refresh >= PREVIEW_REFRESH_SECONDS:
+                last_refresh = stats.last_token_at
+                preview.markdown("".join(parts) + "▌")
+                metrics_text.text(
+                    f" Premier token : {stats.time_to_first_token:.2f} s · "
+                    f"{stats.tokens} tokens · {stats.tokens_per_second:.1f} tokens/s"
+                )
+        result = future.result()
+    except BaseException:
+        future.cancel()
+        raise
+    finally:
+        preview.empty()
+        metrics_text.empty()
+        status_text.empty()
+        if progress_bar is not None:
+            progress_bar.empty()
+
+    if result.ok and stats.first_token_at is not None:
+        st.caption(
+            f"Premier token après {stats.time_to_first_token:.2f} s · "
+            f"{stats.tokens} tokens générés à {stats.tokens_per_second:.1f} tokens/s"
+        )
+    return result
+
+def show_generation_details(result, show_prompt=False, show_raw_output=False):
+    """Présente le bilan propre au mode de génération (segments, sections reprises, validation du JSON)"""
+    details = result.details
+    if result.mode == "map-reduce":
+        st.info(f"CDC volumineux : {len(details.segments)} segments analysés en parallèle avant la rédaction du DCF.")
+        if show_prompt:
+            with st.expander(" Prompt de synthèse envoyé à l'API"):
+                st.code(details.reduce_prompt)
+    elif result.mode in ("sections", "retrieval"):
+        if details.retrieval:
+            stats = details.retrieval
+            st.caption(
+                f"Index local : {stats['documents']} passages, {stats['terms']} termes, construit en "
+                f"{stats['build_ms']:.0f} ms · {stats['queries']} recherches, {stats['query_ms']:.1f} ms en moyenne · "
+                f"{RETRIEVAL_TOP_K} passages au plus par section"
+            )
+        reused = len(details.units) - details.regenerated
+        st.info(
+            f"{details.regenerated} section(s) rédigée(s) sur {len(details.units)}, {reused} reprise(s) de la "
+            f"génération précédente ({details.changed_chunks} passage(s) du CDC modifié(s) sur {details.chunk_count})."
+        )
+    elif result.mode == "structured":
+        if details.retried:
+            st.caption(
+                f"Section(s) reprise(s) après validation : {', '.join(details.retried)}"
+                + (f" · toujours incomplète(s) : {', '.join(details.invalid)}" if details.invalid else "")
+            )
+        if details.invalid:
+            st.warning("Certaines sections n'ont pas pu être validées : elles sont signalées comme incomplètes dans le DCF.")
+        if not details.json_schema:
+            st.caption("Le déploiement n'accepte pas les schémas JSON : le schéma a été décrit dans le prompt.")
+        if show_raw_output:
+            with st.expander(" Réponse JSON de l'API"):
+                st.json(details.data)
+
+def show_route_stats(router):
+    """État des déploiements du routeur (latence, erreurs, quota restant)"""
+    with st.expander("État des déploiements"):
+        for route in router.stats():
+            details = [f"{route['requests']} requêtes"]
+            if route["latency"] is not None:
+                details.append(f"premier token {route['latency']:.1f} s")
+            details.append(f"erreurs {route['error_rate']:.0%}")
+            if route["remaining_tokens"] is not None:
+                details.append(f"quota restant {route['remaining_tokens']} tokens")
+            if route["hedges"]:
+                details.append(f"{route['hedges']} secours")
+            if route["cooling_down"]:
+                details.append(f"écarté {route['cooling_down']:.0f} s")
+            st.caption(f"**{route['route']}** (poids {route['weight']:g}) · " + " · ".join(details))
+
+def _tokens(count, exact=True):
+    """Formate un nombre de tokens (séparateur de milliers, ≈ s'il est estimé)"""
+    return ("" if exact else "≈ ") + f"{count:,}".replace(",", " ")
+
+def show_token_budget(budget, mode):
+    """Affiche le nombre de tokens du CDC et du prompt avant l'envoi"""
+    details = (
+        f"CDC : {_tokens(budget.cdc_tokens, budget.exact)} tokens · fenêtre de {budget.deployment} : "
+        f"{_tokens(budget.context_tokens)} tokens, dont {_tokens(budget.output_tokens)} réservés à la réponse"
+    )
+    if mode == "sections":
+        st.caption(f"Génération incrémentale par section · {details}")
+        return
+    if mode == "retrieval":
+        st.caption(f"Génération par section à partir des passages pertinents du CDC · {details}")
+        return
+    if mode == "structured":
+        st.caption(
+            f"Génération structurée (JSON) · prompt : {_tokens(budget.prompt_tokens, budget.exact)} / "
+            f"{_tokens(budget.input_budget)} tokens · {details}"
+        )
+        if budget.truncated:
+            st.warning(
+                f"Même compacté, le CDC dépasse la fenêtre de contexte : seuls {_tokens(budget.sent_cdc_tokens)} "
+                f"tokens sur {_tokens(budget.cdc_tokens)} seront envoyés."
+            )
+        return
+    if mode == "map-reduce":
+        st.info(f"Le CDC dépasse la fenêtre de contexte : il sera analysé par segments. {details}")
+        return
     
-    .download-btn:hover {
-        background-color: #0d8bf2 !important;
-    }
+    st.caption(
+        f"Prompt : {_tokens(budget.prompt_tokens, budget.exact)} / {_tokens(budget.input_budget)} tokens · {details}"
+    )
+    if budget.truncated:
+        st.warning(
+            f"Même compacté, le CDC dépasse la fenêtre de contexte : seuls {_tokens(budget.sent_cdc_tokens)} tokens "
+            f"sur {_tokens(budget.cdc_tokens)} seront envoyés. Activez le découpage des CDC volumineux pour l'analyser en entier."
+        )
+    elif budget.compressed:
+        st.caption(
+            f"Espaces superflus et en-têtes/pieds de page répétés retirés : "
+            f"{_tokens(budget.sent_cdc_tokens)} tokens envoyés au lieu de {_tokens(budget.cdc_tokens)}."
+        )
+
+def export_word(dcf_result):
+    """Document Word du DCF, construit une seule fois par résultat et réutilisé aux relances du script"""
+    return word_document(dcf_result, get_memo())
+
+def export_txt(dcf_result):
+    """Export texte du DCF, mémorisé comme l'export Word"""
+    return get_memo().get_or_compute(
+        ("txt", content_hash(dcf_result)), lambda: save_dcf_to_txt(dcf_result).getvalue()
+    )
+
+def show_dcf_result(dcf_result, timer=None, show_raw_output=False, show_timings=False, docx=None):
+    """Affiche le DCF généré et les boutons de téléchargement
+
+    docx est le document Word déjà construit (DCF rouvert depuis l'historique).
+    """
+    def measure(stage):
+        return timer.stage(stage) if timer else nullcontext()
     
-    .header-container {
-        background: linear-gradient(135deg, var(--primary-color) 0%, #3e8e41 100%);
-        padding: 2rem;
-        border-radius: 0 0 10px 10px;
-        margin-bottom: 2rem;
-    }
+    if show_raw_output:
+        with st.expander("Sortie brute de l'API"):
+            st.code(dcf_result)
     
-    .header-title {
-        color: white !important;
-        margin: 0;
-    }
+    # Affichage du résultat avec onglets
+    tab1, tab2 = st.tabs(["Aperçu du DCF", " Téléchargement"])
     
-    .header-subtitle {
-        color: rgba(255,255,255,0.9) !important;
-        margin: 0.5rem 0 0;
-    }
+    with tab1:
+        st.subheader("Résultat - Dossier de Conception Fonctionnelle")
+        st.markdown(dcf_result)
     
-    .info-box {
-        background-color: var(--secondary-color);
-        border-left: 4px solid var(--accent-color);
-        padding: 1rem;
-        border-radius: 6px;
-        margin-bottom: 1rem;
-    }
+    with tab2:
+        st.subheader("Options de téléchargement")
+        col1, col2 = st.columns(2)
+        with col1:
+            with measure("export_docx"):
+                word_buffer = docx if docx is not None else export_word(dcf_result)
+            st.download_button(
+                label="Télécharger en Word",
+                data=word_buffer,
+                file_name="DCF_Généré.docx",
+                mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+                use_container_width=True
+            )
+        
+        with col2:
+            with measure("export_txt"):
+                txt_buffer = export_txt(dcf_result)
+            st.download_button(
+                label=" Télécharger en TXT",
+                data=txt_buffer,
+                file_name="DCF_Généré.txt",
+                mime="text/plain",
+                use_container_width=True
+            )
     
-    .success-box {
-        background-color: rgba(76, 175, 80, 0.1);
-        border-left: 4px solid var(--primary-color);
-        padding: 1rem;
-        border-radius: 6px;
-        margin-bottom: 1rem;
-    }
+    if timer and show_timings:
+        show_stage_timings(timer.as_dict())
+
+def show_stage_timings(stages):
+    """Affiche les temps par étape dans la barre latérale"""
+    with st.sidebar:
+        st.subheader("Temps par étape")
+        st.dataframe(stage_rows(stages), hide_index=True, use_container_width=True)
+
+@st.cache_resource
+def get_job_queue():
+    """File des travaux en arrière-plan, partagée par toutes les sessions du processus"""
+    return JobQueue(JobStore(), cache=get_result_cache(), history=get_history()).start()
+
+@st.cache_resource
+def get_history():
+    """Historique des générations, partagé par toutes les sessions du processus"""
+    history = HistoryStore()
+    history.purge()
+    return history
+
+def _open_history(entry_id):
+    st.session_state["history_entry"] = entry_id
+    st.query_params.pop("job", None)
+
+def show_history_list(history):
+    """Liste des dernières générations, filtrée par nom de fichier et par date"""
+    search = st.text_input("Rechercher un fichier", key="history_search", placeholder="Début du nom du fichier")
+    since = st.date_input("Depuis le", value=None, key="history_since", format="DD/MM/YYYY")
+    entries = history.search(
+        file_name=search.strip() or None,
+        since=time.mktime(since.timetuple()) if since else None,
+        limit=HISTORY_LIST_SIZE
+    )
+    if not entries:
+        st.caption("Aucune génération enregistrée." if not (search or since) else "Aucune génération trouvée.")
+    for entry in entries:
+        st.button(
+            f"{entry.file_name} · {time.strftime('%d/%m/%Y %H:%M', time.localtime(entry.created_at))}",
+            key=f"history_{entry.id}",
+            help=f"{entry.deployment} · prompts {entry.prompt_version} · mode {entry.mode or 'n/d'} · "
+                 f"{entry.tokens.get('total_tokens', 0)} tokens",
+            on_click=_open_history,
+            args=(entry.id,),
+            use_container_width=True
+        )
+
+def show_history_entry(history, entry_id, show_raw_output=False, show_timings=False):
+    """Affiche un DCF de l'historique, sans nouvel appel au modèle"""
+    entry = history.get(entry_id)
+    if entry is None:
+        st.warning("Cette génération ne figure plus dans l'historique.")
+        st.session_state.pop("history_entry", None)
+        return
+    st.info(
+        f"DCF de {entry.file_name}, généré le "
+        f"{time.strftime('%d/%m/%Y à %H:%M', time.localtime(entry.created_at))} avec {entry.deployment}."
+    )
+    show_dcf_result(entry.dcf, show_raw_output=show_raw_output, docx=history.get_docx(entry_id))
+    if show_timings and entry.stages:
+        show_stage_timings(entry.stages)
+
+def _open_job():
+    job_id = st.session_state.get("job_lookup", "").strip()
+    if job_id:
+        st.query_params["job"] = job_id
+
+def _cancel_job(job_queue, job_id):
+    if not job_queue.cancel(job_id):
+        st.toast("Le travail a déjà démarré : il ne peut plus être annulé.")
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def show_job_progress(job_queue, job_id):
+    """Affiche l'avancement d'un travail, rafraîchi périodiquement sans relancer toute la page"""
+    job = job_queue.store.get(job_id)
+    if job is None or job.finished:
+        st.rerun()
     
-    .error-box {
-        background-color: rgba(244, 67, 54, 0.1);
-        border-left: 4px solid #f44336;
-        padding: 1rem;
-        border-radius: 6px;
-        margin-bottom: 1rem;
-    }
+    queue_stats = job_queue.stats()
+    status = STATUS_LABELS[job.status] + (f" - {job.progress}" if job.progress else "")
+    st.markdown(f"""
+    <div class="info-box">
+        <h4 style="margin-top: 0;">Travail en arrière-plan : {status}</h4>
+        <p>Identifiant : <code>{job_id}</code> - la page peut être rechargée ou quittée, le résultat restera disponible.</p>
+        <p style="margin: 0;">File d'attente : {queue_stats['queued']} en attente · {queue_stats['running']} en cours
+        sur {queue_stats['concurrency']} simultanés au maximum</p>
+    </div>
+    """, unsafe_allow_html=True)
+    if job.status == QUEUED:
+        st.button("Annuler ce travail", on_click=_cancel_job, args=(job_queue, job_id))
+
+def show_job(job_queue, job_id, show_raw_output=False, show_timings=False):
+    """Affiche l'état d'un travail en arrière-plan, puis son résultat une fois terminé"""
+    job = job_queue.store.get(job_id)
+    if job is None:
+        st.warning(f"Aucun travail ne correspond à l'identifiant {job_id}.")
+        return
     
-    .stExpander {
-        border: 1px solid var(--border-color) !important;
-        border-radius: 6px !important;
-    }
+    if not job.finished:
+        show_job_progress(job_queue, job_id)
+        return
     
-    .stExpander .stExpanderHeader {
-        background-color: var(--secondary-color) !important;
-    }
+    if job.status == FAILED:
+        st.markdown(f"""
+        <div class="error-box">
+            <h4 style="margin-top: 0;"> La génération en arrière-plan a échoué</h4>
+            <p>{job.error}</p>
+        </div>
+        """, unsafe_allow_html=True)
+        return
     
-    [data-testid="stHeader"] {
-        background-color: rgba(255,255,255,0) !important;
-    }
+    if job.status != DONE:
+        st.info(f"Le travail {job_id} a été annulé.")
+        return
     
-    [data-testid="stToolbar"] {
-        display: none !important;
-    }
-</style>
-""", unsafe_allow_html=True)
-
-def read_file(uploaded_file):
-    """Lit le contenu d'un fichier uploadé (PDF, TXT ou DOCX)"""
-    try:
-        if uploaded_file.type == "application/pdf":
-            text = ""
-            with fitz.open(stream=uploaded_file.read(), filetype="pdf") as doc:
-                for page in doc:
-                    text += page.get_text()
-            return text
-        
-        elif uploaded_file.type == "text/plain":
-            return uploaded_file.read().decode("utf-8")
-        
-        elif uploaded_file.type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-            doc = DocxDocument(io.BytesIO(uploaded_file.read()))
-            text = ""
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
-            return text
-        
-        else:
-            st.error("Format non supporté. Utilisez un fichier .pdf, .txt ou .docx.")
-            return None
-    except Exception as e:
-        st.error(f"Erreur lors de la lecture du fichier: {str(e)}")
-        return None
-
-# def generate_prompt(cdc_text):
-#     """Génère le prompt pour GPT à partir du texte du CDC"""
-#     return f"""
-# Tu es un assistant expert en conception fonctionnelle de systèmes d'information, et tu dois rédiger un Dossier de Conception Fonctionnelle (DCF) à partir d'un cahier des charges (CDC) fourni ci-dessous.
-
-# Le DCF que tu vas rédiger doit **respecter rigoureusement la structure suivante**, issue du guide d'élaboration DDI M IT 02.02 :
-
-# ---
-
-# ### 1. CADRE GENERAL
-# 1.1. Présentation générale du système (objectifs, fonctions globales)
-# 1.2. Références (documents applicables et références)
-# 1.3. Environnement (positionnement dans le SI, environnement technique)
-# 1.4. Terminologie et sigles utilisés
-
-# ### 2. ARCHITECTURE FONCTIONNELLE
-# 2.1. Modules fonctionnels (découpage, description des modules)
-# 2.2. Synoptique fonctionnel (flux entre fonctions)
-
-# ### 3. SPECIFICATIONS FONCTIONNELLES
-# Pour chaque module identifié :
-# - Nom du module
-# - Pour chaque fonction :
-#   - Définition (objectif de la fonction)
-#   - Identification (code, acteur, déclencheur, conséquences IHM et traitement)
-#   - Description du processus :
-#     - Entrées
-#     - Traitement
-#     - Sorties
-#     - Règles de gestion (Pas d'Abréviation écrit la règle de gestion)
-
-# ### 4. REPRISE DE L'EXISTANT
-# 4.1. Procédure de reprise
-# 4.2. Contraintes de reprise
-
-# ### 5. RECAPITULATIF DES REGLES DE GESTION
-# Tableau récapitulatif avec fonction associée à chaque règle.
-
-# ### 6. VISA DE VALIDATION
-# Présentation des aspects validés et les parties prenantes concernées.
-
-# ---
-
-# Tu dois **extraire, analyser et structurer le contenu du CDC suivant** pour produire automatiquement un DCF de qualité conforme à cette structure, en tenant compte :
-# - des besoins exprimés,
-# - des règles de gestion métier,
-# - des exigences fonctionnelles,
-# - des contraintes techniques,
-# - des modules évoqués.
-
-# Voici le contenu du CDC :
-
-# \"\"\"{cdc_text[:15000]}\"\"\"
-
-# Rédige maintenant un DCF complet et bien formaté à partir de ce CDC.
-# """
-
-def generate_prompt(cdc_text):
-    """Génère le prompt pour GPT à partir du texte du CDC"""
-    return f"""
-Tu es un assistant expert en conception fonctionnelle de systèmes d'information, et tu dois rédiger un Dossier de Conception Fonctionnelle (DCF) détaillé et complet à partir d'un cahier des charges (CDC) fourni ci-dessous.
-
-Le DCF que tu vas rédiger doit **respecter rigoureusement la structure suivante**, issue du guide d'élaboration DDI M IT 02.02, en fournissant des informations précises et exhaustives pour chaque section :
-
----
-
-### 1. CADRE GENERAL
-1.1. Présentation générale du système
-   - Objectifs stratégiques et opérationnels
-   - Périmètre fonctionnel précis
-   - Finalité du système
-   - Bénéfices attendus
-   - Publics cibles
-
-1.2. Références
-   - Documents normatifs (liste complète)
-   - Standards applicables
-   - Contraintes réglementaires
-   - Références aux documents projets
-
-1.3. Environnement
-   - Architecture technique détaillée
-   - Systèmes connectés (interfaces)
-   - Contraintes d'intégration
-   - Prérequis matériels/logiciels
-   - Environnement de déploiement
-
-1.4. Terminologie et sigles
-   - Glossaire complet avec définitions
-   - Liste des acronymes avec explications
-   - Termes techniques spécifiques
-
-### 2. ARCHITECTURE FONCTIONNELLE
-2.1. Modules fonctionnels
-   - Découpage modulaire détaillé
-   - Responsabilités de chaque module
-   - Interactions entre modules
-   - Spécificités techniques
-
-2.2. Synoptique fonctionnel
-   - Diagramme textuel des flux
-   - Séquencement des opérations
-   - Points d'intégration critiques
-   - Flux principaux et secondaires
-
-### 3. SPECIFICATIONS FONCTIONNELLES (À DÉTAILLER POUR CHAQUE MODULE)
-Pour chaque module identifié :
-- Nom du module et version
-- Description approfondie :
-  * Finalité et portée
-  * Contraintes spécifiques
-  * Hypothèses techniques
-
-Pour chaque fonction :
-  - Définition complète :
-    * Objectif métier
-    * Valeur ajoutée
-    * Critères de succès
-
-  - Identification précise :
-    * Code unique (norme de nommage)
-    * Acteurs concernés (rôles)
-    * Déclencheurs (événements)
-    * Préconditions et postconditions
-    * Impacts IHM détaillés
-
-  - Description du processus :
-    * Entrées : format, source, validation
-    * Traitement : algorithme, logique métier
-    * Sorties : format, destination, qualité
-    * Règles de gestion : formulation complète sans abréviation
-    * Cas d'erreur et gestion des exceptions
-    * Contrôles de qualité
-
-### 4. REPRISE DE L'EXISTANT
-4.1. Procédure de reprise
-   - Stratégie de migration
-   - Plan de conversion
-   - Nettoyage des données
-   - Validation post-migration
-
-4.2. Contraintes de reprise
-   - Compatibilités
-   - Anomalies connues
-   - Limitations techniques
-   - Périmètre exclu
-
-### 5. RECAPITULATIF DES REGLES DE GESTION
-Tableau structuré contenant :
-- Identifiant unique de la règle
-- Libellé complet et non ambigu
-- Module/fonction associée
-- Source métier
-- Critère d'application
-- Exemples concrets
-- Exceptions éventuelles
-
-### 6. VISA DE VALIDATION
-- Liste des validations requises
-- Responsables par domaine
-- Critères d'acceptation
-- Preuves de validation
-- Planning de recette
-
----
-
-**Directives spécifiques :**
-1. Analyse minutieusement le CDC pour extraire toutes les exigences implicites et explicites
-2. Structure le contenu de manière logique et progressive
-3. Utilise un langage technique précis mais accessible
-4. Fournis des exemples concrets quand nécessaire
-5. Identifie clairement les dépendances entre composants
-6. Mentionne les contraintes et limitations de manière transparente
-7. Propose des recommandations pour les aspects critiques
-
-**Approche rédactionnelle :**
-- Style professionnel et normatif
-- Phrases complètes et structurées
-- Terminologie cohérente
-- Numérotation précise des éléments
-- Mise en forme claire avec des paragraphes aérés
-
-Voici le contenu du CDC à analyser :
-
-\"\"\"{cdc_text[:30000]}\"\"\"
-
-Génère maintenant un DCF exhaustif, en développant particulièrement :
-- Les règles de gestion avec leur logique complète
-- Les scénarios d'utilisation typiques
-- Les cas limites à prendre en compte
-- Les interfaces système détaillées
-- Les contraintes de performance
-"""
-
-def call_gpt(prompt, api_key, endpoint, deployment):
-    """Appelle l'API Azure OpenAI pour générer le DCF"""
-    try:
-        client = AzureOpenAI(
-            api_key=api_key,
-            api_version="2024-02-15-preview",
-            azure_endpoint=endpoint
-        )
+    st.markdown(f"""
+    <div class="success-box">
+        <h4 style="margin-top: 0;"> DCF généré avec succès ! ({job.file_name})</h4>
+        <p>Temps de traitement : {job.finished_at - job.created_at:.2f} secondes, dont
+        {(job.started_at or job.created_at) - job.created_at:.2f} secondes d'attente</p>
+    </div>
+    """, unsafe_allow_html=True)
+    show_dcf_result(job.result, show_raw_output=show_raw_output)
+    if show_timings and job.stages:
+        show_stage_timings(job.stages)
 
-        response = client.chat.completions.create(
-            model=deployment,
-            messages=[
-                {"role": "system", "content": "Tu es un expert en conception de systèmes logiciels."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        st.error(f"Erreur lors de l'appel à l'API OpenAI: {str(e)}")
-        return None
-
-def save_dcf_to_word(text, filename="DCF_Généré.docx"):
-    """Sauvegarde le DCF dans un fichier Word"""
-    doc = Document()
-    for line in text.split('\n'):
-        if line.strip() == "":
-            continue
-        if line.strip().startswith('#') or line.strip().startswith("1.") or line.strip().startswith("2.") or line.strip().startswith("3."):
-            doc.add_heading(line.strip(), level=1)
-        else:
-            doc.add_paragraph(line.strip())
-    
-    # Sauvegarde en mémoire
-    buffer = io.BytesIO()
-    doc.save(buffer)
-    buffer.seek(0)
-    return buffer
-
-def save_dcf_to_txt(text, filename="DCF_Généré.txt"):
-    """Sauvegarde le DCF dans un fichier texte"""
-    buffer = io.BytesIO()
-    buffer.write(text.encode('utf-8'))
-    buffer.seek(0)
-    return buffer
+@st.cache_resource
+def get_result_cache():
+    """Cache des DCF générés, partagé par toutes les sessions du processus"""
+    return ResultCache()
 
 def main():
     """Fonction principale de l'application Streamlit."""
@@ -460,14 +526,123 @@ def main():
         
         st.subheader("API Azure OpenAI")
         api_key = st.text_input("Clé API", type="password", help="La clé API pour accéder au service Azure OpenAI")
-        endpoint = st.text_input("Endpoint", value="https://chat-genai.openai.azure.com/", help="L'URL du endpoint Azure OpenAI")
-        deployment = st.text_input("Modèle", value="gpt-4o", help="Le nom du modèle déployé dans Azure OpenAI")
+        endpoint = st.text_input("Endpoint", value=DEFAULT_ENDPOINT, help="L'URL du endpoint Azure OpenAI")
+        deployment = st.text_input("Modèle", value=DEFAULT_DEPLOYMENT, help="Le nom du modèle déployé dans Azure OpenAI")
+        
+        # Quota partagé par toutes les sessions du serveur : au-delà, les requêtes patientent
+        limiter = get_rate_limiter(endpoint, deployment)
+        col_rpm, col_tpm = st.columns(2)
+        with col_rpm:
+            rpm = st.number_input("Requêtes / min", min_value=0, value=limiter.rpm or 0, step=10,
+                                  help="Quota RPM du déploiement (0 = illimité)")
+        with col_tpm:
+            tpm = st.number_input("Tokens / min", min_value=0, value=limiter.tpm or 0, step=1000,
+                                  help="Quota TPM du déploiement (0 = illimité)")
+        configure_rate_limit(endpoint, deployment, rpm, tpm)
+        
+        extra_routes = st.text_area(
+            "Déploiements supplémentaires",
+            value="",
+            placeholder="https://autre-region.openai.azure.com/, gpt-4o, 2",
+            help="Un déploiement par ligne : endpoint, modèle[, poids]. Les requêtes sont réparties selon le poids, "
+                 "la latence et les erreurs observées de chaque déploiement (même clé API pour tous)"
+        )
+        hedge_after = st.number_input(
+            "Requête de secours après (s)", min_value=0.0, value=0.0, step=5.0,
+            help="Si aucun token n'est reçu dans ce délai, la requête est dupliquée sur un autre déploiement et la "
+                 "première réponse est gardée (0 = désactivé ; nécessite des déploiements supplémentaires)"
+        ) or None
+        routes = [Route(endpoint, deployment)]
+        try:
+            routes += parse_routes(extra_routes)
+        except ValueError as e:
+            st.error(f"Déploiements supplémentaires : {e}")
+        router = get_router(routes, api_key, hedge_after) if api_key and len(routes) > 1 else None
+        if router is not None:
+            show_route_stats(router)
         
         st.markdown("---")
         
         st.subheader("Options")
         show_prompt = st.checkbox("Afficher le prompt envoyé à l'API", value=False)
         show_raw_output = st.checkbox("Afficher la sortie brute de l'API", value=False)
+        streaming = st.checkbox(
+            "Afficher le DCF pendant sa génération",
+            value=True,
+            help="Le texte est affiché au fil de l'eau (streaming), avec le temps de réponse et le débit réels"
+        )
+        chunked_mode = st.checkbox(
+            "Découper les CDC volumineux",
+            value=True,
+            help="Si le CDC dépasse la fenêtre de contexte du déploiement, il est analysé par segments en parallèle au lieu d'être tronqué"
+        )
+        incremental = st.checkbox(
+            "Régénération incrémentale par section",
+            value=False,
+            help="Le DCF est rédigé section par section ; pour une nouvelle version d'un CDC déjà traité (même nom de fichier), seules les sections concernées par les passages modifiés sont régénérées"
+        )
+        retrieval = st.checkbox(
+            "Contexte ciblé par section",
+            value=False,
+            help=f"Un index local du CDC fournit à chaque section du DCF ses {RETRIEVAL_TOP_K} passages les plus pertinents : les requêtes sont plus courtes et rédigées en parallèle"
+        )
+        structured = st.checkbox(
+            "Génération structurée (JSON)",
+            value=False,
+            help="Le modèle remplit un schéma JSON du DCF (sections, modules, règles de gestion) et le document est mis en page localement ; les sections invalides sont redemandées séparément"
+        )
+        pre_extract = st.checkbox(
+            "Pré-extraction des sigles et règles de gestion",
+            value=False,
+            help="Les sigles, règles de gestion (RG-xxx) et exigences numérotées sont relevés localement : le prompt reçoit un inventaire compact à la place des glossaires et tableaux de règles du CDC, et les tableaux des sections 1.4 et 5 du DCF sont composés par l'outil (génération directe)"
+        )
+        max_workers = st.slider("Requêtes parallèles", min_value=1, max_value=16, value=DEFAULT_MAX_WORKERS, disabled=not (chunked_mode or incremental or retrieval or structured))
+        show_timings = st.checkbox("Afficher les temps par étape", value=False)
+        
+        st.markdown("---")
+        
+        st.subheader("Cache des résultats")
+        result_cache = get_result_cache()
+        bypass_cache = st.checkbox(
+            "Ignorer le cache",
+            value=False,
+            help="Force une nouvelle génération même si ce CDC a déjà été traité avec les mêmes paramètres"
+        )
+        cache_stats = result_cache.stats()
+        st.caption(
+            f"{cache_stats['entries']} DCF en cache ({cache_stats['size_bytes'] / 1024 / 1024:.1f} Mo) · "
+            f"{cache_stats['hits']} succès · {cache_stats['misses']} échecs"
+        )
+        memo_stats = get_memo().stats()
+        st.caption(
+            f"Mémoire de travail : {memo_stats['entries']} éléments "
+            f"({memo_stats['bytes'] / 1024 / 1024:.1f} / {memo_stats['max_bytes'] / 1024 / 1024:.0f} Mo)"
+        )
+        if st.button("Vider le cache"):
+            result_cache.clear()
+            get_memo().clear()
+        
+        st.markdown("---")
+        
+        st.subheader("Exécution")
+        job_queue = get_job_queue()
+        background = st.checkbox(
+            "Générer en arrière-plan",
+            value=False,
+            help="La génération est confiée à la file de travaux du serveur : elle se poursuit si la page est rechargée et son résultat reste accessible par son identifiant"
+        )
+        queue_stats = job_queue.stats()
+        st.caption(
+            f"File d'attente : {queue_stats['queued']} en attente · {queue_stats['running']} en cours · "
+            f"{queue_stats['concurrency']} travaux simultanés au maximum"
+        )
+        st.text_input("Reprendre un travail", key="job_lookup", placeholder="Identifiant du travail", on_change=_open_job)
+        
+        st.markdown("---")
+        
+        st.subheader("Historique")
+        history = get_history()
+        show_history_list(history)
     
     # Zone de téléchargement du fichier avec style amélioré
     st.subheader("Téléversement du fichier")
@@ -481,6 +656,17 @@ def main():
     # Bouton de génération avec icône
     generate_button = st.button("Générer le DCF", type="primary", use_container_width=True)
     
+    if st.session_state.pop("generation_cancelled", False):
+        st.warning("Génération annulée : la requête en cours a été interrompue.")
+    
+    if not generate_button and st.query_params.get("job"):
+        show_job(job_queue, st.query_params["job"], show_raw_output, show_timings)
+    elif not generate_button and st.session_state.get("history_entry"):
+        show_history_entry(history, st.session_state["history_entry"], show_raw_output, show_timings)
+    elif not generate_button and st.session_state.get("last_result"):
+        # Relance du script (téléchargement, changement d'option) : le dernier DCF reste affiché
+        show_dcf_result(st.session_state["last_result"], show_raw_output=show_raw_output)
+    
     if generate_button:
         if not uploaded_file:
             st.markdown("""
@@ -498,12 +684,24 @@ def main():
             """, unsafe_allow_html=True)
             return
         
+        timer = StageTimer(
+            file_name=uploaded_file.name,
+            file_size=uploaded_file.size,
+            deployment=deployment,
+            prompt_version=PROMPT_VERSION
+        )
+        usage = TokenUsage()
+        # Issue de la génération, notée dans le journal des temps : une interruption
+        # du script (annulation, nouvelle action de l'utilisateur) n'en fixe pas d'autre
+        outcome = "cancelled"
+        
         try:
             with st.spinner("Lecture du fichier en cours..."):
-                cdc_text = read_file(uploaded_file)
-                time.sleep(1)
+                with timer.stage("extraction"):
+                    cdc_text, page_offsets = read_document(uploaded_file)
             
-            if not cdc_text.strip():
+            if not cdc_text or not cdc_text.strip():
+                outcome = "empty"
                 st.markdown("""
                 <div class="error-box">
                     <p style="margin: 0;">Le fichier semble vide ou n'a pas pu être lu correctement.</p>
@@ -511,27 +709,58 @@ def main():
                 """, unsafe_allow_html=True)
                 return
             
-            with st.spinner("Génération du prompt..."):
-                prompt = generate_prompt(cdc_text)
-                time.sleep(1)
-                if show_prompt:
-                    with st.expander(" Prompt envoyé à l'API"):
-                        st.code(prompt)
-            
-            progress_bar = st.progress(0)
-            status_text = st.empty()
+            budget, mode, cache_key, inventory = prepare_generation(
+                cdc_text, deployment, page_offsets, chunked_mode, incremental, retrieval, timer, structured,
+                pre_extract, memo=get_memo()
+            )
+            show_token_budget(budget, mode)
+            timer.metadata.update(streaming=streaming, cdc_pages=len(page_offsets) if page_offsets else None)
+            if inventory is not None:
+                stats = timer.metadata["inventory"]
+                st.caption(
+                    f"Pré-extraction : {stats['acronyms']} sigles, {stats['rules']} règles de gestion et "
+                    f"{stats['requirements']} exigences relevés en {stats['ms']:.0f} ms · "
+                    f"{_tokens(stats['removed_chars'])} caractères du CDC remplacés par l'inventaire"
+                )
+            if background:
+                # La file de travaux consulte elle-même le cache
+                job_id = job_queue.submit(
+                    uploaded_file.name, cdc_text, api_key, endpoint, deployment, page_offsets,
+                    chunked=chunked_mode, max_workers=max_workers, read_cache=not bypass_cache,
+                    incremental=incremental, routes=routes if router else None, hedge_after=hedge_after,
+                    retrieval=retrieval, structured=structured, pre_extract=pre_extract
+                )
+                st.query_params["job"] = job_id
+                outcome = "background"
+                timer.metadata["job_id"] = job_id
+                show_job(job_queue, job_id, show_raw_output, show_timings)
+                return
             
-            for percent in range(0, 101, 10):
-                status_text.text(f" Génération en cours... {percent}%")
-                progress_bar.progress(percent)
-                time.sleep(0.1)
+            if show_prompt and mode in ("direct", "structured"):
+                with st.expander(" Prompt envoyé à l'API"):
+                    st.code(budget.prompt)
             
             start_time = time.time()
-            dcf_result = call_gpt(prompt, api_key, endpoint, deployment)
+            result = call_gpt(
+                cdc_text, api_key, endpoint, deployment, (budget, mode, cache_key, inventory), page_offsets,
+                uploaded_file.name, max_workers, chunked=chunked_mode, incremental=incremental, retrieval=retrieval,
+                structured=structured, pre_extract=pre_extract, read_cache=not bypass_cache, streaming=streaming,
+                timer=timer, router=router, usage=usage
+            )
             elapsed_time = time.time() - start_time
             
-            progress_bar.empty()
-            status_text.empty()
+            if not result.ok:
+                outcome = "error"
+                timer.metadata["error_kind"] = result.error.kind
+                show_generation_error(result.error)
+                return
+            outcome = "cache" if result.from_cache else "ok"
+            dcf_result = result.dcf
+            
+            if result.from_cache:
+                st.info("Ce CDC a déjà été traité avec les mêmes paramètres : DCF servi depuis le cache.")
+            else:
+                show_generation_details(result, show_prompt, show_raw_output)
             
             st.markdown(f"""
             <div class="success-box">
@@ -540,47 +769,23 @@ def main():
             </div>
             """, unsafe_allow_html=True)
             
-            if show_raw_output:
-                with st.expander("Sortie brute de l'API"):
-                    st.code(dcf_result)
-            
-            # Affichage du résultat avec onglets
-            tab1, tab2 = st.tabs(["Aperçu du DCF", " Téléchargement"])
-            
-            with tab1:
-                st.subheader("Résultat - Dossier de Conception Fonctionnelle")
-                st.markdown(dcf_result)
-            
-            with tab2:
-                st.subheader("Options de téléchargement")
-                col1, col2 = st.columns(2)
-                with col1:
-                    word_buffer = save_dcf_to_word(dcf_result)
-                    st.download_button(
-                        label="Télécharger en Word",
-                        data=word_buffer,
-                        file_name="DCF_Généré.docx",
-                        mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                        use_container_width=True
-                    )
-                
-                with col2:
-                    txt_buffer = save_dcf_to_txt(dcf_result)
-                    st.download_button(
-                        label=" Télécharger en TXT",
-                        data=txt_buffer,
-                        file_name="DCF_Généré.txt",
-                        mime="text/plain",
-                        use_container_width=True
-                    )
+            st.session_state["last_result"] = dcf_result
+            st.session_state.pop("history_entry", None)
+            show_dcf_result(dcf_result, timer, show_raw_output, show_timings)
             
         except Exception as e:
+            outcome = "error"
+            timer.metadata["error_kind"] = type(e).__name__
             st.markdown(f"""
             <div class="error-box">
                 <h4 style="margin-top: 0;"> Une erreur est survenue</h4>
                 <p>{str(e)}</p>
             </div>
             """, unsafe_allow_html=True)
+        finally:
+            # Les générations en échec ou annulées sont justement celles qu'il faut pouvoir analyser
+            timer.metadata["outcome"] = outcome
+            timer.write_jsonl()
 
 if __name__ == "__main__":
     main()
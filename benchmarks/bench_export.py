@@ -0,0 +1,126 @@
+"""Mesure du temps d'export Word d'un DCF volumineux
+
+Exemple :
+    python benchmarks/bench_export.py --pages 100 --repeat 5
+
+Un DCF synthétique (titres, paragraphes avec gras, listes imbriquées et
+tableaux de règles de gestion) d'environ --pages pages est exporté plusieurs
+fois ; le script affiche la durée médiane et la plus longue, la taille du
+fichier produit et, avec --legacy, la comparaison avec l'ancien export ligne
+par ligne.
+"""
+
+import argparse
+import io
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from docx import Document  # noqa: E402
+
+from dcf.export import save_dcf_to_word  # noqa: E402
+
+# Nombre moyen de mots d'une page Word
+WORDS_PER_PAGE = 500
+
+
+def synthetic_dcf(pages):
+    """Construit un DCF markdown d'environ pages pages"""
+    lines = [
+        "### 1. CADRE GENERAL",
+        "1.1. Présentation générale du système",
+        "Le système vise à **dématérialiser** le traitement des demandes et à réduire les délais de *réponse*.",
+        "- Objectifs stratégiques",
+        "  - Réduction des délais",
+        "  - Traçabilité complète",
+        "",
+        "### 3. SPECIFICATIONS FONCTIONNELLES"
+    ]
+    rules = []
+    words = 0
+    module = 0
+    while words < pages * WORDS_PER_PAGE:
+        module += 1
+        start = len(lines)
+        lines += [
+            f"3.{module}. Module de gestion {module}",
+            "La fonction assure la **réception**, la **vérification** et l'**archivage** des pièces transmises "
+            "par l'usager, conformément aux règles de gestion décrites ci-dessous. " * 4,
+            "1. Entrées : formulaire de demande et pièces justificatives",
+            "2. Traitement : contrôle de complétude puis affectation à un agent",
+            "   - Contrôle de la signature",
+            "   - Vérification des montants",
+            "3. Sorties : accusé de réception et notification",
+            "",
+            "| Code | Règle | Exemple |",
+            "|------|-------|---------|"
+        ]
+        for rule in range(1, 6):
+            code = f"RG-{module:03d}-{rule}"
+            row = f"| {code} | Le montant saisi doit être **positif** et inférieur au plafond | 150 € |"
+            lines.append(row)
+            rules.append(row)
+        lines += ["", "Les cas d'erreur donnent lieu à un message explicite et à une trace d'audit. " * 6, ""]
+        # Chaque règle figure aussi dans le récapitulatif de la section 5
+        words += sum(len(line.split()) for line in lines[start:]) + 5 * len(rules[-1].split())
+    lines += [
+        "### 5. RECAPITULATIF DES REGLES DE GESTION",
+        "| Code | Règle | Exemple |",
+        "|------|-------|---------|",
+        *rules
+    ]
+    return "\n".join(lines)
+
+
+def legacy_save_dcf_to_word(text):
+    """Ancien export : une ligne = un titre de niveau 1 ou un paragraphe"""
+    doc = Document()
+    for line in text.split('\n'):
+        if line.strip() == "":
+            continue
+        if line.strip().startswith('#') or line.strip().startswith("1.") or line.strip().startswith("2.") or line.strip().startswith("3."):
+            doc.add_heading(line.strip(), level=1)
+        else:
+            doc.add_paragraph(line.strip())
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer
+
+
+def measure(export, text, repeat):
+    durations = []
+    size = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        size = len(export(text).getvalue())
+        durations.append(time.perf_counter() - start)
+    return durations, size
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=100, help="Taille approximative du DCF (défaut : 100)")
+    parser.add_argument("--repeat", type=int, default=5, help="Nombre d'exports mesurés (défaut : 5)")
+    parser.add_argument("--legacy", action="store_true", help="Mesure aussi l'ancien export ligne par ligne")
+    args = parser.parse_args(argv)
+
+    text = synthetic_dcf(args.pages)
+    words = len(text.split())
+    print(f"DCF synthétique : {len(text.splitlines())} lignes, {words} mots (~{words // WORDS_PER_PAGE} pages)")
+
+    exports = [("markdown", save_dcf_to_word)]
+    if args.legacy:
+        exports.append(("ligne par ligne", legacy_save_dcf_to_word))
+    for name, export in exports:
+        durations, size = measure(export, text, args.repeat)
+        print(
+            f"{name:>16} : médiane {statistics.median(durations) * 1000:.0f} ms, "
+            f"max {max(durations) * 1000:.0f} ms, {size / 1024:.0f} Ko"
+        )
+
+
+if __name__ == "__main__":
+    main()
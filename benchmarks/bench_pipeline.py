@@ -0,0 +1,240 @@
+"""Mesure hors ligne de la chaîne complète, face à un Azure OpenAI simulé
+
+Exemple :
+    python benchmarks/bench_pipeline.py --pages 10 100 1000 --sessions 1 4 16 --latency 0.5 \\
+        --tokens-per-second 80 --stream --error-rate 0.05 --json bench.json --baseline bench_avant.json
+
+Pour chaque CDC synthétique (voir corpus.py) et chaque nombre de sessions
+simultanées, N threads rejouent le parcours d'un utilisateur : lecture du
+fichier, construction du prompt, appel au modèle, export Word et texte.
+Les appels partent vers un serveur local (voir mock_azure.py) lancé dans un
+processus à part, avec le client et le limiteur de débit de dcf.llm.
+
+Chaque scénario s'exécute dans un processus neuf, pour que la mémoire
+maximale mesurée (RSS) lui soit propre. Le rapport donne, par étape, les
+percentiles 50/90/99 des durées, ainsi que la mémoire maximale, le débit
+en requêtes et en sessions par seconde. Avec --baseline, les médianes sont
+comparées à celles d'une mesure précédente enregistrée avec --json.
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus import DEFAULT_CORPUS_DIR, FORMATS, corpus_path  # noqa: E402
+from mock_azure import add_arguments, settings_from_args, start_mock_server  # noqa: E402
+
+from dcf.budget import fit_prompt  # noqa: E402
+from dcf.export import save_dcf_to_txt, save_dcf_to_word  # noqa: E402
+from dcf.extraction import extract_document, mime_type_for  # noqa: E402
+from dcf.llm import DEFAULT_DEPLOYMENT, TokenUsage, complete, stream_complete  # noqa: E402
+from dcf.pipeline import generate_dcf  # noqa: E402
+from dcf.timing import StageTimer  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+API_KEY = "mock"
+STAGES = ("read", "prompt", "ttft", "call", "export_docx", "export_txt", "session")
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(values, rank):
+    """Percentile par rang le plus proche"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(rank / 100 * len(ordered)) - 1)]
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss est en Ko sous Linux, en octets sous macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1024 / 1024
+
+
+def _serve(args, ready, stop):
+    """Processus du serveur simulé : publie son endpoint puis ses compteurs à l'arrêt"""
+    server = start_mock_server(settings_from_args(args))
+    ready.put(server.endpoint)
+    stop.wait()
+    server.shutdown()
+    ready.put((server.settings.requests, server.settings.rate_limited))
+
+
+def _session(path, endpoint, deployment, stream, mode):
+    """Parcours d'un utilisateur ; renvoie la durée de chaque étape en secondes et le nombre de requêtes"""
+    usage = TokenUsage()
+    durations = {}
+    started = time.perf_counter()
+
+    def lap(stage, start):
+        durations[stage] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with open(path, "rb") as f:
+        document = extract_document(f, mime_type_for(path), pdf_workers=1)
+    lap("read", start)
+
+    start = time.perf_counter()
+    if mode == "auto":
+        # Choix du mode et découpage éventuel en map-reduce, comme dans l'application
+        dcf, _ = generate_dcf(
+            document.text, API_KEY, endpoint, deployment, page_offsets=document.page_offsets,
+            timer=StageTimer(), usage=usage
+        )
+        lap("call", start)
+    else:
+        budget = fit_prompt(document.text, deployment, document.page_offsets)
+        lap("prompt", start)
+        start = time.perf_counter()
+        if stream:
+            parts = []
+            for delta in stream_complete(budget.prompt, API_KEY, endpoint, deployment):
+                if not parts:
+                    lap("ttft", start)
+                parts.append(delta)
+            dcf = "".join(parts)
+        else:
+            dcf = complete(budget.prompt, API_KEY, endpoint, deployment, usage=usage)
+        lap("call", start)
+
+    start = time.perf_counter()
+    save_dcf_to_word(dcf)
+    lap("export_docx", start)
+    start = time.perf_counter()
+    save_dcf_to_txt(dcf)
+    lap("export_txt", start)
+    lap("session", started)
+    # Le flux ne renvoie pas l'usage : une requête par génération
+    return durations, usage.requests if not stream or mode == "auto" else 1
+
+
+def run_scenario(path, endpoint, deployment, sessions, iterations, stream, mode):
+    """Exécute un scénario (dans un processus dédié) et renvoie ses mesures"""
+    samples = defaultdict(list)
+    requests = 0
+    errors = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as executor:
+        futures = [
+            executor.submit(_session, path, endpoint, deployment, stream, mode)
+            for _ in range(sessions * iterations)
+        ]
+        for future in futures:
+            try:
+                durations, count = future.result()
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+                continue
+            requests += count
+            for stage, seconds in durations.items():
+                samples[stage].append(seconds)
+    elapsed = time.perf_counter() - start
+    return {
+        "stages": {
+            stage: {f"p{rank}": percentile(values, rank) for rank in PERCENTILES}
+            for stage, values in samples.items()
+        },
+        "elapsed": elapsed,
+        "requests": requests,
+        "requests_per_second": requests / elapsed,
+        "sessions_per_second": len(samples["session"]) / elapsed,
+        "peak_rss_mb": peak_rss_mb(),
+        "errors": errors
+    }
+
+
+def print_report(name, result, baseline=None):
+    rss = result["peak_rss_mb"]
+    print(
+        f"\n{name} : {result['requests_per_second']:.2f} requêtes/s, "
+        f"{result['sessions_per_second']:.2f} sessions/s, "
+        f"RSS max {f'{rss:.0f} Mo' if rss is not None else 'n/d'}"
+        + (f", {len(result['errors'])} échecs" if result["errors"] else "")
+    )
+    for stage in STAGES:
+        values = result["stages"].get(stage)
+        if not values:
+            continue
+        line = f"  {stage:>12} : " + "  ".join(
+            f"p{rank} {values[f'p{rank}'] * 1000:8.1f} ms" for rank in PERCENTILES
+        )
+        previous = (baseline or {}).get("stages", {}).get(stage)
+        if previous and previous["p50"]:
+            line += f"  ({(values['p50'] / previous['p50'] - 1) * 100:+.0f} % sur p50)"
+        print(line)
+    for error in sorted(set(result["errors"]))[:3]:
+        print(f"  ! {error}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100], help="Tailles des CDC (défaut : 10 100)")
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=list(FORMATS))
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 4], help="Sessions simultanées (défaut : 1 4)")
+    parser.add_argument("--iterations", type=int, default=3, help="Parcours rejoués par session (défaut : 3)")
+    parser.add_argument("--stream", action="store_true", help="Génération en streaming (mesure le premier token)")
+    parser.add_argument(
+        "--mode", choices=("direct", "auto"), default="direct",
+        help="direct : une requête par CDC ; auto : mode choisi par dcf.pipeline (map-reduce au-delà du budget)"
+    )
+    parser.add_argument("--deployment", default=DEFAULT_DEPLOYMENT)
+    parser.add_argument("--corpus-dir", default=DEFAULT_CORPUS_DIR)
+    parser.add_argument("--json", help="Enregistre les mesures dans ce fichier")
+    parser.add_argument("--baseline", help="Compare aux mesures d'un fichier produit avec --json")
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["scenarios"]
+
+    paths = {
+        (pages, file_format): corpus_path(pages, file_format, args.corpus_dir)
+        for pages in args.pages for file_format in args.formats
+    }
+
+    context = multiprocessing.get_context("spawn")
+    ready, stop = context.Queue(), context.Event()
+    server = context.Process(target=_serve, args=(args, ready, stop), daemon=True)
+    server.start()
+    endpoint = ready.get(timeout=30)
+
+    scenarios = {}
+    try:
+        for (pages, file_format), path in paths.items():
+            for sessions in args.sessions:
+                name = f"{file_format}/{pages}p/{sessions}s"
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    result = executor.submit(
+                        run_scenario, path, endpoint, args.deployment, sessions, args.iterations,
+                        args.stream, args.mode
+                    ).result()
+                scenarios[name] = result
+                print_report(name, result, baseline.get(name))
+    finally:
+        stop.set()
+        requests, rate_limited = ready.get(timeout=30)
+        server.join(timeout=5)
+    print(f"\nServeur simulé : {requests} requêtes reçues, dont {rate_limited} rejetées (429)")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"settings": {k: v for k, v in vars(args).items() if k not in ("json", "baseline")},
+                       "scenarios": scenarios}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
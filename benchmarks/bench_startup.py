@@ -0,0 +1,162 @@
+"""Mesure du démarrage à froid et des réexécutions de app.py
+
+Exemple :
+    python benchmarks/bench_startup.py --repeat 5 --reruns 20 --json startup.json --baseline startup_avant.json
+
+Chaque mesure s'exécute dans un interpréteur neuf (démarrage d'un pod) :
+  - import : durée d'import de streamlit, puis des modules dcf utilisés par
+    app.py, et liste des dépendances lourdes (openai, PyMuPDF, python-docx,
+    tiktoken, lxml) déjà chargées à ce stade ;
+  - first_run : première exécution du script (AppTest), page vide, imports
+    compris ;
+  - rerun : réexécutions suivantes du script, comme à chaque interaction.
+
+Le rapport donne la médiane et le maximum de chaque mesure. Avec --baseline,
+les médianes sont comparées à celles d'une mesure enregistrée avec --json, et
+le script se termine en erreur si l'une d'elles dépasse --tolerance.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT, "app.py")
+
+# Modules dcf importés par app.py
+APP_MODULES = (
+    "dcf.aio", "dcf.budget", "dcf.chunking", "dcf.cache", "dcf.export", "dcf.extraction", "dcf.history",
+    "dcf.inventory", "dcf.llm", "dcf.jobs", "dcf.memo", "dcf.mapreduce", "dcf.pipeline", "dcf.sections",
+    "dcf.structured", "dcf.prompts", "dcf.retrieval", "dcf.router", "dcf.timing"
+)
+# Dépendances lourdes, qui ne doivent être chargées que par le chemin de code qui en a besoin
+HEAVY_MODULES = ("openai", "fitz", "pymupdf", "docx", "tiktoken", "lxml")
+METRICS = ("import_streamlit", "import_dcf", "first_run", "rerun")
+
+
+def _loaded_heavy_modules():
+    return [name for name in HEAVY_MODULES if name in sys.modules]
+
+
+def measure_imports():
+    """Durées d'import (dans un processus neuf), en secondes"""
+    import importlib
+
+    sys.path.insert(0, ROOT)
+    start = time.perf_counter()
+    importlib.import_module("streamlit")
+    streamlit_done = time.perf_counter()
+    for name in APP_MODULES:
+        importlib.import_module(name)
+    return {
+        "import_streamlit": streamlit_done - start,
+        "import_dcf": time.perf_counter() - streamlit_done,
+        "heavy": _loaded_heavy_modules()
+    }
+
+
+def measure_runs(reruns):
+    """Première exécution du script puis réexécutions (dans un processus neuf), en secondes"""
+    from streamlit.testing.v1 import AppTest
+
+    start = time.perf_counter()
+    app = AppTest.from_file(APP_PATH, default_timeout=120).run()
+    first_run = time.perf_counter() - start
+    if app.exception:
+        raise RuntimeError(app.exception[0].value)
+    heavy = _loaded_heavy_modules()
+    durations = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        app.run()
+        durations.append(time.perf_counter() - start)
+    return {"first_run": first_run, "rerun": durations, "heavy": heavy}
+
+
+def _in_fresh_process(function, *args):
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(function, *args).result()
+
+
+def summarize(values):
+    return {"p50": statistics.median(values), "max": max(values)}
+
+
+def print_report(result, baseline=None, tolerance=None):
+    """Affiche les mesures ; renvoie les métriques dont la médiane a régressé au-delà de tolerance"""
+    regressions = []
+    for metric in METRICS:
+        values = result["metrics"][metric]
+        line = f"  {metric:>16} : p50 {values['p50'] * 1000:8.1f} ms  max {values['max'] * 1000:8.1f} ms"
+        previous = (baseline or {}).get(metric)
+        if previous and previous["p50"]:
+            change = values["p50"] / previous["p50"] - 1
+            line += f"  ({change * 100:+.0f} % sur p50)"
+            if tolerance is not None and change > tolerance:
+                regressions.append(metric)
+                line += "  ← régression"
+        print(line)
+    print(f"  Dépendances lourdes chargées à l'import : {', '.join(result['heavy_on_import']) or 'aucune'}")
+    print(f"  Dépendances lourdes chargées après la première page : {', '.join(result['heavy_on_first_run']) or 'aucune'}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="Démarrages à froid mesurés (défaut : 5)")
+    parser.add_argument("--reruns", type=int, default=20, help="Réexécutions mesurées par démarrage (défaut : 20)")
+    parser.add_argument("--json", help="Enregistre les mesures dans ce fichier")
+    parser.add_argument("--baseline", help="Compare aux mesures d'un fichier produit avec --json")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Hausse relative de la médiane tolérée avec --baseline (défaut : 0.2, soit 20 %%)")
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["metrics"]
+
+    # Caches, historique et file de travaux de l'application dans un dossier jetable
+    workdir = tempfile.mkdtemp(prefix="dcf-bench-startup-")
+    os.environ.setdefault("DCF_CACHE_DIR", workdir)
+    os.environ.setdefault("DCF_HISTORY_DB", os.path.join(workdir, "history.sqlite3"))
+    os.environ.setdefault("DCF_JOBS_DB", os.path.join(workdir, "jobs.sqlite3"))
+    os.environ.setdefault("DCF_TIMINGS_LOG", os.path.join(workdir, "timings.jsonl"))
+
+    samples = {metric: [] for metric in METRICS}
+    heavy_on_import = heavy_on_first_run = []
+    for _ in range(args.repeat):
+        imports = _in_fresh_process(measure_imports)
+        runs = _in_fresh_process(measure_runs, args.reruns)
+        samples["import_streamlit"].append(imports["import_streamlit"])
+        samples["import_dcf"].append(imports["import_dcf"])
+        samples["first_run"].append(runs["first_run"])
+        samples["rerun"].extend(runs["rerun"])
+        heavy_on_import, heavy_on_first_run = imports["heavy"], runs["heavy"]
+
+    result = {
+        "metrics": {metric: summarize(values) for metric, values in samples.items() if values},
+        "heavy_on_import": heavy_on_import,
+        "heavy_on_first_run": heavy_on_first_run
+    }
+    print(f"\nDémarrage de app.py ({args.repeat} démarrages à froid, {args.reruns} réexécutions chacun)")
+    regressions = print_report(result, baseline, args.tolerance if args.baseline else None)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"settings": {"repeat": args.repeat, "reruns": args.reruns}, **result}, f, indent=2)
+    if regressions:
+        print(f"\nRégression au-delà de {args.tolerance:.0%} : {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""Corpus synthétiques de CDC (PDF, DOCX et TXT) pour les mesures de performance
+
+Exemple :
+    python benchmarks/corpus.py --pages 10 100 1000 --output-dir /tmp/dcf_bench_corpus
+
+Chaque CDC reprend la structure d'un cahier des charges réel : contexte,
+acronymes, exigences numérotées, règles de gestion en tableaux et en-têtes
+répétés. Les fichiers générés sont réutilisés tant qu'ils existent.
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz  # noqa: E402  PyMuPDF
+
+from dcf.export import save_dcf_to_word  # noqa: E402
+
+DEFAULT_CORPUS_DIR = os.path.join(tempfile.gettempdir(), "dcf_bench_corpus")
+FORMATS = ("pdf", "docx", "txt")
+# Nombre moyen de mots et de lignes d'une page de CDC
+WORDS_PER_PAGE = 450
+LINES_PER_PAGE = 40
+
+_ACRONYMS = [
+    ("SI", "Système d'Information"), ("GED", "Gestion Électronique des Documents"),
+    ("SSO", "Authentification unique"), ("RGPD", "Règlement Général sur la Protection des Données"),
+    ("MOA", "Maîtrise d'Ouvrage"), ("API", "Interface de programmation")
+]
+_SENTENCES = [
+    "Le titulaire devra garantir la disponibilité du service pendant les heures ouvrées.",
+    "Les pièces justificatives transmises par l'usager sont archivées dans la GED.",
+    "Chaque action d'un agent est tracée et consultable par les administrateurs du SI.",
+    "Les délais de traitement sont suivis au moyen d'indicateurs mis à jour quotidiennement.",
+    "L'accès à l'application se fait par SSO à partir du poste de travail de l'agent.",
+    "Les données personnelles sont traitées conformément au RGPD et conservées cinq ans.",
+    "La MOA valide les évolutions fonctionnelles avant leur mise en production.",
+    "Les échanges avec les partenaires s'appuient sur une API documentée et versionnée."
+]
+
+
+def synthetic_cdc(pages, seed=0):
+    """Construit le texte markdown d'un CDC d'environ pages pages"""
+    rng = random.Random(seed)
+    lines = [
+        "# CAHIER DES CHARGES",
+        "## 1. Contexte et objectifs",
+        " ".join(rng.choice(_SENTENCES) for _ in range(6)),
+        "## 2. Glossaire",
+        "| Acronyme | Définition |",
+        "|----------|------------|",
+        *(f"| {acronym} | {definition} |" for acronym, definition in _ACRONYMS)
+    ]
+    words = sum(len(line.split()) for line in lines)
+    module = 0
+    while words < pages * WORDS_PER_PAGE:
+        module += 1
+        block = [
+            f"## 3.{module}. Module fonctionnel {module}",
+            " ".join(rng.choice(_SENTENCES) for _ in range(8)),
+            f"- EX-{module:03d}-1 : le système doit permettre la saisie d'une demande en moins de 5 minutes.",
+            f"- EX-{module:03d}-2 : le système doit notifier l'usager à chaque changement de statut.",
+            "",
+            "| Code | Règle de gestion | Priorité |",
+            "|------|------------------|----------|",
+            *(
+                f"| RG-{module:03d}-{rule} | Le montant saisi doit être positif et inférieur au plafond | "
+                f"{rng.choice(('Haute', 'Moyenne', 'Basse'))} |"
+                for rule in range(1, 5)
+            ),
+            "",
+            " ".join(rng.choice(_SENTENCES) for _ in range(10))
+        ]
+        lines += block
+        words += sum(len(line.split()) for line in block)
+    return "\n".join(lines) + "\n"
+
+
+def _write_pdf(text, path):
+    # Pagination fixe avec en-tête et pied de page répétés, comme dans un CDC exporté en PDF
+    doc = fitz.open()
+    lines = [wrapped for line in text.splitlines() for wrapped in _wrap(line, 95)]
+    for number, start in enumerate(range(0, len(lines), LINES_PER_PAGE), 1):
+        page = doc.new_page()
+        body = "\n".join(["Cahier des charges - Confidentiel", ""] + lines[start:start + LINES_PER_PAGE])
+        page.insert_textbox(fitz.Rect(50, 40, 560, 800), body, fontsize=9)
+        page.insert_text((280, 820), f"Page {number}", fontsize=8)
+    doc.save(path)
+    doc.close()
+
+
+def _wrap(line, width):
+    if len(line) <= width:
+        return [line]
+    wrapped, current = [], ""
+    for word in line.split():
+        if current and len(current) + len(word) + 1 > width:
+            wrapped.append(current)
+            current = word
+        else:
+            current = f"{current} {word}" if current else word
+    return wrapped + [current]
+
+
+def corpus_path(pages, file_format, output_dir=DEFAULT_CORPUS_DIR):
+    """Renvoie le chemin du CDC synthétique demandé, en le générant au besoin"""
+    if file_format not in FORMATS:
+        raise ValueError(f"Format inconnu : {file_format}")
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, f"cdc_{pages}p.{file_format}")
+    if os.path.exists(path):
+        return path
+    text = synthetic_cdc(pages)
+    partial = path + ".part"
+    if file_format == "txt":
+        with open(partial, "w", encoding="utf-8") as f:
+            f.write(text)
+    elif file_format == "docx":
+        with open(partial, "wb") as f:
+            f.write(save_dcf_to_word(text).getvalue())
+    else:
+        _write_pdf(text, partial)
+    os.replace(partial, path)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 1000], help="Tailles en pages")
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=list(FORMATS))
+    parser.add_argument("--output-dir", default=DEFAULT_CORPUS_DIR)
+    args = parser.parse_args(argv)
+
+    for pages in args.pages:
+        for file_format in args.formats:
+            path = corpus_path(pages, file_format, args.output_dir)
+            print(f"{path} : {os.path.getsize(path) / 1024:.0f} Ko")
+
+
+if __name__ == "__main__":
+    main()
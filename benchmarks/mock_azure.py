@@ -0,0 +1,229 @@
+"""Serveur HTTP local qui imite l'endpoint chat-completions d'Azure OpenAI
+
+Exemple :
+    python benchmarks/mock_azure.py --port 8765 --latency 0.5 --tokens-per-second 80 --error-rate 0.05
+
+Le client du projet (dcf.llm) s'y connecte comme à Azure, avec
+l'endpoint http://127.0.0.1:<port>/ et n'importe quelle clé API. Chaque
+requête attend --latency secondes avant le premier token, puis produit la
+réponse au débit --tokens-per-second, en une fois ou en flux SSE
+(stream=True). Une part --error-rate des requêtes reçoit une erreur 429
+avec un en-tête Retry-After, comme lors d'un dépassement de quota.
+"""
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_COMPLETION_TOKENS = 800
+DEFAULT_RETRY_AFTER_MS = 200
+
+_ANSWER_LINES = [
+    "### 1. CADRE GENERAL",
+    "1.1. Présentation générale du système",
+    "Le système vise à **dématérialiser** le traitement des demandes et à réduire les délais de réponse.",
+    "- Objectifs stratégiques : réduction des délais, traçabilité complète",
+    "### 3. SPECIFICATIONS FONCTIONNELLES",
+    "3.1. Module de gestion des demandes",
+    "La fonction assure la **réception**, la **vérification** et l'**archivage** des pièces transmises.",
+    "| Code | Règle | Exemple |",
+    "|------|-------|---------|",
+    "| RG-001 | Le montant saisi doit être **positif** | 150 € |"
+]
+
+
+def synthetic_answer(tokens):
+    """Texte de réponse d'environ tokens tokens (un mot = un token)"""
+    words = []
+    while len(words) < tokens:
+        for line in _ANSWER_LINES:
+            words.extend(line.split(" "))
+            words[-1] += "\n"
+    return " ".join(words[:tokens]).replace("\n ", "\n")
+
+
+class MockSettings:
+    """Comportement du serveur, modifiable pendant qu'il tourne"""
+
+    def __init__(self, latency=0.0, tokens_per_second=0.0, completion_tokens=DEFAULT_COMPLETION_TOKENS,
+                 error_rate=0.0, retry_after_ms=DEFAULT_RETRY_AFTER_MS, seed=None):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.retry_after_ms = retry_after_ms
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.rate_limited = 0
+        self._lock = threading.Lock()
+
+    def admit(self):
+        """Compte la requête et indique si elle doit recevoir une erreur 429"""
+        with self._lock:
+            self.requests += 1
+            limited = self.random.random() < self.error_rate
+            if limited:
+                self.rate_limited += 1
+            return not limited
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_event(self, payload):
+        data = b"data: " + (payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")) + b"\n\n"
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def do_POST(self):
+        settings = self.server.settings
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.split("?")[0].endswith("/chat/completions"):
+            self._send_json(404, {"error": {"code": "404", "message": "Resource not found"}})
+            return
+        if not settings.admit():
+            self._send_json(
+                429,
+                {"error": {"code": "429", "message": "Requests to the deployment have exceeded the rate limit."}},
+                {"retry-after-ms": str(settings.retry_after_ms), "retry-after": str(settings.retry_after_ms / 1000)}
+            )
+            return
+
+        prompt_tokens = sum(len(str(message.get("content", ""))) for message in body.get("messages", [])) // 4
+        tokens = settings.completion_tokens
+        answer = synthetic_answer(tokens)
+        delay = 1 / settings.tokens_per_second if settings.tokens_per_second else 0.0
+        model = body.get("model", "gpt-4o")
+        base = {"id": "chatcmpl-mock", "created": int(time.time()), "model": model}
+        time.sleep(settings.latency)
+
+        if not body.get("stream"):
+            time.sleep(delay * tokens)
+            self._send_json(200, {
+                **base,
+                "object": "chat.completion",
+                "choices": [{
+                    "index": 0, "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": answer}
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens, "completion_tokens": tokens,
+                    "total_tokens": prompt_tokens + tokens
+                }
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for word in answer.split(" "):
+                self._send_event({
+                    **base,
+                    "object": "chat.completion.chunk",
+                    "choices": [{"index": 0, "finish_reason": None, "delta": {"content": word + " "}}]
+                })
+                if delay:
+                    time.sleep(delay)
+            self._send_event({
+                **base,
+                "object": "chat.completion.chunk",
+                "choices": [{"index": 0, "finish_reason": "stop", "delta": {}}]
+            })
+            self._send_event(b"[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # Le client a fermé le flux (génération annulée)
+            self.close_connection = True
+
+
+class MockAzureServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, settings):
+        super().__init__(address, _Handler)
+        self.settings = settings
+
+    def handle_error(self, request, client_address):
+        # Connexions keep-alive coupées par un client qui s'arrête : rien à signaler
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    @property
+    def endpoint(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/"
+
+
+def start_mock_server(settings=None, host="127.0.0.1", port=0):
+    """Démarre le serveur dans un thread et le renvoie ; port=0 choisit un port libre"""
+    server = MockAzureServer((host, port), settings or MockSettings())
+    threading.Thread(target=server.serve_forever, name="mock-azure", daemon=True).start()
+    return server
+
+
+def add_arguments(parser):
+    """Options du serveur, partagées avec les scripts de mesure"""
+    parser.add_argument("--latency", type=float, default=0.2, help="Délai avant le premier token, en s (défaut : 0.2)")
+    parser.add_argument(
+        "--tokens-per-second", type=float, default=0.0, help="Débit de génération (défaut : 0, instantané)"
+    )
+    parser.add_argument(
+        "--completion-tokens", type=int, default=DEFAULT_COMPLETION_TOKENS,
+        help=f"Longueur de chaque réponse (défaut : {DEFAULT_COMPLETION_TOKENS})"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="Part des requêtes rejetées avec une erreur 429 (défaut : 0)"
+    )
+    parser.add_argument(
+        "--retry-after-ms", type=int, default=DEFAULT_RETRY_AFTER_MS,
+        help=f"Retry-After des erreurs 429, en ms (défaut : {DEFAULT_RETRY_AFTER_MS})"
+    )
+    parser.add_argument("--seed", type=int, default=None, help="Graine du tirage des erreurs 429")
+
+
+def settings_from_args(args):
+    return MockSettings(
+        latency=args.latency, tokens_per_second=args.tokens_per_second, completion_tokens=args.completion_tokens,
+        error_rate=args.error_rate, retry_after_ms=args.retry_after_ms, seed=args.seed
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765, help="Port d'écoute (défaut : 8765)")
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    server = MockAzureServer((args.host, args.port), settings_from_args(args))
+    print(f"Endpoint Azure simulé : {server.endpoint}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        settings = server.settings
+        print(f"{settings.requests} requêtes reçues, dont {settings.rate_limited} rejetées (429)")
+
+
+if __name__ == "__main__":
+    main()
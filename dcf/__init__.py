@@ -0,0 +1 @@
+"""Cœur du générateur de DCF, indépendant de l'interface Streamlit"""
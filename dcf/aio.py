@@ -0,0 +1,588 @@
+"""Cœur asynchrone de la génération, indépendant de l'interface
+
+Les appels au modèle passent par le client AsyncAzureOpenAI : une requête
+en attente ne mobilise aucun thread, et un même processus peut mener de
+front des dizaines de générations sur une seule boucle d'événements.
+L'extraction des fichiers, coûteuse en calcul, est confiée à un exécuteur
+(pool de threads ou de processus).
+
+agenerate_dcf ne lève pas d'exception pour les erreurs attendues (API,
+quota, délai dépassé, fichier illisible) : elle renvoie un GenerationResult
+dont error (GenerationError) décrit le problème, à présenter par l'appelant.
+L'annulation de la tâche (Task.cancel) ou le dépassement de timeout
+interrompt les requêtes en cours.
+
+Le mode "map-reduce" mène ses requêtes parallèles sur la boucle elle-même
+(asyncio.gather, borné par un sémaphore). Les modes "sections", "retrieval"
+et "structured" reprennent l'orchestration synchrone de dcf.sections et
+dcf.structured dans un thread ; leurs requêtes sont envoyées sur la boucle
+d'événements. Un code synchrone (Streamlit) utilise ce module par
+l'intermédiaire d'EventLoopThread.
+"""
+
+import asyncio
+import functools
+import hashlib
+import logging
+import threading
+import time
+import weakref
+from contextlib import closing, nullcontext
+from dataclasses import dataclass
+
+from .chunking import DEFAULT_SEGMENT_TOKENS, estimate_tokens
+from .export import word_document
+from .extraction import UnsupportedFormatError, extract_document, extract_path
+from .llm import (
+    API_VERSION, DEFAULT_TEMPERATURE, MAX_RETRIES, STRUCTURED_OUTPUTS_API_VERSION, _backoff,
+    StreamStats, _estimate_request_tokens, _messages, _retry_after, get_rate_limiter, retryable_errors
+)
+from .mapreduce import DEFAULT_MAX_WORKERS, map_reduce_steps
+from .memo import content_hash
+from .pipeline import prepare_generation, run_generation_details
+from .prompts import PROMPT_VERSION
+from .timing import StageTimer
+
+# Catégories d'erreurs (GenerationError.kind)
+RATE_LIMITED = "rate_limited"
+TIMEOUT = "timeout"
+CONNECTION = "connection"
+AUTHENTICATION = "authentication"
+NOT_FOUND = "not_found"
+INVALID_REQUEST = "invalid_request"
+SERVER = "server"
+UNSUPPORTED_FORMAT = "unsupported_format"
+EMPTY_DOCUMENT = "empty_document"
+INTERNAL = "internal"
+
+ERROR_MESSAGES = {
+    RATE_LIMITED: "Le quota du déploiement Azure OpenAI est dépassé, même après plusieurs tentatives.",
+    TIMEOUT: "La génération n'a pas abouti dans le délai imparti.",
+    CONNECTION: "Le service Azure OpenAI est injoignable.",
+    AUTHENTICATION: "La clé API est refusée par Azure OpenAI.",
+    NOT_FOUND: "Le déploiement ou l'endpoint Azure OpenAI est introuvable.",
+    INVALID_REQUEST: "La requête a été refusée par Azure OpenAI (prompt trop long ou contenu filtré).",
+    SERVER: "Azure OpenAI a renvoyé une erreur interne, même après plusieurs tentatives.",
+    UNSUPPORTED_FORMAT: "Format de fichier non supporté.",
+    EMPTY_DOCUMENT: "Le fichier semble vide ou n'a pas pu être lu correctement.",
+    INTERNAL: "Erreur inattendue pendant la génération."
+}
+RETRYABLE_KINDS = frozenset((RATE_LIMITED, TIMEOUT, CONNECTION, SERVER))
+
+logger = logging.getLogger(__name__)
+
+_clients = weakref.WeakKeyDictionary()
+_clients_lock = threading.Lock()
+
+
+@dataclass
+class GenerationError:
+    """Erreur d'une génération, présentable telle quelle à l'utilisateur"""
+    kind: str
+    message: str
+    retryable: bool = False
+    status_code: int = None
+    detail: str = None
+
+    def __str__(self):
+        return f"{self.message} ({self.detail})" if self.detail else self.message
+
+
+@dataclass
+class GenerationResult:
+    """Issue d'une génération : le DCF, ou l'erreur qui l'a empêchée"""
+    dcf: str = None
+    from_cache: bool = False
+    mode: str = None
+    error: GenerationError = None
+    # Résultat propre au mode (MapReduceResult, SectionedResult, StructuredResult), None en mode direct ou depuis le cache
+    details: object = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def describe_error(error):
+    """Traduit une exception de l'API, de l'extraction ou d'un délai dépassé en GenerationError"""
+    from openai import (
+        APIConnectionError, APITimeoutError, AuthenticationError, BadRequestError, InternalServerError,
+        NotFoundError, PermissionDeniedError, RateLimitError, UnprocessableEntityError
+    )
+
+    # APITimeoutError hérite d'APIConnectionError : l'ordre des tests compte
+    if isinstance(error, RateLimitError):
+        kind = RATE_LIMITED
+    elif isinstance(error, (APITimeoutError, TimeoutError)):
+        kind = TIMEOUT
+    elif isinstance(error, APIConnectionError):
+        kind = CONNECTION
+    elif isinstance(error, (AuthenticationError, PermissionDeniedError)):
+        kind = AUTHENTICATION
+    elif isinstance(error, NotFoundError):
+        kind = NOT_FOUND
+    elif isinstance(error, (BadRequestError, UnprocessableEntityError)):
+        kind = INVALID_REQUEST
+    elif isinstance(error, InternalServerError):
+        kind = SERVER
+    elif isinstance(error, UnsupportedFormatError):
+        kind = UNSUPPORTED_FORMAT
+    else:
+        kind = INTERNAL
+    return GenerationError(
+        kind=kind,
+        message=ERROR_MESSAGES[kind],
+        retryable=kind in RETRYABLE_KINDS,
+        status_code=getattr(error, "status_code", None),
+        detail=str(error) or None
+    )
+
+
+def get_async_client(api_key, endpoint, api_version=API_VERSION):
+    """Client AsyncAzureOpenAI partagé par les tâches de la boucle d'événements courante
+
+    Un client asynchrone est lié à la boucle sur laquelle ses connexions ont
+    été ouvertes : chaque boucle a les siens, libérés avec elle.
+    """
+    loop = asyncio.get_running_loop()
+    key = (endpoint, api_version, hashlib.sha256(api_key.encode("utf-8")).hexdigest())
+    with _clients_lock:
+        clients = _clients.setdefault(loop, {})
+        client = clients.get(key)
+        if client is None:
+            from openai import AsyncAzureOpenAI
+            client = clients[key] = AsyncAzureOpenAI(
+                api_key=api_key,
+                api_version=api_version,
+                azure_endpoint=endpoint,
+                max_retries=0
+            )
+        return client
+
+
+async def _acquire(limiter, tokens):
+    while True:
+        wait = limiter.try_acquire(tokens)
+        if wait <= 0:
+            return
+        await asyncio.sleep(wait)
+
+
+async def acall_with_retries(send, endpoint, deployment, estimated_tokens, max_retries=MAX_RETRIES):
+    """Équivalent asynchrone de dcf.llm.call_with_retries ; send est une fonction coroutine
+
+    Le quota est partagé avec les appels synchrones du même déploiement.
+    """
+    from openai import RateLimitError
+
+    limiter = get_rate_limiter(endpoint, deployment)
+    for attempt in range(max_retries + 1):
+        await _acquire(limiter, estimated_tokens)
+        try:
+            return await send()
+        except retryable_errors() as e:
+            if attempt == max_retries:
+                raise
+            delay = _retry_after(e)
+            if isinstance(e, RateLimitError):
+                limiter.pause(delay if delay is not None else _backoff(attempt))
+            else:
+                await asyncio.sleep(delay if delay is not None else _backoff(attempt))
+
+
+async def acomplete(prompt, api_key, endpoint, deployment, temperature=DEFAULT_TEMPERATURE, usage=None,
+                    response_format=None):
+    """Équivalent asynchrone de dcf.llm.complete ; les erreurs de l'API sont propagées"""
+    if response_format is None:
+        client = get_async_client(api_key, endpoint)
+    else:
+        client = get_async_client(api_key, endpoint, STRUCTURED_OUTPUTS_API_VERSION)
+    estimated = _estimate_request_tokens(prompt)
+    options = {"response_format": response_format} if response_format is not None else {}
+    response = await acall_with_retries(
+        lambda: client.chat.completions.create(
+            model=deployment,
+            messages=_messages(prompt),
+            temperature=temperature,
+            **options
+        ),
+        endpoint, deployment, estimated
+    )
+    if response.usage is not None:
+        get_rate_limiter(endpoint, deployment).settle(estimated, response.usage.total_tokens)
+    if usage is not None:
+        usage.add(response.usage)
+    return response.choices[0].message.content
+
+
+async def astream_complete(prompt, api_key, endpoint, deployment, temperature=DEFAULT_TEMPERATURE):
+    """Équivalent asynchrone de dcf.llm.stream_complete
+
+    Fermer le générateur (aclose) ou annuler la tâche qui le parcourt ferme
+    la connexion HTTP et interrompt la génération côté Azure.
+    """
+    client = get_async_client(api_key, endpoint)
+    stream = await acall_with_retries(
+        lambda: client.chat.completions.create(
+            model=deployment,
+            messages=_messages(prompt),
+            temperature=temperature,
+            stream=True
+        ),
+        endpoint, deployment, _estimate_request_tokens(prompt)
+    )
+    try:
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+    finally:
+        await stream.close()
+
+
+async def aextract(data, file_type, executor=None, pdf_workers=None):
+    """Extrait le texte d'un document dans executor (par défaut, le pool de threads de la boucle)
+
+    Avec un ProcessPoolExecutor, data doit être un chemin ou des bytes.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(extract_document, data, file_type, pdf_workers))
+
+
+async def aextract_path(path, executor=None, pdf_workers=None):
+    """Extrait le texte d'un fichier du disque dans executor (voir aextract)"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(extract_path, path, pdf_workers))
+
+
+class _LoopCaller:
+    """Fonction prompt -> texte appelée depuis un thread, dont les requêtes s'exécutent sur la boucle
+
+    Les arguments supplémentaires (response_format) sont transmis à send.
+    """
+
+    def __init__(self, loop, send):
+        self.loop = loop
+        self.send = send
+        self.cancelled = False
+        self._futures = set()
+        self._lock = threading.Lock()
+
+    def __call__(self, prompt, *args):
+        with self._lock:
+            if self.cancelled:
+                raise asyncio.CancelledError()
+            future = asyncio.run_coroutine_threadsafe(self.send(prompt, *args), self.loop)
+            self._futures.add(future)
+        try:
+            return future.result()
+        finally:
+            with self._lock:
+                self._futures.discard(future)
+
+    def cancel(self):
+        """Annule les requêtes en cours ; les suivantes échouent aussitôt"""
+        with self._lock:
+            self.cancelled = True
+            futures = list(self._futures)
+        for future in futures:
+            future.cancel()
+
+
+async def arun_parallel(prompts, send, max_workers=DEFAULT_MAX_WORKERS, on_done=None, timer=None):
+    """Équivalent de dcf.mapreduce.run_parallel sur la boucle d'événements
+
+    send est une fonction prompt -> coroutine renvoyant le texte. Au plus
+    max_workers requêtes sont en cours à la fois ; à la première erreur, les
+    autres sont annulées et l'exception est propagée.
+    """
+    semaphore = asyncio.Semaphore(max(1, max_workers))
+
+    async def run(prompt, submitted_at):
+        async with semaphore:
+            if timer:
+                timer.record("queue", time.perf_counter() - submitted_at)
+            result = await send(prompt)
+        if on_done:
+            on_done()
+        return result
+
+    submitted_at = time.perf_counter()
+    tasks = [asyncio.ensure_future(run(prompt, submitted_at)) for prompt in prompts]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+async def agenerate_dcf_map_reduce(cdc_text, send, max_workers=DEFAULT_MAX_WORKERS,
+                                   segment_tokens=DEFAULT_SEGMENT_TOKENS, on_progress=None, reduce_send=None,
+                                   timer=None, page_offsets=None):
+    """Équivalent asynchrone de dcf.mapreduce.generate_dcf_map_reduce
+
+    send (et reduce_send pour l'appel final) est une fonction prompt ->
+    coroutine. on_progress est appelé depuis la boucle d'événements.
+    """
+    def progress(phase, done, total):
+        if on_progress:
+            on_progress(phase, done, total)
+
+    def measure(phase):
+        return timer.stage(phase) if timer else nullcontext()
+
+    async def run_phase(phase, prompts):
+        if phase == "reduce":
+            progress(phase, 0, 1)
+            with measure(phase):
+                answers = [await (reduce_send or send)(prompts[0])]
+            progress(phase, 1, 1)
+            return answers
+
+        done = 0
+        progress(phase, done, len(prompts))
+
+        def on_done():
+            nonlocal done
+            done += 1
+            progress(phase, done, len(prompts))
+
+        with measure(phase):
+            return await arun_parallel(prompts, send, max_workers, on_done, timer)
+
+    steps = map_reduce_steps(cdc_text, segment_tokens, page_offsets)
+    answers = None
+    while True:
+        try:
+            phase, prompts = steps.send(answers)
+        except StopIteration as done:
+            return done.value
+        answers = await run_phase(phase, prompts)
+
+
+def _sender(api_key, endpoint, deployment, router, usage):
+    """Fonction prompt -> coroutine : appel direct, ou réparti par le routeur (synchrone, dans un thread)"""
+    if router is not None:
+        return lambda prompt: asyncio.to_thread(router.complete, prompt, usage=usage)
+    return lambda prompt: acomplete(prompt, api_key, endpoint, deployment, usage=usage)
+
+
+async def _astream(prompt, api_key, endpoint, deployment, router, usage, timer, on_delta):
+    """Rédige en streaming : on_delta reçoit chaque fragment, usage une estimation des tokens"""
+    stats = StreamStats()
+    parts = []
+
+    def record(delta):
+        stats.record(delta)
+        parts.append(delta)
+        on_delta(delta)
+
+    if router is not None:
+        # Le flux du routeur est synchrone : il est parcouru dans un thread,
+        # qui le ferme au fragment suivant si la tâche est annulée
+        stop = threading.Event()
+
+        def drain():
+            with closing(router.stream(prompt)) as stream:
+                for delta in stream:
+                    if stop.is_set():
+                        break
+                    record(delta)
+
+        try:
+            await asyncio.to_thread(drain)
+        except asyncio.CancelledError:
+            stop.set()
+            raise
+    else:
+        stream = astream_complete(prompt, api_key, endpoint, deployment)
+        try:
+            async for delta in stream:
+                record(delta)
+        finally:
+            await stream.aclose()
+
+    if usage is not None:
+        usage.record(estimate_tokens(prompt), stats.tokens)
+    if timer and stats.first_token_at is not None:
+        timer.record("ttft", stats.time_to_first_token)
+    return "".join(parts)
+
+
+def _record_history(history, file_name, cdc_text, deployment, dcf, mode, timer, usage, memo):
+    """Enregistre le DCF dans l'historique ; un échec est journalisé sans faire échouer la génération"""
+    docx = None
+    try:
+        docx = word_document(dcf, memo)
+    except Exception:
+        logger.exception("Export Word du DCF impossible : la génération est enregistrée sans document Word")
+    try:
+        history.add(
+            file_name, content_hash(cdc_text), deployment, PROMPT_VERSION, dcf, mode=mode, stages=timer.as_dict(),
+            tokens=usage.as_dict() if usage is not None else None, cdc_chars=len(cdc_text), docx=docx,
+            build_docx=False
+        )
+    except Exception:
+        # L'historique est accessoire : le DCF est tout de même renvoyé
+        logger.exception("Génération non enregistrée dans l'historique")
+
+
+async def _generate(cdc_text, api_key, endpoint, deployment, page_offsets, chunked, max_workers, cache,
+                    read_cache, timer, usage, on_progress, incremental, lineage, router, retrieval, structured,
+                    pre_extract, prepared, on_delta, history, memo):
+    if prepared is None:
+        prepared = await asyncio.to_thread(
+            prepare_generation, cdc_text, deployment, page_offsets, chunked, incremental, retrieval, timer,
+            structured, pre_extract, memo
+        )
+    budget, mode, cache_key, inventory = prepared
+    if cache is not None and read_cache:
+        with timer.stage("cache"):
+            dcf = await asyncio.to_thread(cache.get, cache_key)
+        timer.metadata["cache_hit"] = dcf is not None
+        if dcf is not None:
+            return GenerationResult(dcf=dcf, from_cache=True, mode=mode)
+
+    send = _sender(api_key, endpoint, deployment, router, usage)
+    stream = (
+        functools.partial(
+            _astream, api_key=api_key, endpoint=endpoint, deployment=deployment, router=router, usage=usage,
+            timer=timer, on_delta=on_delta
+        )
+        if on_delta is not None
+        else None
+    )
+    details = None
+    if mode == "direct":
+        with timer.stage("generation"):
+            dcf = await (stream or send)(budget.prompt)
+        if inventory is not None:
+            dcf = inventory.complete_dcf(dcf)
+    elif mode == "map-reduce":
+        details = await agenerate_dcf_map_reduce(
+            cdc_text, send, max_workers=max_workers, on_progress=on_progress, reduce_send=stream, timer=timer,
+            page_offsets=page_offsets
+        )
+        dcf = details.dcf
+    else:
+        # Le routeur ne transmet pas de format de réponse : la génération structurée s'en passe
+        if router is not None and mode != "structured":
+            call = functools.partial(router.complete, usage=usage)
+        else:
+            call = _LoopCaller(
+                asyncio.get_running_loop(),
+                lambda prompt, response_format=None: acomplete(
+                    prompt, api_key, endpoint, deployment, usage=usage, response_format=response_format
+                )
+            )
+        try:
+            dcf, details = await asyncio.to_thread(
+                run_generation_details, cdc_text, mode, budget, call, deployment, page_offsets=page_offsets,
+                max_workers=max_workers, cache=cache, read_cache=read_cache, timer=timer,
+                on_progress=on_progress, lineage=lineage
+            )
+        except asyncio.CancelledError:
+            # Le thread d'orchestration ne peut pas être interrompu : ses requêtes le sont
+            if isinstance(call, _LoopCaller):
+                call.cancel()
+            raise
+
+    if cache is not None:
+        await asyncio.to_thread(cache.put, cache_key, dcf)
+    if history is not None:
+        await asyncio.to_thread(_record_history, history, lineage, cdc_text, deployment, dcf, mode, timer, usage, memo)
+    return GenerationResult(dcf=dcf, mode=mode, details=details)
+
+
+async def agenerate_dcf(cdc_text, api_key, endpoint, deployment, page_offsets=None, chunked=True,
+                        max_workers=DEFAULT_MAX_WORKERS, cache=None, read_cache=True, timer=None, usage=None,
+                        on_progress=None, incremental=False, lineage=None, router=None, retrieval=False,
+                        structured=False, pre_extract=False, timeout=None, prepared=None, on_delta=None,
+                        history=None, memo=None):
+    """Équivalent asynchrone de dcf.pipeline.generate_dcf, qui renvoie un GenerationResult
+
+    timeout (en secondes) borne la durée de toute la génération. on_progress
+    est appelé depuis la boucle d'événements en mode "map-reduce", depuis le
+    thread d'orchestration dans les modes "sections", "retrieval" et
+    "structured". prepared est le résultat de prepare_generation déjà calculé
+    par l'appelant avec les mêmes paramètres. Avec on_delta, la rédaction du
+    DCF (mode direct, ou appel final du map-reduce) est reçue en streaming et
+    on_delta(fragment) est appelé depuis la boucle. Avec history
+    (dcf.history.HistoryStore), un DCF nouvellement généré y est enregistré
+    sous le nom lineage ; memo (dcf.memo.MemoCache) conserve l'inventaire, le
+    prompt et le document Word pour les appels suivants. L'annulation de la
+    tâche est propagée (asyncio.CancelledError) après interruption des
+    requêtes en cours.
+    """
+    timer = timer or StageTimer()
+    if not cdc_text or not cdc_text.strip():
+        return GenerationResult(error=GenerationError(EMPTY_DOCUMENT, ERROR_MESSAGES[EMPTY_DOCUMENT]))
+    try:
+        async with asyncio.timeout(timeout):
+            return await _generate(
+                cdc_text, api_key, endpoint, deployment, page_offsets, chunked, max_workers, cache, read_cache,
+                timer, usage, on_progress, incremental, lineage, router, retrieval, structured, pre_extract,
+                prepared, on_delta, history, memo
+            )
+    except Exception as e:
+        return GenerationResult(mode=timer.metadata.get("mode"), error=describe_error(e))
+
+
+async def arun_prompt(prompt, api_key, endpoint, deployment, router=None, usage=None, timeout=None):
+    """Envoie un prompt déjà construit et renvoie un GenerationResult (mode direct, sans cache)"""
+    try:
+        async with asyncio.timeout(timeout):
+            if router is not None:
+                dcf = await asyncio.to_thread(router.complete, prompt, usage=usage)
+            else:
+                dcf = await acomplete(prompt, api_key, endpoint, deployment, usage=usage)
+    except Exception as e:
+        return GenerationResult(mode="direct", error=describe_error(e))
+    return GenerationResult(dcf=dcf, mode="direct")
+
+
+class EventLoopThread:
+    """Boucle d'événements dans un thread dédié, pour utiliser ce module depuis du code synchrone
+
+    Toutes les générations soumises partagent la boucle, ses clients et leurs
+    connexions ; l'appelant ne fait qu'attendre le résultat.
+    """
+
+    def __init__(self, name="dcf-aio"):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, coroutine):
+        """Planifie la coroutine et renvoie son concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def run(self, coroutine, timeout=None):
+        """Exécute la coroutine et attend son résultat
+
+        Si l'attente est interrompue (arrêt du script Streamlit, KeyboardInterrupt),
+        la coroutine est annulée.
+        """
+        future = self.submit(coroutine)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+
+_loop_thread = None
+_loop_thread_lock = threading.Lock()
+
+
+def get_event_loop_thread():
+    """Boucle d'événements partagée du processus, démarrée au premier appel"""
+    global _loop_thread
+    with _loop_thread_lock:
+        if _loop_thread is None:
+            _loop_thread = EventLoopThread()
+        return _loop_thread
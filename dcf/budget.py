@@ -0,0 +1,226 @@
+"""Budget de tokens des prompts envoyés en une seule requête
+
+Le nombre de tokens est compté localement avec le tokenizer BPE du modèle
+(tiktoken) ; à défaut, il est estimé à partir du nombre de caractères, avec
+une marge de sécurité, et un avertissement est journalisé. Le CDC
+est intégré en entier tant que le prompt tient dans la fenêtre de contexte du
+déploiement, une fois réservée la place de la réponse. Au-delà, le texte est
+d'abord compacté (espaces superflus, en-têtes et pieds de page répétés sur
+chaque page) ; il n'est tronqué qu'en dernier recours.
+"""
+
+import logging
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+
+from .chunking import estimate_tokens
+from .llm import DEFAULT_DEPLOYMENT, SYSTEM_PROMPT
+from .prompts import generate_prompt
+
+# Fenêtre de contexte et nombre maximal de tokens générés, par famille de
+# modèles. Les déploiements Azure portent un nom libre : il est rapproché du
+# modèle le plus spécifique dont il contient le nom.
+MODEL_LIMITS = {
+    "gpt-4.1": (1047576, 32768),
+    "gpt-4o-mini": (128000, 16384),
+    "gpt-4o": (128000, 16384),
+    "gpt-4-turbo": (128000, 4096),
+    "gpt-4-32k": (32768, 4096),
+    "gpt-4": (8192, 4096),
+    "gpt-35-turbo-16k": (16384, 4096),
+    "gpt-35-turbo": (16385, 4096)
+}
+DEFAULT_LIMITS = MODEL_LIMITS["gpt-4o"]
+
+# Encodage BPE de chaque famille (les modèles non listés utilisent cl100k_base)
+MODEL_ENCODINGS = {
+    "gpt-4.1": "o200k_base",
+    "gpt-4o": "o200k_base"
+}
+DEFAULT_ENCODING = "cl100k_base"
+
+# Tokens consommés par l'enveloppe des messages (rôles, séparateurs)
+MESSAGE_OVERHEAD_TOKENS = 12
+# Sans tokenizer, l'estimation à CHARS_PER_TOKEN caractères par token sous-compte
+# le français accentué : elle est majorée pour que le prompt tienne dans la fenêtre
+FALLBACK_SAFETY_FACTOR = 1.35
+
+# Une ligne d'en-tête ou de pied de page est courte et figure sur au moins la
+# moitié des pages (et au moins 3) ; seules les premières et dernières lignes
+# de chaque page sont examinées
+MAX_BOILERPLATE_CHARS = 120
+BOILERPLATE_EDGE_LINES = 3
+MIN_BOILERPLATE_PAGES = 3
+
+logger = logging.getLogger(__name__)
+
+_DIGITS_RE = re.compile(r"\d+")
+_SPACES_RE = re.compile(r"[ \t\u00a0]+")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+
+def _model_family(deployment, table):
+    name = (deployment or "").lower()
+    matches = [model for model in table if model in name]
+    return max(matches, key=len) if matches else None
+
+
+def model_limits(deployment):
+    """Renvoie (fenêtre de contexte, tokens générés au maximum) pour un déploiement"""
+    family = _model_family(deployment, MODEL_LIMITS)
+    return MODEL_LIMITS[family] if family else DEFAULT_LIMITS
+
+
+@lru_cache(maxsize=None)
+def _encoding(name):
+    # tiktoken n'est importé qu'au premier comptage
+    try:
+        import tiktoken
+    except ImportError:
+        logger.warning("tiktoken n'est pas installé : les tokens sont estimés, avec une marge de sécurité")
+        return None
+    try:
+        return tiktoken.get_encoding(name)
+    except Exception:
+        # Fichier d'encodage absent du cache local et non téléchargeable
+        logger.warning("Encodage %s indisponible : les tokens sont estimés, avec une marge de sécurité", name)
+        return None
+
+
+def get_encoding(deployment):
+    """Renvoie l'encodage tiktoken du déploiement, ou None s'il est indisponible"""
+    family = _model_family(deployment, MODEL_ENCODINGS)
+    return _encoding(MODEL_ENCODINGS[family] if family else DEFAULT_ENCODING)
+
+
+def count_tokens(text, deployment=DEFAULT_DEPLOYMENT):
+    """Compte les tokens d'un texte avec le tokenizer du déploiement (ou les estime, par excès)"""
+    encoding = get_encoding(deployment)
+    if encoding is None:
+        return math.ceil(estimate_tokens(text) * FALLBACK_SAFETY_FACTOR)
+    return len(encoding.encode_ordinary(text))
+
+
+def truncate_to_tokens(text, max_tokens, deployment=DEFAULT_DEPLOYMENT):
+    """Coupe un texte après max_tokens tokens"""
+    if max_tokens <= 0:
+        return ""
+    encoding = get_encoding(deployment)
+    if encoding is None:
+        return text[:max_tokens * len(text) // max(1, count_tokens(text, deployment))]
+    tokens = encoding.encode_ordinary(text)
+    return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+
+
+def normalize_whitespace(text):
+    """Supprime les espaces superflus et les suites de lignes vides"""
+    lines = (_SPACES_RE.sub(" ", line).strip() for line in text.splitlines())
+    return _BLANK_LINES_RE.sub("\n\n", "\n".join(lines)).strip()
+
+
+def _pages(text, page_offsets):
+    bounds = list(page_offsets) + [len(text)]
+    return [text[bounds[i]:bounds[i + 1]] for i in range(len(page_offsets))]
+
+
+def _line_signature(line):
+    # Les numéros de page varient d'une page à l'autre : on les neutralise
+    return _DIGITS_RE.sub("#", _SPACES_RE.sub(" ", line).strip().lower())
+
+
+def remove_repeated_headers(text, page_offsets):
+    """Retire les en-têtes et pieds de page répétés d'une page à l'autre
+
+    La première occurrence de chaque ligne répétée est conservée.
+    """
+    if not page_offsets or len(page_offsets) < MIN_BOILERPLATE_PAGES:
+        return text
+    pages = [page.splitlines() for page in _pages(text, page_offsets)]
+
+    def edges(lines):
+        filled = [i for i, line in enumerate(lines) if line.strip()]
+        return filled[:BOILERPLATE_EDGE_LINES] + filled[-BOILERPLATE_EDGE_LINES:]
+
+    seen_on = Counter()
+    for lines in pages:
+        seen_on.update({
+            _line_signature(lines[i]) for i in edges(lines) if len(lines[i].strip()) <= MAX_BOILERPLATE_CHARS
+        })
+    threshold = max(MIN_BOILERPLATE_PAGES, len(pages) // 2)
+    repeated = {signature for signature, count in seen_on.items() if count >= threshold}
+    if not repeated:
+        return text
+
+    kept_once = set()
+    output = []
+    for lines in pages:
+        dropped = set()
+        for i in edges(lines):
+            signature = _line_signature(lines[i])
+            if signature in repeated:
+                if signature in kept_once:
+                    dropped.add(i)
+                kept_once.add(signature)
+        output.append("\n".join(line for i, line in enumerate(lines) if i not in dropped))
+    return "\n".join(output)
+
+
+@dataclass
+class PromptBudget:
+    """Prompt prêt à l'envoi et décompte de ses tokens"""
+    deployment: str
+    prompt: str
+    context_tokens: int
+    output_tokens: int
+    prompt_tokens: int
+    cdc_tokens: int
+    sent_cdc_tokens: int
+    compressed: bool = False
+    truncated: bool = False
+    exact: bool = True
+
+    @property
+    def input_budget(self):
+        """Tokens disponibles pour le prompt, une fois la réponse réservée"""
+        return self.context_tokens - self.output_tokens
+
+    @property
+    def fits(self):
+        """Indique si le CDC complet (éventuellement compacté) tient dans le prompt"""
+        return not self.truncated
+
+
+def fit_prompt(cdc_text, deployment=DEFAULT_DEPLOYMENT, page_offsets=None, build=generate_prompt):
+    """Construit le prompt le plus complet possible dans la fenêtre du déploiement"""
+    context_tokens, output_tokens = model_limits(deployment)
+    overhead = count_tokens(SYSTEM_PROMPT, deployment) + MESSAGE_OVERHEAD_TOKENS
+    template_tokens = count_tokens(build(""), deployment)
+    available = context_tokens - output_tokens - overhead - template_tokens
+
+    cdc_tokens = count_tokens(cdc_text, deployment)
+    text, sent_tokens = cdc_text, cdc_tokens
+    compressed = truncated = False
+    if sent_tokens > available:
+        text = normalize_whitespace(remove_repeated_headers(cdc_text, page_offsets))
+        sent_tokens = count_tokens(text, deployment)
+        compressed = True
+    if sent_tokens > available:
+        text = truncate_to_tokens(text, available, deployment)
+        sent_tokens = count_tokens(text, deployment)
+        truncated = True
+
+    return PromptBudget(
+        deployment=deployment,
+        prompt=build(text),
+        context_tokens=context_tokens,
+        output_tokens=output_tokens,
+        prompt_tokens=overhead + template_tokens + sent_tokens,
+        cdc_tokens=cdc_tokens,
+        sent_cdc_tokens=sent_tokens,
+        compressed=compressed,
+        truncated=truncated,
+        exact=get_encoding(deployment) is not None
+    )
@@ -0,0 +1,168 @@
+"""Cache disque des DCF générés, adressé par le contenu du CDC
+
+Une entrée est identifiée par l'empreinte du texte normalisé du CDC, de la
+version des prompts, du déploiement, de la température et du mode de
+génération : régénérer un CDC déjà traité ne coûte alors ni temps ni tokens.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+import unicodedata
+import zlib
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "DCF_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "dcf-generate")
+)
+DEFAULT_MAX_BYTES = int(os.environ.get("DCF_CACHE_MAX_MB", "512")) * 1024 * 1024
+DEFAULT_MAX_ENTRIES = 10000
+
+_ENTRY_SUFFIX = ".dcf.z"
+
+
+def normalize_text(text):
+    """Normalise le texte extrait pour que des différences d'espacement ne changent pas la clé"""
+    text = unicodedata.normalize("NFC", text)
+    return " ".join(text.split())
+
+
+def make_cache_key(cdc_text, prompt_version, deployment, temperature, mode="direct"):
+    """Construit la clé de cache d'une génération"""
+    digest = hashlib.sha256()
+    for part in (prompt_version, deployment, repr(float(temperature)), mode):
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    digest.update(normalize_text(cdc_text).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Cache persistant clé -> texte avec éviction LRU bornée en taille et en nombre
+
+    L'index (taille et date du dernier accès de chaque entrée) est tenu en
+    mémoire et reconstruit depuis le disque à l'ouverture ; la date de
+    modification des fichiers sert de date de dernier accès entre deux
+    redémarrages. Les écritures sont atomiques (fichier temporaire + rename),
+    ce qui permet à plusieurs processus de partager le même répertoire.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES,
+                 max_entries=DEFAULT_MAX_ENTRIES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._index = {}
+        self._total_bytes = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + _ENTRY_SUFFIX)
+
+    def _load_index(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(_ENTRY_SUFFIX):
+                    continue
+                try:
+                    info = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                key = name[:-len(_ENTRY_SUFFIX)]
+                self._index[key] = (info.st_size, info.st_mtime)
+                self._total_bytes += info.st_size
+
+    def get(self, key):
+        """Renvoie le texte associé à la clé, ou None s'il n'est pas en cache"""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = zlib.decompress(f.read()).decode("utf-8")
+        except (OSError, zlib.error, UnicodeDecodeError):
+            with self._lock:
+                self.misses += 1
+                self._forget(key)
+            return None
+
+        now = time.time()
+        try:
+            os.utime(path, (now, now))
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+            if key in self._index:
+                self._index[key] = (self._index[key][0], now)
+        return value
+
+    def put(self, key, value):
+        """Enregistre le texte sous la clé, puis évince les entrées les moins récentes si besoin"""
+        data = zlib.compress(value.encode("utf-8"))
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        with self._lock:
+            self._forget(key)
+            self._index[key] = (len(data), time.time())
+            self._total_bytes += len(data)
+            self._evict()
+
+    def _forget(self, key):
+        entry = self._index.pop(key, None)
+        if entry:
+            self._total_bytes -= entry[0]
+
+    def _evict(self):
+        if self._total_bytes <= self.max_bytes and len(self._index) <= self.max_entries:
+            return
+        for key, _ in sorted(self._index.items(), key=lambda item: item[1][1]):
+            if self._total_bytes <= self.max_bytes and len(self._index) <= self.max_entries:
+                break
+            self._forget(key)
+            self.evictions += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def clear(self):
+        """Supprime toutes les entrées du cache"""
+        with self._lock:
+            for key in list(self._index):
+                self._forget(key)
+                try:
+                    os.remove(self._path(key))
+                except OSError:
+                    pass
+
+    @property
+    def size_bytes(self):
+        return self._total_bytes
+
+    def __len__(self):
+        return len(self._index)
+
+    def stats(self):
+        """Renvoie les compteurs du cache"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._index),
+            "size_bytes": self._total_bytes
+        }
@@ -0,0 +1,145 @@
+"""Découpage du texte d'un CDC en segments de taille maîtrisée"""
+
+import bisect
+import re
+from dataclasses import dataclass
+
+# Approximation courante pour du texte français : ~4 caractères par token
+CHARS_PER_TOKEN = 4
+DEFAULT_SEGMENT_TOKENS = 6000
+# Taille des unités de suivi des modifications (voir split_into_chunks)
+CHUNK_MIN_TOKENS = 300
+CHUNK_MAX_TOKENS = 1500
+
+MAX_HEADING_CHARS = 120
+
+# Lignes considérées comme des débuts de section : titres markdown,
+# numérotations (1., 2.3, IV.), mots-clés de plan ou lignes en majuscules
+_NUMBERED_HEADING_RE = re.compile(
+    r"^(?:#{1,6}\s+\S|(?:\d+(?:\.\d+)*\.?|[IVXLC]+\.)\s+\S"
+    r"|(?:chapitre|article|section|annexe|partie|titre)\b)",
+    re.IGNORECASE
+)
+_UPPERCASE_HEADING_RE = re.compile(r"^[A-ZÀ-Ý0-9][A-ZÀ-Ý0-9 '’\-–:/&]{3,}$")
+
+
+@dataclass
+class Segment:
+    """Portion contiguë du CDC, délimitée par ses positions dans le texte source"""
+    index: int
+    start: int
+    end: int
+    text: str
+
+    @property
+    def tokens(self):
+        return estimate_tokens(self.text)
+
+
+def estimate_tokens(text):
+    """Estime le nombre de tokens d'un texte"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def page_at(page_offsets, offset):
+    """Renvoie le numéro (à partir de 1) de la page contenant la position donnée"""
+    return max(1, bisect.bisect_right(page_offsets, offset))
+
+
+def is_heading(line):
+    """Indique si une ligne ressemble à un titre de section"""
+    line = line.strip()
+    if not line or len(line) > MAX_HEADING_CHARS:
+        return False
+    return bool(_NUMBERED_HEADING_RE.match(line) or _UPPERCASE_HEADING_RE.match(line))
+
+
+def find_section_starts(text):
+    """Renvoie les positions des lignes qui ressemblent à des titres de section"""
+    starts = [0]
+    position = 0
+    for line in text.splitlines(keepends=True):
+        if position and is_heading(line):
+            starts.append(position)
+        position += len(line)
+    return starts
+
+
+def _split_oversized(text, start, end, max_chars):
+    """Coupe une section trop longue aux paragraphes, à défaut aux lignes, sinon en dur"""
+    pieces = []
+    cursor = start
+    while end - cursor > max_chars:
+        limit = cursor + max_chars
+        cut = text.rfind("\n\n", cursor + 1, limit)
+        if cut == -1:
+            cut = text.rfind("\n", cursor + 1, limit)
+        cut = limit if cut == -1 else cut + 1
+        pieces.append((cursor, cut))
+        cursor = cut
+    pieces.append((cursor, end))
+    return pieces
+
+
+def split_into_segments(text, max_tokens=DEFAULT_SEGMENT_TOKENS):
+    """Découpe le texte en segments d'au plus max_tokens, en suivant les sections
+
+    Les sections consécutives sont regroupées tant que le budget le permet ;
+    une section qui dépasse à elle seule le budget est recoupée aux paragraphes.
+    """
+    if not text:
+        return []
+    max_chars = max_tokens * CHARS_PER_TOKEN
+
+    starts = find_section_starts(text)
+    bounds = list(zip(starts, starts[1:] + [len(text)]))
+
+    pieces = []
+    for start, end in bounds:
+        if end - start <= max_chars:
+            pieces.append((start, end))
+        else:
+            pieces.extend(_split_oversized(text, start, end, max_chars))
+
+    segments = []
+    current_start, current_end = pieces[0]
+    for start, end in pieces[1:]:
+        if end - current_start <= max_chars:
+            current_end = end
+            continue
+        segments.append(Segment(len(segments), current_start, current_end, text[current_start:current_end]))
+        current_start, current_end = start, end
+    segments.append(Segment(len(segments), current_start, current_end, text[current_start:current_end]))
+    return segments
+
+
+def split_into_chunks(text, min_tokens=CHUNK_MIN_TOKENS, max_tokens=CHUNK_MAX_TOKENS):
+    """Découpe le texte en unités stables d'une version du CDC à l'autre
+
+    Chaque unité commence à un titre de section ; les sections trop courtes
+    sont rattachées aux suivantes jusqu'à min_tokens et les sections trop
+    longues sont recoupées aux paragraphes. Les frontières ne dépendent que du
+    voisinage immédiat : modifier un chapitre ne déplace pas celles du reste
+    du document.
+    """
+    if not text:
+        return []
+    min_chars = min_tokens * CHARS_PER_TOKEN
+    max_chars = max_tokens * CHARS_PER_TOKEN
+
+    starts = find_section_starts(text)
+    pieces = []
+    for start, end in zip(starts, starts[1:] + [len(text)]):
+        pieces.extend(_split_oversized(text, start, end, max_chars))
+
+    chunks = []
+    current_start = None
+    for start, end in pieces:
+        if current_start is None:
+            current_start = start
+        if end - current_start >= min_chars:
+            chunks.append(Segment(len(chunks), current_start, end, text[current_start:end]))
+            current_start = None
+    if current_start is not None:
+        chunks.append(Segment(len(chunks), current_start, len(text), text[current_start:]))
+    return chunks
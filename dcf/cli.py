@@ -0,0 +1,282 @@
+"""Mode batch sans interface : génère les DCF d'un ensemble de CDC
+
+Exemple :
+    python -m dcf cdc/ "archives/**/*.pdf" --output-dir dcf_out --concurrency 8
+
+L'extraction des fichiers est répartie sur un pool de processus ; les appels
+à Azure OpenAI sont asynchrones (voir dcf.aio), au plus --concurrency CDC
+étant générés simultanément. Chaque CDC produit un .docx et/ou un .txt, rangés
+sous le dossier de sortie selon l'arborescence des entrées, et un manifeste
+JSON récapitule les temps par étape et les tokens consommés.
+"""
+
+import argparse
+import asyncio
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from .aio import agenerate_dcf
+from .cache import DEFAULT_CACHE_DIR, ResultCache
+from .export import save_dcf_to_txt, save_dcf_to_word
+from .extraction import SUPPORTED_EXTENSIONS, extract_path
+from .llm import DEFAULT_DEPLOYMENT, DEFAULT_ENDPOINT, TokenUsage, configure_rate_limit
+from .mapreduce import DEFAULT_MAX_WORKERS
+from .prompts import PROMPT_VERSION
+from .router import Route, Router, parse_routes
+from .timing import DEFAULT_LOG_PATH, StageTimer
+
+DEFAULT_CONCURRENCY = 4
+MANIFEST_NAME = "manifest.json"
+
+
+def collect_inputs(patterns):
+    """Résout les dossiers, motifs glob et fichiers donnés en une liste triée de CDC"""
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, _, files in os.walk(pattern):
+                paths.update(
+                    os.path.join(root, name) for name in files
+                    if name.lower().endswith(SUPPORTED_EXTENSIONS)
+                )
+        elif glob.has_magic(pattern):
+            paths.update(
+                path for path in glob.glob(pattern, recursive=True)
+                if os.path.isfile(path) and path.lower().endswith(SUPPORTED_EXTENSIONS)
+            )
+        else:
+            paths.add(pattern)
+    return sorted(paths)
+
+
+def relative_inputs(paths):
+    """Chemin de chaque CDC relativement au dossier commun à toutes les entrées"""
+    absolute = {path: os.path.abspath(path) for path in paths}
+    base = os.path.commonpath([os.path.dirname(value) for value in absolute.values()])
+    return {path: os.path.relpath(value, base).replace(os.sep, "/") for path, value in absolute.items()}
+
+
+def output_names(relative):
+    """Nom des sorties de chaque CDC (sans suffixe ni extension), relativement au dossier de sortie
+
+    L'arborescence des entrées est reproduite sous le dossier de sortie ; deux
+    CDC de même nom dans un même dossier (x.pdf et x.docx) se distinguent par
+    leur extension. Lève ValueError si deux sorties coïncident encore.
+    """
+    stems = {path: os.path.splitext(name)[0] for path, name in relative.items()}
+    counts = Counter(stems.values())
+    names = {
+        path: f"{stem}_{os.path.splitext(path)[1].lstrip('.').lower()}" if counts[stem] > 1 else stem
+        for path, stem in stems.items()
+    }
+    conflicts = [name for name, count in Counter(names.values()).items() if count > 1]
+    if conflicts:
+        raise ValueError(f"plusieurs CDC produiraient les mêmes sorties : {', '.join(sorted(conflicts))}")
+    return names
+
+
+def _extract(path):
+    """Extraction d'un fichier, exécutée dans un processus du pool"""
+    start = time.perf_counter()
+    # Les fichiers sont déjà répartis sur les processus : pas de pool imbriqué
+    document = extract_path(path, pdf_workers=1)
+    return document.text, document.page_offsets, time.perf_counter() - start
+
+
+def _write_outputs(dcf, name, args, timer):
+    stem = os.path.join(args.output_dir, *name.split("/"))
+    os.makedirs(os.path.dirname(stem), exist_ok=True)
+    outputs = []
+    if "docx" in args.formats:
+        with timer.stage("export_docx"):
+            data = save_dcf_to_word(dcf).getvalue()
+        outputs.append(f"{stem}_DCF.docx")
+        with open(outputs[-1], "wb") as f:
+            f.write(data)
+    if "txt" in args.formats:
+        with timer.stage("export_txt"):
+            data = save_dcf_to_txt(dcf).getvalue()
+        outputs.append(f"{stem}_DCF.txt")
+        with open(outputs[-1], "wb") as f:
+            f.write(data)
+    return outputs
+
+
+async def _process_file(path, relative, name, args, extract_pool, semaphore, cache):
+    loop = asyncio.get_running_loop()
+    timer = StageTimer(file_name=relative, deployment=args.deployment, prompt_version=PROMPT_VERSION)
+    usage = TokenUsage()
+    entry = {"file": path, "status": "ok", "outputs": []}
+    try:
+        text, page_offsets, seconds = await loop.run_in_executor(extract_pool, _extract, path)
+        timer.record("extraction", seconds)
+        if not text.strip():
+            raise ValueError("Le fichier semble vide ou n'a pas pu être lu correctement.")
+
+        queued_at = time.perf_counter()
+        async with semaphore:
+            timer.record("queue", time.perf_counter() - queued_at)
+            result = await agenerate_dcf(
+                text, args.api_key, args.endpoint, args.deployment,
+                page_offsets=page_offsets, chunked=not args.no_chunking, max_workers=args.map_workers,
+                cache=cache, timer=timer, usage=usage, incremental=args.incremental,
+                lineage=relative, router=args.router, retrieval=args.retrieval,
+                structured=args.structured, pre_extract=args.pre_extract, timeout=args.timeout
+            )
+        if result.ok:
+            entry["outputs"] = await asyncio.to_thread(_write_outputs, result.dcf, name, args, timer)
+        else:
+            entry.update(status="error", error=str(result.error), error_kind=result.error.kind)
+    except Exception as e:
+        entry["status"] = "error"
+        entry["error"] = f"{type(e).__name__}: {e}"
+
+    timer.metadata["outcome"] = entry["status"]
+    entry.update(
+        mode=timer.metadata.get("mode"),
+        cache_hit=timer.metadata.get("cache_hit", False),
+        stages=timer.as_dict(),
+        tokens=usage.as_dict()
+    )
+    status = "OK " if entry["status"] == "ok" else "ERR"
+    print(f"[{status}] {path}" + (f" : {entry['error']}" if entry["status"] == "error" else ""), file=sys.stderr)
+    timer.write_jsonl(args.timings_log)
+    return entry
+
+
+async def run_batch(paths, args):
+    """Traite tous les fichiers et renvoie le manifeste"""
+    loop = asyncio.get_running_loop()
+    # Les requêtes n'occupent pas de thread, map-reduce compris : chaque CDC
+    # en cours n'en réserve qu'un (orchestration des modes par sections et
+    # structuré, cache, écriture), plus un par requête si le routeur, qui
+    # reste synchrone, est utilisé
+    threads_per_file = 1 + (args.map_workers if args.router is not None else 0)
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=args.concurrency * threads_per_file))
+    semaphore = asyncio.Semaphore(args.concurrency)
+    cache = None if args.no_cache else ResultCache(args.cache_dir)
+
+    relative = relative_inputs(paths)
+    names = output_names(relative)
+    started_at = time.time()
+    with ProcessPoolExecutor(
+        max_workers=args.extract_workers, mp_context=multiprocessing.get_context("spawn")
+    ) as extract_pool:
+        entries = await asyncio.gather(*(
+            _process_file(path, relative[path], names[path], args, extract_pool, semaphore, cache)
+            for path in paths
+        ))
+
+    totals = TokenUsage()
+    for entry in entries:
+        totals.prompt_tokens += entry["tokens"]["prompt_tokens"]
+        totals.completion_tokens += entry["tokens"]["completion_tokens"]
+        totals.requests += entry["tokens"]["requests"]
+    return {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime(started_at)),
+        "elapsed_seconds": round(time.time() - started_at, 3),
+        "deployment": args.deployment,
+        "prompt_version": PROMPT_VERSION,
+        "concurrency": args.concurrency,
+        "succeeded": sum(entry["status"] == "ok" for entry in entries),
+        "failed": sum(entry["status"] != "ok" for entry in entries),
+        "tokens": totals.as_dict(),
+        "files": entries
+    }
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m dcf",
+        description="Génère les DCF d'un ensemble de cahiers des charges sans passer par l'interface Streamlit."
+    )
+    parser.add_argument("inputs", nargs="+", help="Fichiers, dossiers ou motifs glob (PDF, TXT ou DOCX)")
+    parser.add_argument("-o", "--output-dir", default="dcf_output", help="Dossier de sortie (défaut : dcf_output)")
+    parser.add_argument("--formats", default="docx,txt", help="Formats de sortie, séparés par des virgules (défaut : docx,txt)")
+    parser.add_argument("-c", "--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help=f"Nombre de CDC générés simultanément (défaut : {DEFAULT_CONCURRENCY})")
+    parser.add_argument("--map-workers", type=int, default=DEFAULT_MAX_WORKERS,
+                        help=f"Requêtes parallèles par CDC volumineux (défaut : {DEFAULT_MAX_WORKERS})")
+    parser.add_argument("--extract-workers", type=int, default=os.cpu_count() or 1,
+                        help="Processus dédiés à l'extraction (défaut : nombre de cœurs)")
+    parser.add_argument("--api-key", default=os.environ.get("AZURE_OPENAI_API_KEY"),
+                        help="Clé API Azure OpenAI (défaut : $AZURE_OPENAI_API_KEY)")
+    parser.add_argument("--endpoint", default=os.environ.get("AZURE_OPENAI_ENDPOINT", DEFAULT_ENDPOINT),
+                        help="Endpoint Azure OpenAI (défaut : $AZURE_OPENAI_ENDPOINT)")
+    parser.add_argument("--deployment", default=os.environ.get("AZURE_OPENAI_DEPLOYMENT", DEFAULT_DEPLOYMENT),
+                        help="Nom du déploiement (défaut : $AZURE_OPENAI_DEPLOYMENT)")
+    parser.add_argument("--rpm", type=int, default=int(os.environ.get("AZURE_OPENAI_RPM", "0")),
+                        help="Quota de requêtes par minute du déploiement, 0 = illimité (défaut : $AZURE_OPENAI_RPM)")
+    parser.add_argument("--tpm", type=int, default=int(os.environ.get("AZURE_OPENAI_TPM", "0")),
+                        help="Quota de tokens par minute du déploiement, 0 = illimité (défaut : $AZURE_OPENAI_TPM)")
+    parser.add_argument("--route", action="append", default=[], metavar="ENDPOINT,DEPLOIEMENT[,POIDS]",
+                        help="Déploiement supplémentaire entre lesquels répartir les requêtes (répétable, même clé API)")
+    parser.add_argument("--hedge-after", type=float, default=None, metavar="SECONDES",
+                        help="Duplique sur un autre déploiement une requête sans premier token après ce délai")
+    parser.add_argument("--timeout", type=float, default=None, metavar="SECONDES",
+                        help="Durée maximale de la génération d'un CDC, au-delà de laquelle elle est abandonnée")
+    parser.add_argument("--no-chunking", action="store_true", help="Désactive le découpage des CDC volumineux")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Rédige le DCF section par section et ne régénère que les sections touchées "
+                             "depuis la dernière génération du même fichier (même chemin relatif)")
+    parser.add_argument("--retrieval", action="store_true",
+                        help="Rédige le DCF section par section, chacune à partir des seuls passages pertinents "
+                             "du CDC (index BM25 local)")
+    parser.add_argument("--structured", action="store_true",
+                        help="Fait renvoyer le DCF au format JSON (schéma imposé) et compose le document localement")
+    parser.add_argument("--pre-extract", action="store_true",
+                        help="Relève localement sigles et règles de gestion pour alléger le prompt (mode direct) "
+                             "et compose les sections 1.4 et 5 du DCF")
+    parser.add_argument("--no-cache", action="store_true", help="Ne consulte ni n'alimente le cache des résultats")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Dossier du cache des résultats")
+    parser.add_argument("--manifest", help=f"Chemin du manifeste (défaut : <output-dir>/{MANIFEST_NAME})")
+    parser.add_argument("--timings-log", help=f"Journal JSON lines des temps par étape (défaut : {DEFAULT_LOG_PATH})")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    args.formats = {fmt.strip().lower() for fmt in args.formats.split(",") if fmt.strip()}
+    if not args.formats <= {"docx", "txt"}:
+        parser.error("--formats n'accepte que docx et txt")
+    if not args.api_key:
+        parser.error("clé API manquante : utilisez --api-key ou $AZURE_OPENAI_API_KEY")
+    if args.concurrency < 1 or args.map_workers < 1 or args.extract_workers < 1:
+        parser.error("--concurrency, --map-workers et --extract-workers doivent être positifs")
+
+    paths = collect_inputs(args.inputs)
+    if not paths:
+        parser.error("aucun fichier PDF, TXT ou DOCX trouvé")
+    try:
+        output_names(relative_inputs(paths))
+    except ValueError as e:
+        parser.error(str(e))
+
+    configure_rate_limit(args.endpoint, args.deployment, args.rpm, args.tpm)
+    try:
+        routes = [Route(args.endpoint, args.deployment)] + parse_routes("\n".join(args.route))
+    except ValueError as e:
+        parser.error(f"--route : {e}")
+    if args.hedge_after and len(routes) == 1:
+        print("--hedge-after ignoré : la requête de secours suppose au moins un --route", file=sys.stderr)
+    args.router = Router(routes, args.api_key, args.hedge_after) if len(routes) > 1 else None
+    os.makedirs(args.output_dir, exist_ok=True)
+    args.timings_log = args.timings_log or DEFAULT_LOG_PATH
+    manifest = asyncio.run(run_batch(paths, args))
+
+    manifest_path = args.manifest or os.path.join(args.output_dir, MANIFEST_NAME)
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    print(
+        f"{manifest['succeeded']} DCF générés, {manifest['failed']} échecs en {manifest['elapsed_seconds']:.1f} s "
+        f"({manifest['tokens']['total_tokens']} tokens) - manifeste : {manifest_path}",
+        file=sys.stderr
+    )
+    return 0 if manifest["failed"] == 0 else 1
@@ -0,0 +1,161 @@
+"""Extraction en flux du texte des DOCX, titres et tableaux compris
+
+word/document.xml est lu directement dans l'archive avec l'analyseur XML
+incrémental de lxml (déjà requis par python-docx), sans construire le modèle
+objet de python-docx : chaque bloc de premier niveau (paragraphe ou tableau)
+est converti dès qu'il est complet, puis libéré. Le temps est linéaire et la
+mémoire bornée par la taille du plus grand bloc, quelle que soit la longueur
+du document.
+
+Le texte produit suit l'ordre du document, au format markdown : les titres
+sont préfixés de « # » selon leur niveau, les éléments de liste de « - », et
+chaque tableau est restitué ligne par ligne (| cellule | cellule |).
+"""
+
+import io
+import re
+import zipfile
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_BODY = _W + "body"
+_P = _W + "p"
+_TBL = _W + "tbl"
+_TR = _W + "tr"
+_TC = _W + "tc"
+_SDT_CONTENT = _W + "sdtContent"
+_PPR = _W + "pPr"
+_PSTYLE = _W + "pStyle"
+_OUTLINE_LEVEL = _W + "outlineLvl"
+_NUMBERING = _W + "numPr"
+_VAL = _W + "val"
+
+# Éléments d'un paragraphe qui produisent du texte
+_TEXT = _W + "t"
+_BREAKS = {_W + "tab": "\t", _W + "br": "\n", _W + "cr": "\n", _W + "noBreakHyphen": "-"}
+_PARAGRAPH_TAGS = (_TEXT, _PSTYLE, _OUTLINE_LEVEL, _NUMBERING, *_BREAKS)
+
+MAX_HEADING_LEVEL = 6
+# Noms de styles de titres, en anglais et en français (Heading 1, Titre 2...)
+_HEADING_STYLE_RE = re.compile(r"^(?:heading|titre)\s*(\d)$", re.IGNORECASE)
+
+
+def _paragraph_styles(archive):
+    """Lit word/styles.xml : renvoie ({style: niveau de titre}, {styles de liste})"""
+    from lxml import etree  # importé au premier DOCX lu
+
+    try:
+        data = archive.read("word/styles.xml")
+    except KeyError:
+        return {}, set()
+    levels = {}
+    list_styles = set()
+    for style in etree.fromstring(data).iter(_W + "style"):
+        style_id = style.get(_W + "styleId")
+        name = style.find(_W + "name")
+        name = name.get(_VAL, "") if name is not None else ""
+        outline = style.find(f"{_PPR}/{_OUTLINE_LEVEL}")
+        if style.find(f"{_PPR}/{_NUMBERING}") is not None:
+            list_styles.add(style_id)
+        match = _HEADING_STYLE_RE.match(name.strip())
+        if name.strip().lower() in ("title", "titre"):
+            levels[style_id] = 1
+        elif match:
+            levels[style_id] = int(match.group(1))
+        elif outline is not None and outline.get(_VAL, "").isdigit():
+            levels[style_id] = int(outline.get(_VAL)) + 1
+    return levels, list_styles
+
+
+def _paragraph_text(paragraph):
+    return "".join(
+        element.text or "" if element.tag == _TEXT else _BREAKS[element.tag]
+        for element in paragraph.iter(_TEXT, *_BREAKS)
+    )
+
+
+def _is_top_level(parent):
+    """Indique si un bloc appartient au corps du document, éventuellement via un contrôle de contenu"""
+    while parent.tag == _SDT_CONTENT:
+        parent = parent.getparent().getparent()
+    return parent.tag == _BODY
+
+
+def _format_paragraph(paragraph, styles):
+    # Un seul parcours du paragraphe : texte et propriétés utiles (style, niveau, liste)
+    parts = []
+    style = outline = None
+    numbered = False
+    for element in paragraph.iter(_PARAGRAPH_TAGS):
+        tag = element.tag
+        if tag == _TEXT:
+            parts.append(element.text or "")
+        elif tag in _BREAKS:
+            parts.append(_BREAKS[tag])
+        elif tag == _PSTYLE:
+            style = element.get(_VAL)
+        elif tag == _OUTLINE_LEVEL:
+            outline = element.get(_VAL, "")
+        else:
+            numbered = True
+    text = "".join(parts).strip()
+    if not text or (style is None and outline is None and not numbered):
+        return text
+
+    levels, list_styles = styles
+    level = int(outline) + 1 if outline and outline.isdigit() else levels.get(style, 0)
+    # Les niveaux au-delà de 9 désignent le corps de texte
+    if 0 < level <= 9:
+        return "#" * min(level, MAX_HEADING_LEVEL) + " " + " ".join(text.split())
+    if numbered or style in list_styles:
+        return "- " + text
+    return text
+
+
+def _format_cell(cell):
+    # Les paragraphes et tableaux imbriqués d'une cellule sont mis à plat
+    text = " ".join(_paragraph_text(paragraph) for paragraph in cell.iter(_P))
+    return " ".join(text.split()).replace("|", "\\|")
+
+
+def _format_table(table):
+    lines = []
+    for row in table.iterfind(_TR):
+        cells = [_format_cell(cell) for cell in row.iterfind(_TC)]
+        if not any(cells):
+            continue
+        lines.append("| " + " | ".join(cells) + " |")
+        if len(lines) == 1:
+            lines.append("|" + " --- |" * len(cells))
+    return "\n".join(lines)
+
+
+def iter_docx_blocks(source):
+    """Produit le texte de chaque paragraphe ou tableau du document, dans l'ordre
+
+    source est un chemin, un fichier binaire ouvert ou le contenu du DOCX.
+    """
+    from lxml import etree
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    with zipfile.ZipFile(source) as archive:
+        styles = _paragraph_styles(archive)
+        with archive.open("word/document.xml") as stream:
+            # Seules les fins de paragraphe et de tableau remontent jusqu'à Python
+            for _, element in etree.iterparse(stream, events=("end",), tag=(_P, _TBL)):
+                parent = element.getparent()
+                # Les paragraphes des cellules sont traités avec leur tableau
+                if not _is_top_level(parent):
+                    continue
+                text = _format_paragraph(element, styles) if element.tag == _P else _format_table(element)
+                if text:
+                    yield text
+                # Le bloc est traité : on le libère, ainsi que ses prédécesseurs
+                element.clear(keep_tail=True)
+                while element.getprevious() is not None:
+                    del parent[0]
+
+
+def extract_docx(source):
+    """Renvoie le texte d'un DOCX, blocs séparés par une ligne"""
+    return "\n".join(iter_docx_blocks(source)) + "\n"
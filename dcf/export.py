@@ -0,0 +1,231 @@
+"""Export du DCF généré aux formats Word et texte
+
+Le DCF produit par le modèle est du markdown : il est converti en un seul
+passage, ligne par ligne, en document Word (titres par niveau, tableaux,
+listes à puces ou numérotées imbriquées, gras et italique). python-docx
+n'est importé qu'au premier export Word.
+"""
+
+import io
+import re
+from xml.sax.saxutils import escape
+
+from .memo import content_hash
+
+MAX_HEADING_LEVEL = 9
+MAX_LIST_LEVEL = 3
+# Indentation (en espaces) d'un niveau de liste
+LIST_INDENT = 2
+# Au-delà, une ligne commençant par « 1.2 » est une phrase et non un titre
+MAX_HEADING_CHARS = 120
+
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+# Titres numérotés sans dièse : « 1.2. Références », « 3.1.4 Règles »
+_NUMBERED_HEADING_RE = re.compile(r"^(\d+(?:\.\d+)+)\.?\s+(\S.*)$")
+# Numéro en tête d'un titre à dièses : « ### 1. CADRE GENERAL »
+_HEADING_NUMBER_RE = re.compile(r"^(\d+(?:\.\d+)*)\.?\s")
+_BULLET_RE = re.compile(r"^(\s*)[-*+•]\s+(.*)$")
+_NUMBERED_RE = re.compile(r"^(\s*)\d+[.)]\s+(.*)$")
+_TABLE_SEPARATOR_RE = re.compile(r"^\|?\s*:?-{2,}:?\s*(\|\s*:?-{2,}:?\s*)*\|?$")
+_RULE_RE = re.compile(r"^(?:-{3,}|\*{3,}|_{3,})$")
+# Gras (**texte** ou __texte__), italique (*texte*) et code (`texte`)
+_INLINE_RE = re.compile(r"(\*\*.+?\*\*|__.+?__|\*[^*\s][^*]*\*|`[^`]+`)")
+_CELL_SPLIT_RE = re.compile(r"(?<!\\)\|")
+
+
+_INVALID_XML_CHARS_RE = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _escape(text):
+    return escape(_INVALID_XML_CHARS_RE.sub("", text))
+
+
+def _run(text, bold=False, italic=False):
+    properties = ("<w:b/>" if bold else "") + ("<w:i/>" if italic else "")
+    properties = f"<w:rPr>{properties}</w:rPr>" if properties else ""
+    return f'<w:r>{properties}<w:t xml:space="preserve">{_escape(text)}</w:t></w:r>'
+
+
+def _runs(text):
+    """Convertit le texte en runs Word en interprétant le gras, l'italique et le code"""
+    runs = []
+    for part in _INLINE_RE.split(text):
+        if not part:
+            continue
+        if (part.startswith("**") and part.endswith("**") or part.startswith("__") and part.endswith("__")) \
+                and len(part) > 4:
+            runs.append(_run(part[2:-2], bold=True))
+        elif part.startswith("*") and part.endswith("*") and len(part) > 2:
+            runs.append(_run(part[1:-1], italic=True))
+        elif part.startswith("`") and part.endswith("`") and len(part) > 2:
+            runs.append(_run(part[1:-1]))
+        else:
+            runs.append(_run(part))
+    return "".join(runs)
+
+
+def _plain(text):
+    """Retire le balisage inline (pour les titres, déjà mis en forme par leur style)"""
+    return _INLINE_RE.sub(lambda match: match.group(0).strip("*_`"), text)
+
+
+def _split_row(line):
+    line = line.strip()
+    if line.startswith("|"):
+        line = line[1:]
+    if line.endswith("|") and not line.endswith("\\|"):
+        line = line[:-1]
+    return [cell.strip().replace("\\|", "|") for cell in _CELL_SPLIT_RE.split(line)]
+
+
+class _DocxRenderer:
+    """Convertit le markdown en document Word en un seul passage sur les lignes
+
+    Le corps du document est écrit directement en WordprocessingML, puis
+    analysé une seule fois et inséré dans le modèle de document de
+    python-docx : on évite ainsi le coût de l'API objet, qui résout le style
+    de chaque paragraphe en parcourant tous les styles du document.
+    """
+
+    def __init__(self):
+        from docx import Document
+
+        self.doc = Document()
+        self.parts = []
+        self._style_ids = {}
+
+    def style_id(self, name):
+        if name not in self._style_ids:
+            self._style_ids[name] = self.doc.styles[name].style_id
+        return self._style_ids[name]
+
+    def paragraph(self, runs, style=None):
+        properties = f'<w:pPr><w:pStyle w:val="{self.style_id(style)}"/></w:pPr>' if style else ""
+        self.parts.append(f"<w:p>{properties}{runs}</w:p>")
+
+    def heading(self, text, level):
+        self.paragraph(_run(_plain(text)), f"Heading {min(level, MAX_HEADING_LEVEL)}")
+
+    def list_item(self, text, indent, kind):
+        level = min(len(indent.expandtabs(4)) // LIST_INDENT, MAX_LIST_LEVEL - 1) + 1
+        self.paragraph(_runs(text), f"{kind} {level}" if level > 1 else kind)
+
+    def table(self, lines):
+        rows = [_split_row(line) for line in lines if not _TABLE_SEPARATOR_RE.match(line)]
+        if not rows:
+            return
+        columns = max(len(row) for row in rows)
+        header = len(lines) > 1 and _TABLE_SEPARATOR_RE.match(lines[1])
+        xml = [
+            f'<w:tbl><w:tblPr><w:tblStyle w:val="{self.style_id("Table Grid")}"/><w:tblW w:w="0" w:type="auto"/>'
+            '<w:tblLook w:val="04A0" w:firstRow="1" w:lastRow="0" w:firstColumn="1" w:lastColumn="0" '
+            'w:noHBand="0" w:noVBand="1"/></w:tblPr><w:tblGrid>',
+            "<w:gridCol/>" * columns,
+            "</w:tblGrid>"
+        ]
+        for index, cells in enumerate(rows):
+            xml.append("<w:tr>")
+            for text in cells + [""] * (columns - len(cells)):
+                runs = _run(_plain(text), bold=True) if index == 0 and header else _runs(text)
+                xml.append(f'<w:tc><w:tcPr><w:tcW w:w="0" w:type="auto"/></w:tcPr><w:p>{runs}</w:p></w:tc>')
+            xml.append("</w:tr>")
+        xml.append("</w:tbl>")
+        self.parts.append("".join(xml))
+
+    def render(self, text):
+        from docx.oxml import parse_xml
+        from docx.oxml.ns import nsdecls
+
+        lines = text.splitlines()
+        i = 0
+        in_code = False
+        # Niveau d'un titre numéroté sans dièse : base + nombre de composantes du numéro, base étant
+        # déduite du dernier titre à dièses (« ### 1. » suivi de « 1.1. » : Heading 3 puis Heading 4)
+        base = 0
+        while i < len(lines):
+            line = lines[i]
+            stripped = line.strip()
+            i += 1
+            if stripped.startswith("```"):
+                in_code = not in_code
+                continue
+            if in_code:
+                if stripped:
+                    self.paragraph(_run(line.rstrip()))
+                continue
+            if not stripped or _RULE_RE.match(stripped):
+                continue
+
+            if stripped.startswith("|"):
+                block = [stripped]
+                while i < len(lines) and lines[i].strip().startswith("|"):
+                    block.append(lines[i].strip())
+                    i += 1
+                self.table(block)
+                continue
+
+            match = _HEADING_RE.match(stripped)
+            if match:
+                level = len(match.group(1))
+                number = _HEADING_NUMBER_RE.match(match.group(2))
+                # « # 3.1.2 Règles » : un numéro plus profond que le titre ne descend pas sous le niveau 1
+                base = max(0, level - (number.group(1).count(".") + 1 if number else 1))
+                self.heading(match.group(2), level)
+                continue
+            match = _NUMBERED_HEADING_RE.match(stripped)
+            if match and not line[:1].isspace() and len(stripped) <= MAX_HEADING_CHARS:
+                self.heading(stripped, max(1, base + match.group(1).count(".") + 1))
+                continue
+            match = _BULLET_RE.match(line)
+            if match:
+                self.list_item(match.group(2), match.group(1), "List Bullet")
+                continue
+            match = _NUMBERED_RE.match(line)
+            if match:
+                self.list_item(match.group(2), match.group(1), "List Number")
+                continue
+            if stripped.startswith(">"):
+                self.paragraph(_runs(stripped.lstrip("> ")), "Quote")
+                continue
+            self.paragraph(_runs(stripped))
+
+        body = self.doc.element.body
+        fragment = parse_xml(f'<w:body {nsdecls("w")}>{"".join(self.parts)}</w:body>')
+        section = body.sectPr
+        for element in list(fragment):
+            if section is not None:
+                section.addprevious(element)
+            else:
+                body.append(element)
+        return self.doc
+
+
+def markdown_to_docx(text):
+    """Construit le document Word (python-docx) correspondant au DCF en markdown"""
+    return _DocxRenderer().render(text)
+
+
+def save_dcf_to_word(text, filename="DCF_Généré.docx"):
+    """Sauvegarde le DCF dans un fichier Word"""
+    doc = markdown_to_docx(text)
+
+    # Sauvegarde en mémoire
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    buffer.seek(0)
+    return buffer
+
+
+def word_document(text, memo=None):
+    """Contenu du document Word du DCF, construit une seule fois par texte si memo (dcf.memo.MemoCache) est fourni"""
+    if memo is None:
+        return save_dcf_to_word(text).getvalue()
+    return memo.get_or_compute(("docx", content_hash(text)), lambda: save_dcf_to_word(text).getvalue())
+
+
+def save_dcf_to_txt(text, filename="DCF_Généré.txt"):
+    """Sauvegarde le DCF dans un fichier texte"""
+    buffer = io.BytesIO()
+    buffer.write(text.encode('utf-8'))
+    buffer.seek(0)
+    return buffer
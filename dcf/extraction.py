@@ -0,0 +1,128 @@
+"""Extraction du texte des CDC (PDF, TXT ou DOCX), indépendante de l'interface"""
+
+import codecs
+import os
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from .docx_reader import iter_docx_blocks
+from .ocr import OcrReport
+from .pdf import iter_pdf_pages, join_pages
+from .uploads import extraction_cost, file_size, get_memory_budget, spooled
+
+PDF_MIME = "application/pdf"
+TXT_MIME = "text/plain"
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+MIME_TYPES = {
+    ".pdf": PDF_MIME,
+    ".txt": TXT_MIME,
+    ".docx": DOCX_MIME
+}
+SUPPORTED_EXTENSIONS = tuple(MIME_TYPES)
+# Taille des blocs lus dans un fichier texte
+TEXT_BLOCK_CHARS = 1024 * 1024
+
+
+class UnsupportedFormatError(ValueError):
+    """Le format du fichier n'est pas pris en charge"""
+
+
+@dataclass
+class ExtractedDocument:
+    """Texte extrait d'un CDC ; page_offsets et ocr (OcrReport) ne sont renseignés que pour les PDF"""
+    text: str
+    page_offsets: list = None
+    ocr: OcrReport = None
+
+
+def mime_type_for(path):
+    """Renvoie le type MIME correspondant à l'extension du fichier"""
+    extension = os.path.splitext(path)[1].lower()
+    try:
+        return MIME_TYPES[extension]
+    except KeyError:
+        raise UnsupportedFormatError(f"Format non supporté : {extension or path}") from None
+
+
+@contextmanager
+def _pdf_source(source):
+    """PDF sous une forme que PyMuPDF ouvre sans le recopier : chemin, bytes, ou vue
+    sur le tampon d'un fichier en mémoire (UploadedFile, BytesIO)"""
+    if isinstance(source, (bytes, bytearray, str, os.PathLike)):
+        yield source
+    elif hasattr(source, "getbuffer"):
+        with source.getbuffer() as view:
+            yield view
+    else:
+        source.seek(0)
+        yield source.read()
+
+
+def _iter_text(source, block_chars=TEXT_BLOCK_CHARS):
+    """Produit le texte UTF-8 d'un fichier par blocs, sans le charger en entier"""
+    if isinstance(source, (bytes, bytearray)):
+        yield source.decode("utf-8")
+        return
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, encoding="utf-8", newline="") as f:
+            yield from iter(lambda: f.read(block_chars), "")
+        return
+    source.seek(0)
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    for block in iter(lambda: source.read(block_chars), b""):
+        yield decoder.decode(block)
+    yield decoder.decode(b"", final=True)
+
+
+def iter_document(source, file_type, pdf_workers=None, ocr_report=None):
+    """Produit le texte d'un document par morceaux : pages d'un PDF, paragraphes
+    et tableaux d'un DOCX, blocs d'un TXT
+
+    source est le chemin du fichier, un fichier binaire ouvert ou son contenu
+    (bytes). Un chemin est lu à la demande, sans copie du fichier en mémoire.
+    Les pages scannées d'un PDF passent par l'OCR, dont le bilan est ajouté à
+    ocr_report.
+    """
+    if file_type == DOCX_MIME:
+        for block in iter_docx_blocks(source):
+            yield block + "\n"
+    elif file_type == PDF_MIME:
+        with _pdf_source(source) as pdf:
+            yield from iter_pdf_pages(pdf, max_workers=pdf_workers, ocr_report=ocr_report)
+    elif file_type == TXT_MIME:
+        yield from _iter_text(source)
+    else:
+        raise UnsupportedFormatError(f"Format non supporté : {file_type}")
+
+
+def extract_document(data, file_type, pdf_workers=None):
+    """Extrait le texte d'un document, selon son type MIME
+
+    data est le contenu du fichier (bytes), un fichier binaire ouvert ou son
+    chemin ; un DOCX est lu en flux, et un PDF ouvert par son chemin n'est pas
+    chargé en mémoire.
+    """
+    if file_type != PDF_MIME:
+        return ExtractedDocument("".join(iter_document(data, file_type, pdf_workers)))
+    report = OcrReport()
+    pdf = join_pages(iter_document(data, file_type, pdf_workers, report))
+    return ExtractedDocument(pdf.text, pdf.page_offsets, report)
+
+
+def extract_upload(fileobj, file_type, pdf_workers=None, on_wait=None):
+    """Extrait le texte d'un fichier reçu, dans la limite du budget mémoire du processus
+
+    L'extraction attend son tour si le budget (voir dcf.uploads) est occupé
+    par d'autres ; on_wait est alors appelé avant l'attente. Au-delà du seuil
+    de SPOOL_THRESHOLD_BYTES, le fichier est lu depuis une copie sur disque.
+    """
+    suffix = next((extension for extension, mime in MIME_TYPES.items() if mime == file_type), "")
+    with get_memory_budget().reserve(extraction_cost(file_size(fileobj), suffix), on_wait):
+        with spooled(fileobj, suffix=suffix) as source:
+            return extract_document(source, file_type, pdf_workers)
+
+
+def extract_path(path, pdf_workers=None):
+    """Extrait le texte d'un fichier du disque"""
+    return extract_document(path, mime_type_for(path), pdf_workers)
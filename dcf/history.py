@@ -0,0 +1,205 @@
+"""Historique des générations, persisté dans SQLite
+
+Chaque DCF généré y est conservé avec l'empreinte et le nom du CDC, le
+déploiement, la version des prompts, les temps par étape et la consommation
+de tokens. Le texte du DCF est compressé et le document Word est enregistré
+déjà construit : un DCF de l'historique se rouvre et se télécharge sans
+nouvel appel au modèle ni nouvel export.
+
+La base est en mode WAL, avec une connexion par opération : les écritures
+des différentes sessions ne bloquent pas les lectures. La liste ne lit que
+les métadonnées ; le DCF et le document Word ne sont lus qu'à l'ouverture.
+"""
+
+import json
+import os
+import sqlite3
+import time
+import uuid
+import zlib
+from contextlib import closing
+from dataclasses import dataclass
+
+from .cache import DEFAULT_CACHE_DIR
+from .export import save_dcf_to_word
+
+DEFAULT_DB_PATH = os.environ.get("DCF_HISTORY_DB", os.path.join(DEFAULT_CACHE_DIR, "history.sqlite3"))
+# Nombre de générations conservées ; les plus anciennes sont supprimées au-delà
+MAX_ENTRIES = int(os.environ.get("DCF_HISTORY_MAX_ENTRIES", "1000"))
+
+# Les colonnes volumineuses sont en fin de ligne : lire les métadonnées ne les charge pas
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    file_name TEXT NOT NULL COLLATE NOCASE,
+    cdc_hash TEXT NOT NULL,
+    cdc_chars INTEGER,
+    deployment TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    mode TEXT,
+    stages TEXT,
+    tokens TEXT,
+    dcf_chars INTEGER NOT NULL,
+    dcf BLOB NOT NULL,
+    docx BLOB
+);
+CREATE INDEX IF NOT EXISTS history_created ON history (created_at);
+CREATE INDEX IF NOT EXISTS history_file_name ON history (file_name, created_at);
+CREATE INDEX IF NOT EXISTS history_cdc ON history (cdc_hash, deployment, prompt_version);
+"""
+
+_COLUMNS = (
+    "id, created_at, file_name, cdc_hash, cdc_chars, deployment, prompt_version, mode, stages, tokens, dcf_chars"
+)
+
+
+@dataclass
+class HistoryEntry:
+    """Génération enregistrée ; dcf n'est renseigné que par HistoryStore.get"""
+    id: str
+    created_at: float
+    file_name: str
+    cdc_hash: str
+    cdc_chars: int
+    deployment: str
+    prompt_version: str
+    mode: str
+    stages: dict
+    tokens: dict
+    dcf_chars: int
+    dcf: str = None
+
+
+def _entry(row, dcf=None):
+    (entry_id, created_at, file_name, cdc_hash, cdc_chars, deployment, prompt_version, mode, stages, tokens,
+     dcf_chars) = row
+    return HistoryEntry(
+        id=entry_id,
+        created_at=created_at,
+        file_name=file_name,
+        cdc_hash=cdc_hash,
+        cdc_chars=cdc_chars,
+        deployment=deployment,
+        prompt_version=prompt_version,
+        mode=mode,
+        stages=json.loads(stages) if stages else {},
+        tokens=json.loads(tokens) if tokens else {},
+        dcf_chars=dcf_chars,
+        dcf=zlib.decompress(dcf).decode("utf-8") if dcf is not None else None
+    )
+
+
+def _like_prefix(text):
+    escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped + "%"
+
+
+class HistoryStore:
+    """Accès à la table de l'historique (une connexion SQLite par opération, mode WAL)"""
+
+    def __init__(self, path=DEFAULT_DB_PATH, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def add(self, file_name, cdc_hash, deployment, prompt_version, dcf, mode=None, stages=None, tokens=None,
+            cdc_chars=None, docx=None, build_docx=True):
+        """Enregistre une génération et renvoie son identifiant
+
+        docx est le contenu du document Word du DCF ; s'il n'est pas fourni, il
+        est construit ici, sauf avec build_docx=False : l'entrée est alors
+        enregistrée sans document Word, reconstruit à l'ouverture.
+        """
+        if docx is None and build_docx:
+            docx = save_dcf_to_word(dcf).getvalue()
+        entry_id = uuid.uuid4().hex
+        # Compression hors transaction : le verrou d'écriture n'est tenu que le temps de l'insertion
+        compressed = zlib.compress(dcf.encode("utf-8"))
+        with closing(self._connect()) as conn:
+            conn.execute(
+                f"INSERT INTO history ({_COLUMNS}, dcf, docx) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    entry_id, time.time(), file_name or "", cdc_hash, cdc_chars, deployment, prompt_version, mode,
+                    json.dumps(stages) if stages else None, json.dumps(tokens) if tokens else None,
+                    len(dcf), compressed, docx
+                )
+            )
+        return entry_id
+
+    def search(self, file_name=None, since=None, until=None, limit=50):
+        """Générations les plus récentes, sans leur contenu
+
+        file_name filtre sur le début du nom de fichier (sans tenir compte de
+        la casse) ; since et until bornent la date d'enregistrement (timestamps).
+        """
+        conditions = []
+        args = []
+        if file_name:
+            conditions.append("file_name LIKE ? ESCAPE '\\'")
+            args.append(_like_prefix(file_name))
+        if since is not None:
+            conditions.append("created_at >= ?")
+            args.append(since)
+        if until is not None:
+            conditions.append("created_at < ?")
+            args.append(until)
+        query = f"SELECT {_COLUMNS} FROM history"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        with closing(self._connect()) as conn:
+            rows = conn.execute(query, (*args, limit)).fetchall()
+        return [_entry(row) for row in rows]
+
+    def find(self, cdc_hash, deployment=None, prompt_version=None):
+        """Dernière génération d'un CDC (par empreinte), avec son contenu ; None si aucune"""
+        query = f"SELECT {_COLUMNS}, dcf FROM history WHERE cdc_hash = ?"
+        args = [cdc_hash]
+        if deployment is not None:
+            query += " AND deployment = ?"
+            args.append(deployment)
+        if prompt_version is not None:
+            query += " AND prompt_version = ?"
+            args.append(prompt_version)
+        with closing(self._connect()) as conn:
+            row = conn.execute(query + " ORDER BY created_at DESC LIMIT 1", args).fetchone()
+        return _entry(row[:-1], row[-1]) if row else None
+
+    def get(self, entry_id):
+        with closing(self._connect()) as conn:
+            row = conn.execute(f"SELECT {_COLUMNS}, dcf FROM history WHERE id = ?", (entry_id,)).fetchone()
+        return _entry(row[:-1], row[-1]) if row else None
+
+    def get_docx(self, entry_id):
+        """Contenu du document Word enregistré avec la génération ; None s'il est absent"""
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT docx FROM history WHERE id = ?", (entry_id,)).fetchone()
+        return bytes(row[0]) if row and row[0] is not None else None
+
+    def delete(self, entry_id):
+        with closing(self._connect()) as conn:
+            return conn.execute("DELETE FROM history WHERE id = ?", (entry_id,)).rowcount == 1
+
+    def count(self):
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+
+    def purge(self):
+        """Ne conserve que les max_entries générations les plus récentes"""
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "DELETE FROM history WHERE created_at < ("
+                "SELECT created_at FROM history ORDER BY created_at DESC LIMIT 1 OFFSET ?)",
+                (self.max_entries - 1,)
+            )
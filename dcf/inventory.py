@@ -0,0 +1,531 @@
+"""Pré-extraction locale des sigles, règles de gestion, exigences et tableaux d'un CDC
+
+Un passage unique sur le texte extrait (voir dcf.extraction) relève, sans
+appel au modèle :
+  - les sigles et leur développement : tableaux de glossaire, lignes
+    « SIGLE : définition » et formes « Développement complet (SIGLE) » ;
+  - les règles de gestion identifiées (RG-001, RG 12, REG-3.1...), définies
+    dans un tableau ou en début de ligne, et leurs autres mentions ;
+  - les exigences numérotées (EX-001, EF-12, REQ-4...) ;
+  - les tableaux, avec leur en-tête et leur page.
+
+Le modèle reçoit un inventaire compact à la place des passages relevés
+(glossaires, tableaux et définitions de règles sont remplacés dans le CDC par
+un renvoi) et n'a plus à rédiger les sections 1.4 et 5 du DCF : leurs
+tableaux sont composés ici à partir de l'inventaire.
+"""
+
+import re
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from .chunking import is_heading, page_at
+from .retrieval import fold
+
+# Préfixes des identifiants de règles de gestion et d'exigences
+RULE_PREFIXES = ("RG", "RDG", "REG", "BR")
+REQUIREMENT_PREFIXES = ("EX", "EXG", "EXI", "EXF", "EF", "ENF", "REQ")
+# Un sigle sans développement connu n'est retenu qu'à partir de ce nombre d'occurrences
+MIN_ACRONYM_OCCURRENCES = 2
+# Longueur maximale d'une règle définie en prose (lignes de suite comprises)
+MAX_RULE_CHARS = 600
+
+_ID = r"[-_. ]?\d+(?:[-.]\d+)*\b"
+_RULE_ID_RE = re.compile(rf"\b(?:{'|'.join(RULE_PREFIXES)}){_ID}")
+_REQUIREMENT_ID_RE = re.compile(rf"\b(?:{'|'.join(REQUIREMENT_PREFIXES)}){_ID}")
+_ID_PREFIXES = frozenset(RULE_PREFIXES + REQUIREMENT_PREFIXES)
+# Définition en début de ligne : « - RG-001 : texte », « **RG-001** - texte »
+_DEFINITION_RE = re.compile(r"^\s*(?:[-•*]\s+)?(?:\*\*)?(?P<id>[A-Z]{2,4}[-_. ]?\d+(?:[-.]\d+)*)(?:\*\*)?\s*[:–—.)-]\s*(?P<text>\S.*)$")
+_ACRONYM_RE = re.compile(r"\b[A-Z][A-Z0-9&]*[A-Z][A-Z0-9&]*\b")
+_GLOSSARY_LINE_RE = re.compile(
+    r"^\s*(?:[-•*]\s+)?(?:\*\*)?(?P<short>[A-Z][A-Z0-9&/]{1,11})(?:\*\*)?\s*(?::|=|–|—|-)\s*(?P<text>[A-Za-zÀ-ÿ].{2,200})$"
+)
+_PARENTHESIS_RE = re.compile(r"\(([^()\s]{2,10})\)")
+_ROMAN_RE = re.compile(r"^[IVXLC]+$")
+# Mots courants écrits en capitales, qui ne sont pas des sigles (« IMPORTANT : ... »)
+_UPPERCASE_WORDS = frozenset((
+    "ACTEUR", "ANNEXE", "ATTENTION", "AVERTISSEMENT", "CONTEXTE", "DEFINITION", "DESCRIPTION", "ENTREE",
+    "ETAPE", "EXEMPLE", "IMPORTANT", "INFO", "NB", "NON", "NOTA", "NOTE", "OBJECTIF", "OBJET", "OK", "OUI",
+    "PRECONDITION", "RAPPEL", "REMARQUE", "RESULTAT", "SORTIE", "TITRE", "TODO"
+))
+_ARTICLES = frozenset(("de", "des", "du", "d'", "la", "le", "les", "l'", "a", "au", "aux", "et"))
+_GLOSSARY_HEADERS = ("sigle", "acronyme", "abreviation", "terme", "glossaire")
+_CELL_SPLIT_RE = re.compile(r"(?<!\\)\|")
+_TABLE_SEPARATOR_RE = re.compile(r"^\|?\s*:?-{2,}:?\s*(\|\s*:?-{2,}:?\s*)*\|?$")
+# Titres de sections du DCF produit par le modèle
+_HEADING_LINE_RE = re.compile(r"^\s*(?:#{1,6}\s*|\*\*)?(?P<number>\d+(?:\.\d+)*)\.?\s+\S")
+
+
+@dataclass
+class Acronym:
+    short: str
+    expansion: str = ""
+    occurrences: int = 0
+    pages: list = field(default_factory=list)
+
+
+@dataclass
+class Rule:
+    """Règle de gestion identifiée ; text est vide si elle n'est que mentionnée"""
+    identifier: str
+    text: str = ""
+    section: str = ""
+    pages: list = field(default_factory=list)
+    occurrences: int = 0
+
+
+@dataclass
+class Requirement:
+    identifier: str
+    text: str = ""
+    section: str = ""
+    pages: list = field(default_factory=list)
+
+
+@dataclass
+class TableBlock:
+    """Tableau du CDC ; kind vaut "glossary", "rules" ou "other" """
+    header: list
+    rows: int
+    page: int
+    kind: str
+
+
+def _split_row(line):
+    line = line.strip().strip("|")
+    return [cell.strip().replace("\\|", "|") for cell in _CELL_SPLIT_RE.split(line)]
+
+
+def _normalize_id(identifier):
+    return re.sub(r"[_ ]", "-", identifier.upper())
+
+
+def _is_acronym(token):
+    return (
+        2 <= len(token) <= 10 and sum(char.isupper() for char in token) >= 2
+        and token not in _ID_PREFIXES and not _ROMAN_RE.match(token)
+        and fold(token).upper() not in _UPPERCASE_WORDS
+    )
+
+
+def _matches_initials(short, expansion):
+    """Indique si les lettres du sigle se retrouvent dans l'ordre dans le développement, la première en tête"""
+    letters = [char for char in fold(short) if char.isalnum()]
+    folded = fold(expansion)
+    if not letters or not folded.startswith(letters[0]):
+        return False
+    position = 1
+    for letter in letters[1:]:
+        position = folded.find(letter, position) + 1
+        if not position:
+            return False
+    return True
+
+
+def _long_form(short, words):
+    """Développement d'un sigle parmi les mots qui le précèdent (algorithme de Schwartz et Hearst)"""
+    candidate = " ".join(words[-min(len(short) + 5, len(short) * 2):])
+    folded = [fold(char)[:1] or char for char in candidate]
+    letters = [char.lower() for char in fold(short) if char.isalnum()]
+    position = len(candidate) - 1
+    for index in range(len(letters) - 1, -1, -1):
+        while position >= 0 and (
+            folded[position] != letters[index]
+            or index == 0 and position > 0 and candidate[position - 1].isalnum()
+        ):
+            position -= 1
+        if position < 0:
+            return ""
+        position -= 1
+    start = candidate.rfind(" ", 0, position + 1) + 1
+    # « Direction des Systèmes d'Information (DSI) » : l'article initial est précédé du mot qui porte l'initiale
+    first_word = candidate[start:].split(" ", 1)[0]
+    if fold(first_word) in _ARTICLES and start:
+        previous = candidate.rfind(" ", 0, start - 1) + 1
+        if folded[previous] == letters[0]:
+            start = previous
+    expansion = candidate[start:].strip(" ,;:")
+    return expansion if len(expansion) > len(short) and short not in expansion else ""
+
+
+def _page_range(pages):
+    if not pages:
+        return ""
+    return f"p. {pages[0]}" if pages[0] == pages[-1] else f"p. {pages[0]}-{pages[-1]}"
+
+
+def _span(identifiers):
+    return identifiers[0] if len(identifiers) == 1 else f"{identifiers[0]} à {identifiers[-1]}"
+
+
+def _cell(text):
+    return " ".join(text.split()).replace("|", "\\|") or "-"
+
+
+class _Analyzer:
+    """Parcours du texte ligne par ligne, en retenant la position, la page et le titre courants"""
+
+    def __init__(self, text, page_offsets):
+        self.text = text
+        self.page_offsets = page_offsets
+        self.acronyms = {}
+        self.rules = {}
+        self.requirements = {}
+        self.tables = []
+        # Portions du texte remplacées par un renvoi dans le CDC envoyé au modèle : (début, fin, renvoi)
+        self.replacements = []
+
+    def page(self, offset):
+        return page_at(self.page_offsets, offset) if self.page_offsets else None
+
+    def acronym(self, short):
+        return self.acronyms.setdefault(short, Acronym(short))
+
+    def define_acronym(self, short, expansion):
+        entry = self.acronym(short)
+        if expansion and not entry.expansion:
+            entry.expansion = expansion
+
+    def rule(self, identifier):
+        identifier = _normalize_id(identifier)
+        return self.rules.setdefault(identifier, Rule(identifier))
+
+    def run(self):
+        lines = self.text.splitlines(keepends=True)
+        offsets = []
+        position = 0
+        for line in lines:
+            offsets.append(position)
+            position += len(line)
+        section = ""
+        index = 0
+        while index < len(lines):
+            line = lines[index].rstrip("\r\n")
+            stripped = line.strip()
+            offset = offsets[index]
+            if stripped.startswith("|"):
+                end = index
+                while end < len(lines) and lines[end].strip().startswith("|"):
+                    end += 1
+                self.table(lines[index:end], offsets[index], offsets[end - 1] + len(lines[end - 1]), section)
+                index = end
+                continue
+            if stripped.startswith("#") or is_heading(stripped):
+                section = stripped.lstrip("#").strip()
+            else:
+                consumed = self.definitions(lines, index, offset, section)
+                if consumed:
+                    index += consumed
+                    continue
+                self.scan(line, offset)
+            index += 1
+
+    def scan(self, line, offset):
+        """Relève les mentions de sigles, de règles et les développements entre parenthèses d'une ligne"""
+        page = self.page(offset)
+        for match in _RULE_ID_RE.finditer(line):
+            rule = self.rule(match.group(0))
+            rule.occurrences += 1
+            if page and page not in rule.pages:
+                rule.pages.append(page)
+        letters = [char for char in line if char.isalpha()]
+        if letters and all(char.isupper() for char in letters):
+            # Titre en capitales : ses mots ne sont pas des sigles
+            return
+        for match in _ACRONYM_RE.finditer(line):
+            token = match.group(0)
+            if _is_acronym(token):
+                entry = self.acronym(token)
+                entry.occurrences += 1
+                if page and page not in entry.pages:
+                    entry.pages.append(page)
+        for match in _PARENTHESIS_RE.finditer(line):
+            inner = match.group(1)
+            if _is_acronym(inner):
+                self.define_acronym(inner, _long_form(inner, line[:match.start()].split()))
+
+    def definitions(self, lines, index, offset, section):
+        """Traite une définition de règle, d'exigence ou de sigle ; renvoie le nombre de lignes consommées"""
+        line = lines[index].rstrip("\r\n")
+        match = _DEFINITION_RE.match(line)
+        if match and (_RULE_ID_RE.fullmatch(match.group("id")) or _REQUIREMENT_ID_RE.fullmatch(match.group("id"))):
+            identifier = match.group("id")
+            text = match.group("text").strip()
+            consumed = 1
+            if _REQUIREMENT_ID_RE.fullmatch(identifier):
+                requirement = self.requirements.setdefault(_normalize_id(identifier), Requirement(_normalize_id(identifier)))
+                if not requirement.text:
+                    requirement.text, requirement.section = text, section
+                page = self.page(offset)
+                if page and page not in requirement.pages:
+                    requirement.pages.append(page)
+                self.scan(line, offset)
+                return consumed
+            # Suite de la règle sur les lignes suivantes, jusqu'à une ligne vide, un titre ou une autre définition
+            while index + consumed < len(lines) and len(text) < MAX_RULE_CHARS:
+                following = lines[index + consumed].strip()
+                if not following or following.startswith(("|", "#", "-", "*", "•")) or is_heading(following) \
+                        or _DEFINITION_RE.match(following) or text.endswith("."):
+                    break
+                text = f"{text} {following}"
+                consumed += 1
+            rule = self.rule(identifier)
+            if not rule.text:
+                rule.text, rule.section = text[:MAX_RULE_CHARS], section
+            end = offset + sum(len(lines[index + number]) for number in range(consumed))
+            self.replacements.append((offset, end, f"[{rule.identifier} : voir l'inventaire]\n"))
+            self.scan(lines[index], offset)
+            for number in range(1, consumed):
+                self.scan(lines[index + number], offset)
+            return consumed
+        match = _GLOSSARY_LINE_RE.match(line)
+        # La ligne n'est retirée du CDC que si le développement correspond au sigle
+        if match and _is_acronym(match.group("short")) \
+                and _matches_initials(match.group("short"), match.group("text")):
+            self.define_acronym(match.group("short"), match.group("text").strip())
+            entry = self.acronym(match.group("short"))
+            entry.occurrences += 1
+            page = self.page(offset)
+            if page and page not in entry.pages:
+                entry.pages.append(page)
+            end = offset + len(lines[index])
+            self.replacements.append((offset, end, f"[{match.group('short')} : voir l'inventaire]\n"))
+            return 1
+        return 0
+
+    def table(self, lines, start, end, section):
+        rows = [_split_row(line) for line in lines if not _TABLE_SEPARATOR_RE.match(line.strip())]
+        has_header = len(lines) > 1 and bool(_TABLE_SEPARATOR_RE.match(lines[1].strip()))
+        header = rows[0] if has_header else []
+        body = rows[1:] if has_header else rows
+        folded_header = [fold(cell) for cell in header]
+        page = self.page(start)
+        kind = "other"
+        if body and folded_header and any(word in folded_header[0] for word in _GLOSSARY_HEADERS) \
+                and all(len(row) >= 2 for row in body):
+            kind = "glossary"
+            for row in body:
+                short, definition = row[0].strip("* "), " ".join(cell for cell in row[1:] if cell)
+                entry = self.acronym(short)
+                entry.expansion = entry.expansion or definition
+                entry.occurrences += 1
+                if page and page not in entry.pages:
+                    entry.pages.append(page)
+        elif body and all(row and _RULE_ID_RE.fullmatch(row[0].strip("* ")) for row in body):
+            kind = "rules"
+            for row in body:
+                rule = self.rule(row[0].strip("* "))
+                rule.occurrences += 1
+                if page and page not in rule.pages:
+                    rule.pages.append(page)
+                if rule.text:
+                    continue
+                cells = [(header[number] if number < len(header) else "", value)
+                         for number, value in enumerate(row) if number and value]
+                if not cells:
+                    continue
+                # Le libellé est la cellule la plus longue ; les autres en sont des compléments
+                main = max(cells, key=lambda cell: len(cell[1]))
+                details = [f"{name} : {value}" if name else value for name, value in cells if (name, value) != main]
+                rule.text = main[1] + (f" ({' ; '.join(details)})" if details else "")
+                rule.section = section
+        else:
+            offset = start
+            for line in lines:
+                self.scan(line, offset)
+                offset += len(line)
+        self.tables.append(TableBlock(header=header, rows=len(body), page=page, kind=kind))
+        if kind == "glossary":
+            self.replacements.append((start, end, "[Glossaire : voir l'inventaire]\n"))
+        elif kind == "rules":
+            identifiers = [_normalize_id(row[0].strip("* ")) for row in body]
+            self.replacements.append((start, end, f"[Règles {_span(identifiers)} : voir l'inventaire]\n"))
+
+
+def _compact(text, page_offsets, replacements):
+    """Applique les remplacements au texte et recale les débuts de pages"""
+    parts = []
+    shifts = []
+    position = 0
+    for start, end, replacement in sorted(replacements):
+        if start < position:
+            continue
+        parts.append(text[position:start])
+        parts.append(replacement)
+        shifts.append((start, end, (end - start) - len(replacement)))
+        position = end
+    parts.append(text[position:])
+    if not page_offsets:
+        return "".join(parts), page_offsets
+    offsets = []
+    for offset in page_offsets:
+        removed = 0
+        for start, end, delta in shifts:
+            if end <= offset:
+                removed += delta
+            elif start < offset:
+                # Page commencée au milieu d'un passage remplacé : elle commence à son renvoi
+                offset = start
+                break
+            else:
+                break
+        offsets.append(max(0, offset - removed))
+    return "".join(parts), offsets
+
+
+@dataclass
+class CdcInventory:
+    """Résultat de la pré-extraction d'un CDC
+
+    text et page_offsets sont ceux du CDC à envoyer au modèle, où les passages
+    relevés sont remplacés par un renvoi à l'inventaire.
+    """
+    acronyms: dict
+    rules: dict
+    requirements: dict
+    tables: list
+    text: str
+    page_offsets: list = None
+    source_chars: int = 0
+    seconds: float = 0.0
+
+    @property
+    def glossary(self):
+        """Sigles retenus pour la section 1.4, par ordre alphabétique"""
+        return sorted(
+            (entry for entry in self.acronyms.values()
+             if entry.expansion or entry.occurrences >= MIN_ACRONYM_OCCURRENCES),
+            key=lambda entry: entry.short.lower()
+        )
+
+    def __bool__(self):
+        return bool(self.rules or self.glossary or self.requirements)
+
+    def summary(self):
+        """Inventaire compact à intégrer au prompt, en lieu et place des passages relevés"""
+        lines = []
+        glossary = self.glossary
+        if glossary:
+            lines.append(f"Sigles et termes ({len(glossary)}) :")
+            lines.extend(f"- {entry.short} : {entry.expansion or 'non défini dans le CDC'}" for entry in glossary)
+        # Les renvois du CDC situent déjà chaque règle : l'inventaire regroupe les identifiants par libellé
+        by_text = defaultdict(list)
+        for rule in self.rules.values():
+            if rule.text:
+                by_text[rule.text].append(rule.identifier)
+        if by_text:
+            lines.append(f"\nRègles de gestion ({sum(map(len, by_text.values()))}) :")
+            lines.extend(f"- {', '.join(identifiers)} : {text}" for text, identifiers in by_text.items())
+        mentioned = [rule.identifier for rule in self.rules.values() if not rule.text]
+        if mentioned:
+            lines.append(f"\nRègles citées sans définition dans le CDC : {', '.join(mentioned)}")
+        if self.requirements:
+            # Les exigences restent dans le CDC, à leur place : l'inventaire n'en donne que l'étendue par section
+            by_section = defaultdict(list)
+            for requirement in self.requirements.values():
+                by_section[requirement.section].append(requirement.identifier)
+            lines.append(f"\nExigences numérotées ({len(self.requirements)}), définies dans le CDC :")
+            lines.extend(
+                f"- {section or 'Sans section'} : {_span(identifiers)}" for section, identifiers in by_section.items()
+            )
+        return "\n".join(lines).strip()
+
+    def glossary_table(self):
+        """Tableau markdown de la section 1.4"""
+        if not self.glossary:
+            return "Aucun sigle ni terme spécifique relevé dans le CDC."
+        lines = ["| Sigle / terme | Définition |", "|---|---|"]
+        lines.extend(
+            f"| {_cell(entry.short)} | {_cell(entry.expansion or 'Non défini dans le CDC')} |"
+            for entry in self.glossary
+        )
+        return "\n".join(lines)
+
+    def rules_table(self):
+        """Tableau markdown de la section 5"""
+        if not self.rules:
+            return "Aucune règle de gestion identifiée (RG-xxx) dans le CDC."
+        lines = ["| Identifiant | Règle de gestion | Section du CDC | Source |", "|---|---|---|---|"]
+        lines.extend(
+            f"| {rule.identifier} | {_cell(rule.text or 'Citée sans définition dans le CDC')} | "
+            f"{_cell(rule.section)} | {_cell(_page_range(rule.pages))} |"
+            for rule in self.rules.values()
+        )
+        return "\n".join(lines)
+
+    def complete_dcf(self, dcf):
+        """Insère les tableaux des sections 1.4 et 5 dans le DCF rédigé par le modèle"""
+        dcf = _fill_section(
+            dcf, "1.4", ("terminologie", "sigle"), "1.4. Terminologie et sigles", self.glossary_table(), before="2"
+        )
+        return _fill_section(
+            dcf, "5", ("recapitulatif", "regles de gestion"), "### 5. RECAPITULATIF DES REGLES DE GESTION",
+            self.rules_table(), before="6"
+        )
+
+    def stats(self):
+        return {
+            "acronyms": len(self.glossary),
+            "rules": len(self.rules),
+            "requirements": len(self.requirements),
+            "tables": len(self.tables),
+            "removed_chars": self.source_chars - len(self.text),
+            "ms": self.seconds * 1000
+        }
+
+
+def _find_heading(lines, number, keywords=None, start=0):
+    for index in range(start, len(lines)):
+        match = _HEADING_LINE_RE.match(lines[index])
+        if match and match.group("number") == number:
+            if keywords is None or any(word in fold(lines[index]) for word in keywords):
+                return index
+    return None
+
+
+def _fill_section(dcf, number, keywords, title, body, before):
+    """Remplace le contenu de la section number du DCF par body, ou l'ajoute avant la section before"""
+    lines = dcf.splitlines()
+    heading = _find_heading(lines, number, keywords)
+    if heading is not None:
+        end = heading + 1
+        while end < len(lines) and not _is_dcf_heading(lines[end]):
+            end += 1
+        return "\n".join(lines[:heading + 1] + ["", body, ""] + lines[end:]).strip() + "\n"
+    following = _find_heading(lines, before)
+    block = [title, "", body, ""]
+    if following is not None:
+        return "\n".join(lines[:following] + block + lines[following:]).strip() + "\n"
+    return "\n".join(lines + [""] + block).strip() + "\n"
+
+
+def _is_dcf_heading(line):
+    """Titre de section ou de sous-section du DCF (et non élément de liste numérotée)"""
+    if line.lstrip().startswith("#"):
+        return True
+    match = _HEADING_LINE_RE.match(line)
+    if not match:
+        return False
+    if "." in match.group("number") or line.lstrip().startswith("**"):
+        return True
+    letters = [char for char in line if char.isalpha()]
+    return bool(letters) and all(char.isupper() for char in letters)
+
+
+def analyze_cdc(text, page_offsets=None):
+    """Relève sigles, règles de gestion, exigences et tableaux du CDC ; renvoie un CdcInventory"""
+    start = time.perf_counter()
+    analyzer = _Analyzer(text, page_offsets)
+    analyzer.run()
+    compact_text, compact_offsets = _compact(text, page_offsets, analyzer.replacements)
+    return CdcInventory(
+        acronyms=analyzer.acronyms,
+        rules=analyzer.rules,
+        requirements=analyzer.requirements,
+        tables=analyzer.tables,
+        text=compact_text,
+        page_offsets=compact_offsets,
+        source_chars=len(text),
+        seconds=time.perf_counter() - start
+    )
@@ -0,0 +1,407 @@
+"""File de travaux de génération, persistée dans SQLite et exécutée en arrière-plan
+
+Une génération soumise reçoit un identifiant ; elle est exécutée par un pool
+de threads du processus serveur, indépendamment des exécutions du script
+Streamlit. L'état, la progression et le résultat sont enregistrés dans la
+base : ils survivent aux relances du script et aux rechargements de page,
+et peuvent être consultés depuis n'importe quelle session avec l'identifiant.
+
+La clé API n'est jamais écrite sur disque : elle reste en mémoire dans le
+processus qui a reçu le travail, seul habilité à l'exécuter. Les travaux
+d'un processus arrêté sont marqués en échec au démarrage suivant.
+"""
+
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from contextlib import closing
+from dataclasses import dataclass
+
+from .cache import DEFAULT_CACHE_DIR
+from .llm import TokenUsage
+from .memo import content_hash
+from .pipeline import generate_dcf
+from .prompts import PROMPT_VERSION
+from .router import Route, get_router
+from .timing import StageTimer
+
+DEFAULT_DB_PATH = os.environ.get("DCF_JOBS_DB", os.path.join(DEFAULT_CACHE_DIR, "jobs.sqlite3"))
+DEFAULT_CONCURRENCY = int(os.environ.get("DCF_JOB_WORKERS", "4"))
+# Durée de conservation des travaux terminés
+RETENTION_SECONDS = 7 * 24 * 3600
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+STATUS_LABELS = {
+    QUEUED: "En attente",
+    RUNNING: "En cours",
+    DONE: "Terminé",
+    FAILED: "En échec",
+    CANCELLED: "Annulé"
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    file_name TEXT,
+    params TEXT NOT NULL,
+    cdc_text BLOB NOT NULL,
+    page_offsets TEXT,
+    progress TEXT,
+    result BLOB,
+    error TEXT,
+    stages TEXT,
+    tokens TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_owner_status ON jobs (owner, status, created_at);
+"""
+
+
+@dataclass
+class Job:
+    """État d'un travail de génération"""
+    id: str
+    status: str
+    file_name: str
+    params: dict
+    progress: str
+    result: str
+    error: str
+    stages: dict
+    tokens: dict
+    created_at: float
+    started_at: float
+    finished_at: float
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED, CANCELLED)
+
+
+def _process_owner():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobStore:
+    """Accès à la table des travaux (une connexion SQLite par opération, mode WAL)"""
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def submit(self, owner, file_name, cdc_text, params, page_offsets=None, job_id=None):
+        job_id = job_id or uuid.uuid4().hex
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, owner, file_name, params, cdc_text, page_offsets, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job_id, QUEUED, owner, file_name, json.dumps(params),
+                    zlib.compress(cdc_text.encode("utf-8")),
+                    json.dumps(page_offsets) if page_offsets else None,
+                    time.time()
+                )
+            )
+        return job_id
+
+    def claim_next(self, owner):
+        """Passe le plus ancien travail en attente du processus à l'état "en cours" et le renvoie"""
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT id, file_name, params, cdc_text, page_offsets FROM jobs "
+                    "WHERE owner = ? AND status = ? ORDER BY created_at LIMIT 1",
+                    (owner, QUEUED)
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET status = ?, started_at = ? WHERE id = ?",
+                    (RUNNING, time.time(), row[0])
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        job_id, file_name, params, cdc_text, page_offsets = row
+        return {
+            "id": job_id,
+            "file_name": file_name,
+            "params": json.loads(params),
+            "cdc_text": zlib.decompress(cdc_text).decode("utf-8"),
+            "page_offsets": json.loads(page_offsets) if page_offsets else None
+        }
+
+    def set_progress(self, job_id, progress):
+        with closing(self._connect()) as conn:
+            conn.execute("UPDATE jobs SET progress = ? WHERE id = ?", (progress, job_id))
+
+    def finish(self, job_id, result, stages, tokens):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, stages = ?, tokens = ?, progress = NULL, finished_at = ? "
+                "WHERE id = ?",
+                (DONE, zlib.compress(result.encode("utf-8")), json.dumps(stages), json.dumps(tokens),
+                 time.time(), job_id)
+            )
+
+    def fail(self, job_id, error, stages=None, tokens=None):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, stages = ?, tokens = ?, progress = NULL, finished_at = ? "
+                "WHERE id = ?",
+                (FAILED, error, json.dumps(stages) if stages else None, json.dumps(tokens) if tokens else None,
+                 time.time(), job_id)
+            )
+
+    def cancel(self, job_id):
+        """Annule un travail encore en attente ; renvoie False s'il a déjà démarré"""
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ?",
+                (CANCELLED, time.time(), job_id, QUEUED)
+            )
+            return cursor.rowcount == 1
+
+    def get(self, job_id):
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT id, status, file_name, params, progress, result, error, stages, tokens, "
+                "created_at, started_at, finished_at FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        (job_id, status, file_name, params, progress, result, error, stages, tokens,
+         created_at, started_at, finished_at) = row
+        return Job(
+            id=job_id,
+            status=status,
+            file_name=file_name,
+            params=json.loads(params),
+            progress=progress,
+            result=zlib.decompress(result).decode("utf-8") if result else None,
+            error=error,
+            stages=json.loads(stages) if stages else {},
+            tokens=json.loads(tokens) if tokens else {},
+            created_at=created_at,
+            started_at=started_at,
+            finished_at=finished_at
+        )
+
+    def counts(self, owner=None):
+        """Renvoie le nombre de travaux par état (pour un processus donné ou pour tous)"""
+        query = "SELECT status, COUNT(*) FROM jobs"
+        args = ()
+        if owner:
+            query += " WHERE owner = ?"
+            args = (owner,)
+        with closing(self._connect()) as conn:
+            return dict(conn.execute(query + " GROUP BY status", args).fetchall())
+
+    def recover_orphans(self):
+        """Marque en échec les travaux non terminés des processus arrêtés de cette machine"""
+        host = socket.gethostname()
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT DISTINCT owner FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)
+            ).fetchall()
+            for (owner,) in rows:
+                owner_host, _, pid = owner.rpartition(":")
+                if owner_host != host or not pid.isdigit() or int(pid) == os.getpid() or _pid_alive(int(pid)):
+                    continue
+                conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE owner = ? AND status IN (?, ?)",
+                    (FAILED, "Travail interrompu par un redémarrage du serveur.", time.time(), owner,
+                     QUEUED, RUNNING)
+                )
+
+    def purge(self, older_than=RETENTION_SECONDS):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?",
+                (time.time() - older_than,)
+            )
+
+
+class JobQueue:
+    """Pool de threads qui exécute les travaux soumis par ce processus
+
+    Avec history (dcf.history.HistoryStore), chaque DCF généré y est aussi enregistré.
+    """
+
+    def __init__(self, store, concurrency=DEFAULT_CONCURRENCY, cache=None, history=None):
+        self.store = store
+        self.concurrency = concurrency
+        self.cache = cache
+        self.history = history
+        self.owner = _process_owner()
+        self._secrets = {}
+        # Nombre de soumissions : un thread qui n'a rien trouvé ne s'endort pas si une soumission l'a suivi
+        self._submissions = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._threads = []
+
+    def start(self):
+        self.store.recover_orphans()
+        self.store.purge()
+        for number in range(self.concurrency):
+            thread = threading.Thread(target=self._worker, name=f"dcf-job-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def submit(self, file_name, cdc_text, api_key, endpoint, deployment, page_offsets=None,
+               chunked=True, max_workers=None, read_cache=True, incremental=False, routes=None, hedge_after=None,
+               retrieval=False, structured=False, pre_extract=False):
+        """Met une génération en file d'attente et renvoie l'identifiant du travail
+
+        routes (liste de dcf.router.Route) répartit les requêtes sur plusieurs
+        déploiements, avec une requête de secours après hedge_after secondes.
+        """
+        params = {
+            "endpoint": endpoint, "deployment": deployment, "chunked": chunked, "read_cache": read_cache,
+            "incremental": incremental, "retrieval": retrieval, "structured": structured,
+            "pre_extract": pre_extract
+        }
+        if max_workers:
+            params["max_workers"] = max_workers
+        if routes:
+            params["routes"] = [[route.endpoint, route.deployment, route.weight] for route in routes]
+            params["hedge_after"] = hedge_after
+        # La clé est connue avant que le travail ne soit visible des threads ;
+        # l'écriture dans la base se fait hors du verrou
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._secrets[job_id] = api_key
+        try:
+            self.store.submit(self.owner, file_name, cdc_text, params, page_offsets, job_id=job_id)
+        except BaseException:
+            with self._lock:
+                self._secrets.pop(job_id, None)
+            raise
+        with self._lock:
+            self._submissions += 1
+            self._wakeup.notify()
+        return job_id
+
+    def cancel(self, job_id):
+        cancelled = self.store.cancel(job_id)
+        if cancelled:
+            with self._lock:
+                self._secrets.pop(job_id, None)
+        return cancelled
+
+    def stats(self):
+        counts = self.store.counts(self.owner)
+        return {
+            "queued": counts.get(QUEUED, 0),
+            "running": counts.get(RUNNING, 0),
+            "concurrency": self.concurrency
+        }
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                submissions = self._submissions
+            # La transaction de la base (qui peut attendre un autre processus) se fait hors du verrou
+            job = self.store.claim_next(self.owner)
+            if job is None:
+                with self._lock:
+                    if self._submissions == submissions:
+                        # Réveil sur soumission, avec un filet de sécurité périodique
+                        self._wakeup.wait(timeout=5)
+                continue
+            with self._lock:
+                api_key = self._secrets.pop(job["id"], None)
+            self._run(job, api_key)
+
+    def _run(self, job, api_key):
+        params = job["params"]
+        timer = StageTimer(
+            job_id=job["id"], file_name=job["file_name"], deployment=params["deployment"]
+        )
+        usage = TokenUsage()
+        labels = {
+            "map": "Analyse des segments", "merge": "Fusion des analyses", "reduce": "Rédaction du DCF",
+            "outline": "Plan du DCF", "sections": "Rédaction des sections"
+        }
+
+        def on_progress(phase, done, total):
+            self.store.set_progress(job["id"], f"{labels.get(phase, phase)} {done}/{total}")
+
+        if api_key is None:
+            self.store.fail(job["id"], "Clé API indisponible : le travail doit être soumis à nouveau.")
+            return
+        try:
+            kwargs = {"max_workers": params["max_workers"]} if "max_workers" in params else {}
+            if params.get("routes"):
+                kwargs["router"] = get_router(
+                    [Route(*route) for route in params["routes"]], api_key, params.get("hedge_after")
+                )
+            dcf, _ = generate_dcf(
+                job["cdc_text"], api_key, params["endpoint"], params["deployment"],
+                page_offsets=job["page_offsets"], chunked=params.get("chunked", True),
+                cache=self.cache, read_cache=params.get("read_cache", True), timer=timer, usage=usage,
+                on_progress=on_progress, incremental=params.get("incremental", False), lineage=job["file_name"],
+                retrieval=params.get("retrieval", False), structured=params.get("structured", False),
+                pre_extract=params.get("pre_extract", False), **kwargs
+            )
+        except Exception as e:
+            timer.metadata["outcome"] = "error"
+            self.store.fail(job["id"], f"{type(e).__name__}: {e}", timer.as_dict(), usage.as_dict())
+        else:
+            timer.metadata["outcome"] = "ok"
+            self.store.finish(job["id"], dcf, timer.as_dict(), usage.as_dict())
+            if self.history is not None:
+                try:
+                    self.history.add(
+                        job["file_name"], content_hash(job["cdc_text"]), params["deployment"], PROMPT_VERSION, dcf,
+                        mode=timer.metadata.get("mode"), stages=timer.as_dict(), tokens=usage.as_dict(),
+                        cdc_chars=len(job["cdc_text"])
+                    )
+                except Exception:
+                    # Le DCF reste disponible dans la table des travaux
+                    logger.exception("Travail %s non enregistré dans l'historique", job["id"])
+        finally:
+            timer.write_jsonl()
@@ -0,0 +1,358 @@
+"""Appels à l'API Azure OpenAI
+
+Le SDK openai est long à importer (près d'une seconde) : il n'est chargé
+qu'au premier appel au modèle, pas à l'import de ce module.
+"""
+
+import hashlib
+import os
+import random
+import threading
+import time
+
+from .chunking import estimate_tokens
+
+API_VERSION = "2024-02-15-preview"
+# Première version GA de l'API qui accepte un schéma JSON dans response_format
+STRUCTURED_OUTPUTS_API_VERSION = "2024-10-21"
+SYSTEM_PROMPT = "Tu es un expert en conception de systèmes logiciels."
+DEFAULT_TEMPERATURE = 0.3
+DEFAULT_ENDPOINT = "https://chat-genai.openai.azure.com/"
+DEFAULT_DEPLOYMENT = "gpt-4o"
+
+MAX_RETRIES = 6
+BASE_BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 60.0
+# Réservation de quota pour la réponse, corrigée avec l'usage réel après l'appel
+EXPECTED_COMPLETION_TOKENS = 4000
+
+
+def retryable_errors():
+    """Erreurs transitoires de l'API (quota, réseau, délai dépassé, erreur 5xx), à réessayer"""
+    from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+    return RateLimitError, APITimeoutError, APIConnectionError, InternalServerError
+
+
+class TokenUsage:
+    """Cumule la consommation de tokens de plusieurs requêtes, éventuellement concurrentes"""
+
+    def __init__(self):
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def add(self, usage):
+        """Ajoute l'usage (CompletionUsage) d'une réponse de l'API"""
+        if usage is None:
+            return
+        self.record(usage.prompt_tokens or 0, usage.completion_tokens or 0)
+
+    def record(self, prompt_tokens, completion_tokens):
+        """Ajoute une requête dont les tokens sont connus autrement (estimation, streaming)"""
+        with self._lock:
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.requests += 1
+
+    @property
+    def total_tokens(self):
+        return self.prompt_tokens + self.completion_tokens
+
+    def as_dict(self):
+        return {
+            "requests": self.requests,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.total_tokens
+        }
+
+
+class RateLimiter:
+    """Limiteur à double seau de jetons (requêtes/min et tokens/min) partagé par les threads
+
+    Les appelants attendent leur tour au lieu d'essuyer des erreurs 429 : le
+    quota se reconstitue en continu, et un Retry-After renvoyé par Azure
+    suspend toutes les requêtes du déploiement pendant la durée indiquée.
+    """
+
+    def __init__(self, rpm=None, tpm=None):
+        self._cond = threading.Condition()
+        self._paused_until = 0.0
+        self.configure(rpm, tpm)
+
+    def configure(self, rpm=None, tpm=None):
+        with self._cond:
+            self.rpm = rpm or None
+            self.tpm = tpm or None
+            # Azure applique le quota de requêtes sur des fenêtres d'environ 10 s
+            self._request_capacity = max(1.0, self.rpm / 6) if self.rpm else None
+            self._token_capacity = float(self.tpm) if self.tpm else None
+            self._requests = self._request_capacity
+            self._tokens = self._token_capacity
+            self._updated_at = time.monotonic()
+            self._cond.notify_all()
+
+    def _refill(self, now):
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        if self.rpm:
+            self._requests = min(self._request_capacity, self._requests + elapsed * self.rpm / 60)
+        if self.tpm:
+            self._tokens = min(self._token_capacity, self._tokens + elapsed * self.tpm / 60)
+
+    def _take(self, tokens):
+        # Appelé verrou pris : consomme le quota et renvoie 0, ou renvoie l'attente nécessaire
+        now = time.monotonic()
+        self._refill(now)
+        wait = self._paused_until - now
+        if wait > 0:
+            return wait
+        # Une requête plus grosse que le seau passe dès qu'il est plein
+        needed = min(tokens, self._token_capacity) if self.tpm else 0
+        request_wait = (1 - self._requests) * 60 / self.rpm if self.rpm else 0
+        token_wait = (needed - self._tokens) * 60 / self.tpm if self.tpm else 0
+        wait = max(request_wait, token_wait)
+        if wait > 0:
+            return wait
+        if self.rpm:
+            self._requests -= 1
+        if self.tpm:
+            self._tokens -= needed
+        return 0.0
+
+    def acquire(self, tokens):
+        """Bloque jusqu'à ce que la requête tienne dans le quota ; renvoie le temps d'attente"""
+        start = time.monotonic()
+        with self._cond:
+            while True:
+                wait = self._take(tokens)
+                if wait <= 0:
+                    return time.monotonic() - start
+                self._cond.wait(wait)
+
+    def try_acquire(self, tokens):
+        """Version non bloquante d'acquire : réserve le quota et renvoie 0, ou renvoie l'attente à prévoir
+
+        Permet d'attendre sans bloquer de thread (voir dcf.aio).
+        """
+        with self._cond:
+            return self._take(tokens)
+
+    def settle(self, estimated, actual):
+        """Corrige le seau de tokens avec la consommation réelle d'une requête"""
+        if not self.tpm or actual is None:
+            return
+        with self._cond:
+            self._tokens = min(self._token_capacity, self._tokens + estimated - actual)
+            self._cond.notify_all()
+
+    def pause(self, seconds):
+        """Suspend toutes les requêtes pendant la durée indiquée (Retry-After)"""
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+_pool_lock = threading.Lock()
+_clients = {}
+_limiters = {}
+
+
+def get_client(api_key, endpoint, api_version=API_VERSION):
+    """Renvoie le client AzureOpenAI partagé du processus pour ce endpoint et cette version d'API
+
+    Le client conserve ses connexions HTTP ouvertes (keep-alive) : les appels
+    suivants évitent la connexion TCP et la négociation TLS. Les nouvelles
+    tentatives sont gérées ici (voir call_with_retries), pas par le SDK.
+    """
+    key = (endpoint, api_version, hashlib.sha256(api_key.encode("utf-8")).hexdigest())
+    with _pool_lock:
+        client = _clients.get(key)
+        if client is None:
+            from openai import AzureOpenAI
+            client = _clients[key] = AzureOpenAI(
+                api_key=api_key,
+                api_version=api_version,
+                azure_endpoint=endpoint,
+                max_retries=0
+            )
+        return client
+
+
+def get_rate_limiter(endpoint, deployment):
+    """Renvoie le limiteur partagé d'un déploiement (sans limite tant qu'il n'est pas configuré)"""
+    key = (endpoint, deployment)
+    with _pool_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = _limiters[key] = RateLimiter(
+                rpm=int(os.environ.get("AZURE_OPENAI_RPM", "0")),
+                tpm=int(os.environ.get("AZURE_OPENAI_TPM", "0"))
+            )
+        return limiter
+
+
+def configure_rate_limit(endpoint, deployment, rpm=None, tpm=None):
+    """Déclare le quota (requêtes et tokens par minute) d'un déploiement ; 0 ou None = illimité"""
+    limiter = get_rate_limiter(endpoint, deployment)
+    if (limiter.rpm, limiter.tpm) != (rpm or None, tpm or None):
+        limiter.configure(rpm, tpm)
+    return limiter
+
+
+def _retry_after(error):
+    """Lit le délai demandé par Azure dans les en-têtes d'une réponse d'erreur"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(name)
+        if value:
+            try:
+                return float(value) * scale
+            except ValueError:
+                continue
+    return None
+
+
+def _backoff(attempt):
+    # Backoff exponentiel avec "full jitter"
+    return random.uniform(0, min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * 2 ** attempt))
+
+
+def call_with_retries(send, endpoint, deployment, estimated_tokens, max_retries=MAX_RETRIES):
+    """Exécute send() en respectant le quota du déploiement et en réessayant les erreurs transitoires
+
+    Les erreurs 429 suspendent le limiteur du déploiement pendant le délai
+    Retry-After (toutes les requêtes concurrentes patientent alors) ; les
+    erreurs réseau, les délais dépassés et les erreurs 5xx sont réessayés
+    avec un backoff exponentiel. Les autres erreurs sont propagées aussitôt.
+    """
+    from openai import RateLimitError
+
+    limiter = get_rate_limiter(endpoint, deployment)
+    for attempt in range(max_retries + 1):
+        limiter.acquire(estimated_tokens)
+        try:
+            return send()
+        except retryable_errors() as e:
+            if attempt == max_retries:
+                raise
+            delay = _retry_after(e)
+            if isinstance(e, RateLimitError):
+                limiter.pause(delay if delay is not None else _backoff(attempt))
+            else:
+                time.sleep(delay if delay is not None else _backoff(attempt))
+
+
+def _estimate_request_tokens(prompt):
+    return estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(prompt) + EXPECTED_COMPLETION_TOKENS
+
+
+def _messages(prompt):
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def complete(prompt, api_key, endpoint, deployment, temperature=DEFAULT_TEMPERATURE, usage=None,
+             response_format=None):
+    """Envoie le prompt au déploiement Azure OpenAI et renvoie le texte généré
+
+    Les erreurs de l'API sont propagées telles quelles : c'est à l'appelant
+    de décider comment les présenter (Streamlit, ligne de commande...).
+    La consommation de tokens est ajoutée à usage (TokenUsage) s'il est fourni.
+    response_format impose la forme de la réponse (objet JSON, schéma JSON),
+    voir dcf.structured.
+    """
+    if response_format is None:
+        client = get_client(api_key, endpoint)
+    else:
+        client = get_client(api_key, endpoint, STRUCTURED_OUTPUTS_API_VERSION)
+    estimated = _estimate_request_tokens(prompt)
+    options = {"response_format": response_format} if response_format is not None else {}
+    response = call_with_retries(
+        lambda: client.chat.completions.create(
+            model=deployment,
+            messages=_messages(prompt),
+            temperature=temperature,
+            **options
+        ),
+        endpoint, deployment, estimated
+    )
+    if response.usage is not None:
+        get_rate_limiter(endpoint, deployment).settle(estimated, response.usage.total_tokens)
+    if usage is not None:
+        usage.add(response.usage)
+    return response.choices[0].message.content
+
+
+def stream_complete(prompt, api_key, endpoint, deployment, temperature=DEFAULT_TEMPERATURE):
+    """Génère le texte en streaming et produit les fragments au fur et à mesure
+
+    Fermer le générateur (generator.close(), contextlib.closing ou arrêt du
+    script Streamlit) ferme la connexion HTTP, ce qui interrompt la génération
+    côté Azure au lieu de la laisser se terminer en arrière-plan. Seule
+    l'ouverture du flux est réessayée : une coupure en cours de génération
+    est propagée.
+    """
+    client = get_client(api_key, endpoint)
+    stream = call_with_retries(
+        lambda: client.chat.completions.create(
+            model=deployment,
+            messages=_messages(prompt),
+            temperature=temperature,
+            stream=True
+        ),
+        endpoint, deployment, _estimate_request_tokens(prompt)
+    )
+    try:
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+    finally:
+        stream.close()
+
+
+class StreamStats:
+    """Mesure le temps jusqu'au premier token et le débit d'une génération en streaming
+
+    Azure envoie en pratique un token par fragment : le nombre de fragments
+    sert donc d'estimation du nombre de tokens générés.
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.first_token_at = None
+        self.last_token_at = None
+        self.tokens = 0
+        self.chars = 0
+
+    def record(self, delta):
+        now = time.perf_counter()
+        if self.first_token_at is None:
+            self.first_token_at = now
+        self.last_token_at = now
+        self.tokens += 1
+        self.chars += len(delta)
+
+    @property
+    def time_to_first_token(self):
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.started_at
+
+    @property
+    def elapsed(self):
+        return (self.last_token_at or time.perf_counter()) - self.started_at
+
+    @property
+    def tokens_per_second(self):
+        if self.first_token_at is None or self.last_token_at == self.first_token_at:
+            return 0.0
+        return (self.tokens - 1) / (self.last_token_at - self.first_token_at)
@@ -0,0 +1,185 @@
+"""Génération du DCF en map-reduce pour les CDC trop longs pour une seule requête
+
+Le CDC est découpé en segments (voir dcf.chunking), chaque segment est analysé
+en parallèle (phase map), puis un dernier appel assemble le DCF à partir des
+notes obtenues (phase reduce). La durée dépend du nombre de vagues de requêtes
+parallèles, et non plus de la longueur du document.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from dataclasses import dataclass
+
+from .chunking import DEFAULT_SEGMENT_TOKENS, estimate_tokens, page_at, split_into_segments
+from .prompts import generate_map_prompt, generate_merge_prompt, generate_reduce_prompt
+
+DEFAULT_MAX_WORKERS = 4
+# Volume maximal de notes envoyé à l'appel final ; au-delà, fusion par paliers
+REDUCE_INPUT_TOKENS = 60000
+
+
+@dataclass
+class MapReduceResult:
+    """Résultat d'une génération map-reduce"""
+    dcf: str
+    segments: list
+    extractions: list
+    reduce_prompt: str
+    merge_rounds: int = 0
+
+
+def run_parallel(prompts, complete, max_workers=DEFAULT_MAX_WORKERS, on_done=None, timer=None):
+    """Exécute complete(prompt) pour chaque prompt dans un pool de threads
+
+    Les résultats sont renvoyés dans l'ordre des prompts. on_done est appelé
+    dans le thread appelant à chaque requête terminée, ce qui permet de mettre
+    à jour l'interface. À la première erreur, les requêtes non démarrées sont
+    annulées et l'exception est propagée. Si un StageTimer est fourni, le temps
+    passé par chaque requête à attendre un thread libre y est cumulé ("queue").
+    """
+    def run(prompt, submitted_at):
+        if timer:
+            timer.record("queue", time.perf_counter() - submitted_at)
+        return complete(prompt)
+
+    results = [None] * len(prompts)
+    pool = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    try:
+        futures = {
+            pool.submit(run, prompt, time.perf_counter()): i for i, prompt in enumerate(prompts)
+        }
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+            if on_done:
+                on_done()
+    except BaseException:
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    pool.shutdown()
+    return results
+
+
+def _group_by_budget(texts, max_tokens):
+    """Regroupe des textes consécutifs tant que leur total reste dans le budget"""
+    groups = [[]]
+    used = 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if groups[-1] and used + tokens > max_tokens:
+            groups.append([])
+            used = 0
+        groups[-1].append(text)
+        used += tokens
+    return groups
+
+
+def _segment_label(segment, total, page_offsets=None):
+    label = f"Extrait {segment.index + 1}/{total}"
+    if page_offsets:
+        first = page_at(page_offsets, segment.start)
+        last = page_at(page_offsets, max(segment.start, segment.end - 1))
+        label += f", page {first}" if first == last else f", pages {first} à {last}"
+    return label
+
+
+def map_reduce_steps(cdc_text, segment_tokens=DEFAULT_SEGMENT_TOKENS, page_offsets=None):
+    """Déroulé d'une génération map-reduce, indépendant de la façon d'envoyer les requêtes
+
+    Générateur qui produit des couples (phase, prompts) et reçoit par send()
+    les réponses, dans l'ordre des prompts ; la phase "reduce" n'a qu'un
+    prompt. Sa valeur de retour (StopIteration.value) est le MapReduceResult.
+    Il est parcouru par generate_dcf_map_reduce avec un pool de threads et par
+    dcf.aio.agenerate_dcf_map_reduce sur une boucle d'événements.
+    """
+    segments = split_into_segments(cdc_text, segment_tokens)
+    if not segments:
+        raise ValueError("Le CDC ne contient aucun texte exploitable.")
+
+    total = len(segments)
+    extractions = yield "map", [
+        generate_map_prompt(segment.text, segment.index + 1, total) for segment in segments
+    ]
+    extractions = [
+        f"[{_segment_label(segment, total, page_offsets)}]\n{extraction}"
+        for segment, extraction in zip(segments, extractions)
+    ]
+
+    # Les notes ne tiennent pas dans l'appel final : fusion parallèle par paliers,
+    # tant que chaque palier réduit le nombre de notes
+    notes = extractions
+    merge_rounds = 0
+    groups = _group_by_budget(notes, REDUCE_INPUT_TOKENS)
+    while 1 < len(groups) < len(notes):
+        notes = yield "merge", [generate_merge_prompt(group) for group in groups]
+        merge_rounds += 1
+        groups = _group_by_budget(notes, REDUCE_INPUT_TOKENS)
+
+    # Notes trop longues pour être regroupées : l'appel final serait refusé par l'API
+    notes_tokens = sum(estimate_tokens(note) for note in notes)
+    if notes_tokens > REDUCE_INPUT_TOKENS:
+        raise ValueError(
+            f"Les notes d'analyse du CDC ({notes_tokens} tokens après {merge_rounds} fusion(s)) dépassent "
+            f"le volume accepté par la rédaction du DCF ({REDUCE_INPUT_TOKENS} tokens)."
+        )
+
+    reduce_prompt = generate_reduce_prompt(notes)
+    dcf, = yield "reduce", [reduce_prompt]
+
+    return MapReduceResult(
+        dcf=dcf,
+        segments=segments,
+        extractions=extractions,
+        reduce_prompt=reduce_prompt,
+        merge_rounds=merge_rounds
+    )
+
+
+def generate_dcf_map_reduce(cdc_text, complete, max_workers=DEFAULT_MAX_WORKERS,
+                            segment_tokens=DEFAULT_SEGMENT_TOKENS, on_progress=None,
+                            reduce_complete=None, timer=None, page_offsets=None):
+    """Génère le DCF d'un CDC de longueur quelconque
+
+    complete est une fonction prompt -> texte (par exemple un appel Azure
+    OpenAI déjà configuré). on_progress(phase, done, total) est appelé dans le
+    thread appelant, avec phase valant "map", "merge" ou "reduce".
+    reduce_complete remplace complete pour l'appel final, par exemple pour
+    afficher la rédaction du DCF en streaming. timer (StageTimer) reçoit la
+    durée de chaque phase et l'attente des requêtes. Si les positions de début
+    de page du CDC sont fournies (voir dcf.pdf), chaque extrait indique les
+    pages dont il provient.
+    """
+    def progress(phase, done, total):
+        if on_progress:
+            on_progress(phase, done, total)
+
+    def measure(phase):
+        return timer.stage(phase) if timer else nullcontext()
+
+    def run_phase(phase, prompts):
+        if phase == "reduce":
+            progress(phase, 0, 1)
+            with measure(phase):
+                answers = [(reduce_complete or complete)(prompts[0])]
+            progress(phase, 1, 1)
+            return answers
+
+        done = 0
+        progress(phase, done, len(prompts))
+
+        def on_done():
+            nonlocal done
+            done += 1
+            progress(phase, done, len(prompts))
+
+        with measure(phase):
+            return run_parallel(prompts, complete, max_workers, on_done, timer)
+
+    steps = map_reduce_steps(cdc_text, segment_tokens, page_offsets)
+    answers = None
+    while True:
+        try:
+            phase, prompts = steps.send(answers)
+        except StopIteration as done:
+            return done.value
+        answers = run_phase(phase, prompts)
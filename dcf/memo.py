@@ -0,0 +1,114 @@
+"""Mémoïsation en mémoire des étapes coûteuses, adressée par le contenu
+
+Sert à ne pas refaire, d'une exécution du script Streamlit à l'autre,
+l'extraction d'un fichier déjà lu, la construction d'un prompt ou l'export
+d'un DCF déjà généré. Les entrées sont identifiées par l'empreinte de leur
+contenu et la mémoire occupée est bornée : au-delà, les entrées les moins
+récemment utilisées sont évincées.
+"""
+
+import hashlib
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_BYTES = int(os.environ.get("DCF_MEMO_MAX_MB", "256")) * 1024 * 1024
+# Au-delà de cette part du budget, une valeur n'est pas conservée
+MAX_ENTRY_FRACTION = 0.25
+
+_MISSING = object()
+
+
+def content_hash(data):
+    """Empreinte d'un contenu (bytes, texte ou fichier en mémoire tel qu'un UploadedFile)"""
+    if hasattr(data, "getbuffer"):
+        # La vue est libérée aussitôt : un BytesIO exporté ne peut plus être modifié
+        with data.getbuffer() as view:
+            return hashlib.sha256(view).hexdigest()
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def estimate_size(value):
+    """Estime la mémoire occupée par une valeur mise en cache"""
+    if isinstance(value, (bytes, bytearray, str)):
+        return sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value.values())
+    if hasattr(value, "__dict__"):
+        return sys.getsizeof(value) + estimate_size(vars(value))
+    return sys.getsizeof(value)
+
+
+class MemoCache:
+    """Cache LRU clé -> valeur, borné par la mémoire estimée des valeurs
+
+    Utilisable depuis plusieurs threads. Une même clé calculée en parallèle
+    peut l'être deux fois ; la dernière valeur est conservée.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        size = estimate_size(value)
+        with self._lock:
+            self._forget(key)
+            if size > self.max_bytes * MAX_ENTRY_FRACTION:
+                return value
+            self._entries[key] = (value, size)
+            self._total_bytes += size
+            while self._total_bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._total_bytes -= evicted
+                self.evictions += 1
+        return value
+
+    def get_or_compute(self, key, compute):
+        """Renvoie la valeur associée à la clé, en la calculant au premier appel"""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = self.put(key, compute())
+        return value
+
+    def _forget(self, key):
+        entry = self._entries.pop(key, None)
+        if entry:
+            self._total_bytes -= entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
@@ -0,0 +1,199 @@
+"""Reconnaissance de texte (OCR) des pages scannées d'un PDF
+
+Une page sans texte exploitable mais portant des images est passée à
+l'OCR Tesseract intégré à PyMuPDF. Les pages sont reconnues en parallèle
+par un pool de processus dimensionné sur les cœurs disponibles, pendant que
+l'extraction des autres pages se poursuit. Le texte reconnu est mis en cache
+sur disque, indexé par l'empreinte des images de la page : un document
+renvoyé une seconde fois est lu sans nouvel OCR.
+
+Sans Tesseract (ou sans ses données de langue, voir TESSDATA_PREFIX), les
+pages concernées restent vides et sont comptées dans le rapport.
+"""
+
+import functools
+import hashlib
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+
+from .cache import DEFAULT_CACHE_DIR, ResultCache
+
+OCR_LANGUAGE = os.environ.get("DCF_OCR_LANGUAGE", "fra+eng")
+OCR_DPI = int(os.environ.get("DCF_OCR_DPI", "300"))
+OCR_CACHE_DIR = os.path.join(DEFAULT_CACHE_DIR, "ocr")
+# En dessous, le texte d'une page est considéré comme absent (numéro de page, en-tête isolé...)
+MIN_TEXT_CHARS = 20
+
+_worker_doc = None
+_cache = None
+_cache_lock = threading.Lock()
+
+
+@dataclass
+class OcrReport:
+    """Bilan de l'OCR d'un document"""
+    pages: int = 0
+    cached: int = 0
+    unavailable: int = 0
+    seconds: float = 0.0
+
+
+@functools.lru_cache(maxsize=None)
+def tesseract_available():
+    """Indique si PyMuPDF trouve les données de Tesseract"""
+    import fitz  # PyMuPDF
+
+    try:
+        fitz.get_tessdata()
+    except RuntimeError:
+        return False
+    return True
+
+
+def get_ocr_cache():
+    """Cache disque des textes reconnus, partagé par le processus"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache(OCR_CACHE_DIR)
+        return _cache
+
+
+def available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # Windows, macOS
+        return os.cpu_count() or 1
+
+
+def page_image_key(page):
+    """Empreinte des images d'une page et des réglages d'OCR ; None si la page n'a pas d'image"""
+    images = page.get_images(full=True)
+    if not images:
+        return None
+    digest = hashlib.sha256(f"{OCR_LANGUAGE}|{OCR_DPI}|{page.rotation}|{tuple(page.rect)}".encode("utf-8"))
+    for image in images:
+        digest.update(page.parent.xref_stream_raw(image[0]) or b"")
+    return digest.hexdigest()
+
+
+def _ocr_page(page):
+    textpage = page.get_textpage_ocr(language=OCR_LANGUAGE, dpi=OCR_DPI, full=True)
+    return page.get_text(textpage=textpage)
+
+
+def _init_worker(source):
+    global _worker_doc
+    # Tesseract parallélise chaque page par défaut : un thread par processus suffit ici
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+    _worker_doc = _open(source)
+
+
+def _ocr_page_in_worker(number):
+    return _ocr_page(_worker_doc[number])
+
+
+def _open(source):
+    import fitz  # PyMuPDF
+
+    if isinstance(source, (str, os.PathLike)):
+        return fitz.open(source, filetype="pdf")
+    return fitz.open(stream=source, filetype="pdf")
+
+
+def _done(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+def ocr_missing_pages(source, pages, report=None, max_workers=None):
+    """Complète par OCR les pages sans texte d'un PDF
+
+    pages est l'itérable du texte de chaque page (voir dcf.pdf.iter_pdf_pages) ;
+    les textes sont produits dans le même ordre, dès que possible. source est
+    le chemin du PDF ou son contenu, et report (OcrReport) reçoit le bilan.
+    """
+    report = report if report is not None else OcrReport()
+    if max_workers is None:
+        max_workers = available_cores()
+    parallel = max_workers > 1
+    pending = deque()
+    pool = None
+    started = None
+
+    def ocr(number):
+        nonlocal pool, parallel
+        if parallel:
+            try:
+                if pool is None:
+                    # "spawn" évite de dupliquer par fork un serveur Streamlit multithreadé ;
+                    # une vue sur un tampon ne se transmet pas : copie, le temps de l'OCR seulement
+                    pool = ProcessPoolExecutor(
+                        max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"),
+                        initializer=_init_worker,
+                        initargs=(bytes(source) if isinstance(source, memoryview) else source,)
+                    )
+                return pool.submit(_ocr_page_in_worker, number)
+            except (BrokenProcessPool, OSError):
+                # Environnement sans multiprocessing exploitable : OCR dans ce processus
+                parallel = False
+        future = Future()
+        try:
+            future.set_result(_ocr_page(doc[number]))
+        except RuntimeError as e:
+            future.set_exception(e)
+        return future
+
+    def resolve(entry):
+        future, number, text, key = entry
+        if key is None:
+            return future.result()
+        try:
+            recognized = future.result()
+        except (BrokenProcessPool, OSError):
+            # Le pool s'est arrêté en cours de route : la page est reprise dans ce processus
+            return resolve((ocr(number), number, text, key))
+        except RuntimeError:
+            # Langue absente des données de Tesseract, image illisible...
+            report.pages -= 1
+            report.unavailable += 1
+            return text
+        get_ocr_cache().put(key, recognized)
+        return recognized
+
+    try:
+        with _open(source) as doc:
+            for number, text in enumerate(pages):
+                key = None
+                future = _done(text)
+                if len(text.strip()) < MIN_TEXT_CHARS:
+                    key = page_image_key(doc[number])
+                if key is not None:
+                    started = started or time.perf_counter()
+                    cached = get_ocr_cache().get(key)
+                    if cached is not None:
+                        report.cached += 1
+                        future, key = _done(cached), None
+                    elif not tesseract_available():
+                        report.unavailable += 1
+                        key = None
+                    else:
+                        report.pages += 1
+                        future = ocr(number)
+                pending.append((future, number, text, key))
+                while pending and pending[0][0].done():
+                    yield resolve(pending.popleft())
+            while pending:
+                yield resolve(pending.popleft())
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        if started is not None:
+            report.seconds += time.perf_counter() - started
@@ -0,0 +1,161 @@
+"""Extraction du texte des PDF, parallélisée par plages de pages
+
+Un PDF volumineux est lu depuis un fichier sur disque : chaque processus du
+pool l'ouvre par son chemin, et MuPDF n'en charge que les parties utiles.
+Un PDF fourni en mémoire est copié une seule fois dans un segment de mémoire
+partagée, d'où chaque processus ouvre son propre document. Le texte est
+produit page par page ; assemblé, il conserve la position de début de
+chaque page pour permettre de citer les pages sources.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+
+from .chunking import page_at
+from .ocr import OcrReport, ocr_missing_pages
+
+# En dessous de ce nombre de pages, le démarrage du pool coûte plus qu'il ne rapporte
+PARALLEL_MIN_PAGES = 40
+PAGES_PER_TASK = 16
+
+_worker_doc = None
+
+
+@dataclass
+class PdfText:
+    """Texte d'un PDF et position de début de chaque page dans ce texte"""
+    text: str
+    page_offsets: list
+    ocr: OcrReport = None
+
+    @property
+    def page_count(self):
+        return len(self.page_offsets)
+
+    def page_at(self, offset):
+        """Renvoie le numéro (à partir de 1) de la page contenant la position donnée"""
+        return page_at(self.page_offsets, offset)
+
+
+def join_pages(pages):
+    """Assemble le texte des pages en une seule jointure, en notant le début de chaque page"""
+    offsets = []
+    parts = []
+    position = 0
+    for page_text in pages:
+        offsets.append(position)
+        parts.append(page_text)
+        position += len(page_text)
+    return PdfText(text="".join(parts), page_offsets=offsets)
+
+
+def _is_path(source):
+    return isinstance(source, (str, os.PathLike))
+
+
+def _open(source):
+    """Ouvre un PDF fourni par son chemin (lu à la demande par MuPDF) ou par son contenu"""
+    import fitz  # PyMuPDF, importé au premier PDF ouvert
+
+    if _is_path(source):
+        return fitz.open(source, filetype="pdf")
+    return fitz.open(stream=source, filetype="pdf")
+
+
+def _extract_range(doc, start, stop):
+    return [doc[number].get_text() for number in range(start, stop)]
+
+
+def _init_worker(path, shm_name, size):
+    global _worker_doc
+    if path is not None:
+        _worker_doc = _open(path)
+        return
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        # PyMuPDF a besoin d'un objet bytes : une copie par processus, pas par tâche
+        data = bytes(shm.buf[:size])
+    finally:
+        shm.close()
+    _worker_doc = _open(data)
+
+
+def _extract_range_in_worker(start, stop):
+    return _extract_range(_worker_doc, start, stop)
+
+
+def _iter_parallel(source, page_count, max_workers):
+    ranges = [(start, min(start + PAGES_PER_TASK, page_count)) for start in range(0, page_count, PAGES_PER_TASK)]
+    shm = None
+    if _is_path(source):
+        # Fichier sur disque : chaque processus l'ouvre directement, sans copie
+        initargs = (os.fspath(source), None, 0)
+    else:
+        shm = shared_memory.SharedMemory(create=True, size=len(source))
+        shm.buf[:len(source)] = source
+        initargs = (None, shm.name, len(source))
+    try:
+        # "spawn" évite de dupliquer par fork un serveur Streamlit multithreadé
+        with ProcessPoolExecutor(
+            max_workers=min(max_workers, len(ranges)),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=initargs
+        ) as pool:
+            for chunk in pool.map(_extract_range_in_worker, *zip(*ranges)):
+                yield from chunk
+    finally:
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+
+
+def _iter_text_pages(source, max_workers):
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    with _open(source) as doc:
+        page_count = doc.page_count
+        if max_workers <= 1 or page_count < PARALLEL_MIN_PAGES:
+            for number in range(page_count):
+                yield doc[number].get_text()
+            return
+
+    done = 0
+    try:
+        for page_text in _iter_parallel(source, page_count, max_workers):
+            yield page_text
+            done += 1
+    except (BrokenProcessPool, OSError):
+        # Environnement sans multiprocessing exploitable : suite de l'extraction en séquentiel
+        with _open(source) as doc:
+            for number in range(done, page_count):
+                yield doc[number].get_text()
+
+
+def iter_pdf_pages(source, max_workers=None, ocr=True, ocr_report=None):
+    """Produit le texte de chaque page d'un PDF, dans l'ordre
+
+    source est le chemin du fichier ou son contenu (bytes ou memoryview). Les documents d'au
+    moins PARALLEL_MIN_PAGES pages sont traités par un pool de max_workers
+    processus (par défaut, un par cœur disponible) ; les pages sont produites
+    au fur et à mesure que les plages se terminent. Avec ocr=True, les pages
+    scannées sont reconnues par OCR (voir dcf.ocr), dont le bilan est ajouté
+    à ocr_report.
+    """
+    pages = _iter_text_pages(source, max_workers)
+    if ocr:
+        pages = ocr_missing_pages(source, pages, ocr_report, max_workers)
+    yield from pages
+
+
+def extract_pdf(source, max_workers=None, ocr=True):
+    """Extrait le texte d'un PDF fourni par son chemin ou sous forme de bytes (voir iter_pdf_pages)"""
+    report = OcrReport()
+    pdf = join_pages(iter_pdf_pages(source, max_workers, ocr, report))
+    pdf.ocr = report
+    return pdf
@@ -0,0 +1,193 @@
+"""Enchaînement complet d'une génération de DCF, sans interface"""
+
+from functools import partial
+
+from .budget import fit_prompt
+from .cache import make_cache_key
+from .inventory import analyze_cdc
+from .llm import DEFAULT_TEMPERATURE, complete
+from .memo import content_hash
+from .mapreduce import DEFAULT_MAX_WORKERS, generate_dcf_map_reduce
+from .prompts import PROMPT_VERSION, generate_prompt, generate_structured_prompt
+from .retrieval import RETRIEVAL_TOP_K
+from .sections import generate_dcf_sections
+from .structured import generate_dcf_structured
+from .timing import StageTimer
+
+
+def choose_mode(budget, chunked=True, incremental=False, retrieval=False, structured=False):
+    """Renvoie le mode de génération : "structured", "retrieval", "sections", "map-reduce" ou "direct"
+
+    budget est le PromptBudget du CDC (voir dcf.budget.fit_prompt). Le mode
+    "structured" fait remplir un schéma JSON au modèle et compose le DCF
+    localement (voir dcf.structured). Le mode "retrieval" rédige le DCF
+    section par section, chacune à partir des seuls passages du CDC que
+    l'index local juge pertinents. Le mode "sections" (voir dcf.sections) est
+    choisi dès que la régénération incrémentale est demandée, "map-reduce"
+    pour un CDC qui ne tient pas dans une seule requête.
+    """
+    if structured:
+        return "structured"
+    if retrieval:
+        return "retrieval"
+    if incremental:
+        return "sections"
+    return "map-reduce" if chunked and not budget.fits else "direct"
+
+
+def _fit(cdc_text, deployment, page_offsets, structured, inventory):
+    if structured:
+        return fit_prompt(cdc_text, deployment, page_offsets, build=generate_structured_prompt)
+    if inventory is not None:
+        return fit_prompt(
+            inventory.text, deployment, inventory.page_offsets,
+            build=partial(generate_prompt, inventory=inventory.summary())
+        )
+    return fit_prompt(cdc_text, deployment, page_offsets)
+
+
+def prepare_generation(cdc_text, deployment, page_offsets=None, chunked=True, incremental=False,
+                       retrieval=False, timer=None, structured=False, pre_extract=False, memo=None):
+    """Mesure le CDC et choisit le mode de génération
+
+    Avec pre_extract=True, les sigles et les règles de gestion sont d'abord
+    relevés localement (voir dcf.inventory) et, si le mode retenu est "direct",
+    le prompt porte sur le CDC compacté accompagné de l'inventaire. memo
+    (dcf.memo.MemoCache) conserve l'inventaire et le prompt d'un même CDC d'un
+    appel à l'autre. Renvoie (budget, mode, clé de cache du DCF, inventaire ou None).
+    """
+    timer = timer or StageTimer()
+    digest = content_hash(cdc_text) if memo is not None else None
+
+    def memoized(key, compute):
+        if memo is None:
+            return compute()
+        return memo.get_or_compute((key, digest, tuple(page_offsets or ()), deployment), compute)
+
+    inventory = None
+    if pre_extract and not (structured or retrieval or incremental):
+        with timer.stage("analysis"):
+            inventory = memoized("inventory", lambda: analyze_cdc(cdc_text, page_offsets)) or None
+    with timer.stage("prompt"):
+        variant = "structured" if structured else "inventory" if inventory is not None else "direct"
+        budget = memoized(
+            ("prompt", variant), lambda: _fit(cdc_text, deployment, page_offsets, structured, inventory)
+        )
+    mode = choose_mode(budget, chunked, incremental, retrieval, structured)
+    if mode != "direct":
+        # Les autres modes découpent le CDC complet : l'inventaire ne sert pas
+        inventory = None
+    timer.metadata.update(
+        mode=mode, cdc_chars=len(cdc_text), cdc_tokens=budget.cdc_tokens, prompt_tokens=budget.prompt_tokens
+    )
+    if inventory is not None:
+        timer.metadata["inventory"] = inventory.stats()
+    cache_key = make_cache_key(
+        cdc_text, PROMPT_VERSION, deployment, DEFAULT_TEMPERATURE, mode=f"{mode}+inventory" if inventory else mode
+    )
+    return budget, mode, cache_key, inventory
+
+
+def run_generation(cdc_text, mode, budget, call, deployment, page_offsets=None,
+                   max_workers=DEFAULT_MAX_WORKERS, cache=None, read_cache=True, timer=None,
+                   on_progress=None, lineage=None, inventory=None):
+    """Rédige le DCF dans le mode choisi par prepare_generation, call étant une fonction prompt -> texte
+
+    En mode "structured", call reçoit aussi le format imposé à la réponse
+    (call(prompt, response_format)). En mode "direct", les tableaux des
+    sections 1.4 et 5 sont composés à partir de l'inventaire s'il est fourni.
+    Le cache n'est utilisé ici que pour les plans et les sections (modes
+    "sections" et "retrieval") ; le DCF complet est mis en cache par l'appelant.
+    """
+    return run_generation_details(
+        cdc_text, mode, budget, call, deployment, page_offsets=page_offsets, max_workers=max_workers,
+        cache=cache, read_cache=read_cache, timer=timer, on_progress=on_progress, lineage=lineage,
+        inventory=inventory
+    )[0]
+
+
+def run_generation_details(cdc_text, mode, budget, call, deployment, page_offsets=None,
+                           max_workers=DEFAULT_MAX_WORKERS, cache=None, read_cache=True, timer=None,
+                           on_progress=None, lineage=None, inventory=None):
+    """Comme run_generation, mais renvoie le couple (dcf, détails)
+
+    Les détails sont le résultat propre au mode (StructuredResult,
+    SectionedResult ou MapReduceResult), à présenter par l'interface ; None en
+    mode "direct".
+    """
+    timer = timer or StageTimer()
+    if mode == "structured":
+        result = generate_dcf_structured(
+            cdc_text, call, deployment, page_offsets=page_offsets, max_workers=max_workers,
+            on_progress=on_progress, timer=timer
+        )
+        return result.dcf, result
+    if mode in ("sections", "retrieval"):
+        result = generate_dcf_sections(
+            cdc_text, call, deployment, cache=cache, lineage=lineage, read_cache=read_cache,
+            max_workers=max_workers, on_progress=on_progress, timer=timer,
+            retrieval_k=RETRIEVAL_TOP_K if mode == "retrieval" else None
+        )
+        timer.metadata.update(sections=len(result.units), regenerated_sections=result.regenerated)
+        if result.retrieval:
+            timer.metadata["retrieval"] = result.retrieval
+        return result.dcf, result
+    if mode == "map-reduce":
+        result = generate_dcf_map_reduce(
+            cdc_text, call, max_workers=max_workers, on_progress=on_progress,
+            timer=timer, page_offsets=page_offsets
+        )
+        return result.dcf, result
+    with timer.stage("generation"):
+        dcf = call(budget.prompt)
+    return (inventory.complete_dcf(dcf) if inventory is not None else dcf), None
+
+
+def generate_dcf(cdc_text, api_key, endpoint, deployment, page_offsets=None, chunked=True,
+                 max_workers=DEFAULT_MAX_WORKERS, cache=None, read_cache=True, timer=None, usage=None,
+                 on_progress=None, incremental=False, lineage=None, router=None, retrieval=False,
+                 structured=False, pre_extract=False):
+    """Génère le DCF d'un texte extrait, en passant par le cache s'il est fourni
+
+    Avec read_cache=False, le cache n'est pas consulté mais reçoit le nouveau
+    résultat. Avec incremental=True, le DCF est rédigé section par section et
+    seules les sections touchées depuis la dernière génération du même CDC
+    (identifié par lineage, par exemple son nom de fichier) sont régénérées.
+    Avec retrieval=True, chaque section ne reçoit que les passages du CDC
+    les plus pertinents (index BM25 local, voir dcf.retrieval), ce qui réduit
+    d'autant les tokens envoyés. Avec structured=True, le modèle renvoie le
+    DCF au format JSON et le document est composé localement (voir
+    dcf.structured). Avec un router (dcf.router.Router), les requêtes sont
+    réparties sur ses déploiements, sauf celles de la génération structurée,
+    envoyées au déploiement principal. Avec pre_extract=True, les sigles et
+    les règles de gestion sont relevés localement et remplacent dans le prompt
+    les passages du CDC qui les définissent ; les sections 1.4 et 5 du DCF
+    sont alors composées par l'outil (mode "direct" seulement, voir
+    dcf.inventory). Renvoie le couple (dcf, from_cache). Les erreurs de l'API
+    sont propagées ; voir dcf.aio pour une version asynchrone qui les renvoie
+    sous forme structurée.
+    """
+    timer = timer or StageTimer()
+    budget, mode, cache_key, inventory = prepare_generation(
+        cdc_text, deployment, page_offsets, chunked, incremental, retrieval, timer, structured, pre_extract
+    )
+    if cache is not None and read_cache:
+        with timer.stage("cache"):
+            dcf = cache.get(cache_key)
+        timer.metadata["cache_hit"] = dcf is not None
+        if dcf is not None:
+            return dcf, True
+
+    def call(prompt, response_format=None):
+        if router is not None and response_format is None:
+            return router.complete(prompt, usage=usage)
+        return complete(prompt, api_key, endpoint, deployment, usage=usage, response_format=response_format)
+
+    dcf = run_generation(
+        cdc_text, mode, budget, call, deployment, page_offsets=page_offsets, max_workers=max_workers,
+        cache=cache, read_cache=read_cache, timer=timer, on_progress=on_progress, lineage=lineage,
+        inventory=inventory
+    )
+    if cache is not None:
+        cache.put(cache_key, dcf)
+    return dcf, False
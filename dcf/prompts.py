@@ -0,0 +1,521 @@
+"""Modèles de prompts utilisés pour générer le DCF"""
+
+import hashlib
+import json
+import re
+
+# Structure du DCF issue du guide d'élaboration DDI M IT 02.02
+DCF_STRUCTURE = """### 1. CADRE GENERAL
+1.1. Présentation générale du système
+   - Objectifs stratégiques et opérationnels
+   - Périmètre fonctionnel précis
+   - Finalité du système
+   - Bénéfices attendus
+   - Publics cibles
+
+1.2. Références
+   - Documents normatifs (liste complète)
+   - Standards applicables
+   - Contraintes réglementaires
+   - Références aux documents projets
+
+1.3. Environnement
+   - Architecture technique détaillée
+   - Systèmes connectés (interfaces)
+   - Contraintes d'intégration
+   - Prérequis matériels/logiciels
+   - Environnement de déploiement
+
+1.4. Terminologie et sigles
+   - Glossaire complet avec définitions
+   - Liste des acronymes avec explications
+   - Termes techniques spécifiques
+
+### 2. ARCHITECTURE FONCTIONNELLE
+2.1. Modules fonctionnels
+   - Découpage modulaire détaillé
+   - Responsabilités de chaque module
+   - Interactions entre modules
+   - Spécificités techniques
+
+2.2. Synoptique fonctionnel
+   - Diagramme textuel des flux
+   - Séquencement des opérations
+   - Points d'intégration critiques
+   - Flux principaux et secondaires
+
+### 3. SPECIFICATIONS FONCTIONNELLES (À DÉTAILLER POUR CHAQUE MODULE)
+Pour chaque module identifié :
+- Nom du module et version
+- Description approfondie :
+  * Finalité et portée
+  * Contraintes spécifiques
+  * Hypothèses techniques
+
+Pour chaque fonction :
+  - Définition complète :
+    * Objectif métier
+    * Valeur ajoutée
+    * Critères de succès
+
+  - Identification précise :
+    * Code unique (norme de nommage)
+    * Acteurs concernés (rôles)
+    * Déclencheurs (événements)
+    * Préconditions et postconditions
+    * Impacts IHM détaillés
+
+  - Description du processus :
+    * Entrées : format, source, validation
+    * Traitement : algorithme, logique métier
+    * Sorties : format, destination, qualité
+    * Règles de gestion : formulation complète sans abréviation
+    * Cas d'erreur et gestion des exceptions
+    * Contrôles de qualité
+
+### 4. REPRISE DE L'EXISTANT
+4.1. Procédure de reprise
+   - Stratégie de migration
+   - Plan de conversion
+   - Nettoyage des données
+   - Validation post-migration
+
+4.2. Contraintes de reprise
+   - Compatibilités
+   - Anomalies connues
+   - Limitations techniques
+   - Périmètre exclu
+
+### 5. RECAPITULATIF DES REGLES DE GESTION
+Tableau structuré contenant :
+- Identifiant unique de la règle
+- Libellé complet et non ambigu
+- Module/fonction associée
+- Source métier
+- Critère d'application
+- Exemples concrets
+- Exceptions éventuelles
+
+### 6. VISA DE VALIDATION
+- Liste des validations requises
+- Responsables par domaine
+- Critères d'acceptation
+- Preuves de validation
+- Planning de recette"""
+
+DCF_GUIDELINES = """**Directives spécifiques :**
+1. Analyse minutieusement le CDC pour extraire toutes les exigences implicites et explicites
+2. Structure le contenu de manière logique et progressive
+3. Utilise un langage technique précis mais accessible
+4. Fournis des exemples concrets quand nécessaire
+5. Identifie clairement les dépendances entre composants
+6. Mentionne les contraintes et limitations de manière transparente
+7. Propose des recommandations pour les aspects critiques
+
+**Approche rédactionnelle :**
+- Style professionnel et normatif
+- Phrases complètes et structurées
+- Terminologie cohérente
+- Numérotation précise des éléments
+- Mise en forme claire avec des paragraphes aérés"""
+
+# Structure du DCF lorsque sigles et règles de gestion sont pré-extraits du CDC
+# (voir dcf.inventory) : les tableaux des sections 1.4 et 5 sont produits par l'outil
+_GENERATED_TABLE = "Tableau produit automatiquement à partir du CDC : écris uniquement le titre"
+DCF_STRUCTURE_PRE_EXTRACTED = re.sub(
+    r"(1\.4\. Terminologie et sigles\n)(?:   - .*\n)+", lambda match: f"{match.group(1)}   - {_GENERATED_TABLE}\n",
+    re.sub(r"(### 5\. [^\n]*\n)(?:.+\n)+", lambda match: f"{match.group(1)}{_GENERATED_TABLE}\n", DCF_STRUCTURE)
+)
+
+
+def generate_prompt(cdc_text, inventory=None):
+    """Génère le prompt pour GPT à partir du texte du CDC
+
+    Le texte est intégré tel quel : sa taille est ajustée au déploiement par
+    dcf.budget.fit_prompt. inventory est le résumé de la pré-extraction locale
+    (voir dcf.inventory.CdcInventory.summary) : le CDC fourni en est alors la
+    version compactée, et les tableaux des sections 1.4 et 5 sont ajoutés par
+    l'outil après la génération.
+    """
+    if inventory is None:
+        structure, inventory_block, rules_focus = DCF_STRUCTURE, "", "Les règles de gestion avec leur logique complète"
+    else:
+        structure, rules_focus = DCF_STRUCTURE_PRE_EXTRACTED, "L'application des règles de gestion dans chaque fonction"
+        inventory_block = f"""
+Les sigles, les règles de gestion et les exigences numérotées du CDC ont été relevés automatiquement dans l'inventaire ci-dessous. Dans le CDC, les glossaires, les tableaux et les définitions de règles sont remplacés par un renvoi [voir l'inventaire]. Dans les spécifications fonctionnelles, cite les règles de gestion par leur identifiant, sans recopier leur libellé :
+
+\"\"\"{inventory}\"\"\"
+"""
+    return f"""
+Tu es un assistant expert en conception fonctionnelle de systèmes d'information, et tu dois rédiger un Dossier de Conception Fonctionnelle (DCF) détaillé et complet à partir d'un cahier des charges (CDC) fourni ci-dessous.
+
+Le DCF que tu vas rédiger doit **respecter rigoureusement la structure suivante**, issue du guide d'élaboration DDI M IT 02.02, en fournissant des informations précises et exhaustives pour chaque section :
+
+---
+
+{structure}
+
+---
+
+{DCF_GUIDELINES}
+{inventory_block}
+Voici le contenu du CDC à analyser :
+
+\"\"\"{cdc_text}\"\"\"
+
+Génère maintenant un DCF exhaustif, en développant particulièrement :
+- {rules_focus}
+- Les scénarios d'utilisation typiques
+- Les cas limites à prendre en compte
+- Les interfaces système détaillées
+- Les contraintes de performance
+"""
+
+
+def generate_map_prompt(segment_text, position, total):
+    """Génère le prompt d'extraction appliqué à un segment du CDC (phase map)"""
+    return f"""
+Tu analyses l'extrait {position}/{total} d'un cahier des charges (CDC) volumineux, en vue de la rédaction d'un Dossier de Conception Fonctionnelle (DCF).
+
+Relève de façon factuelle et concise, sans rédiger le DCF, uniquement ce qui figure dans cet extrait :
+- Objectifs, périmètre et publics cibles
+- Références, normes et contraintes réglementaires
+- Environnement technique, systèmes connectés et interfaces
+- Sigles, acronymes et termes métier avec leur définition
+- Modules fonctionnels et, pour chacun, les fonctions (acteurs, déclencheurs, entrées, traitements, sorties)
+- Règles de gestion, formulées intégralement et sans abréviation
+- Éléments relatifs à la reprise de l'existant
+- Exigences de validation et parties prenantes
+
+Présente le résultat sous forme de listes à puces regroupées par rubrique. Omets les rubriques absentes de l'extrait.
+
+Extrait du CDC :
+
+\"\"\"{segment_text}\"\"\"
+"""
+
+
+def generate_merge_prompt(extractions):
+    """Génère le prompt de fusion de plusieurs extractions intermédiaires"""
+    joined = "\n\n".join(extractions)
+    return f"""
+Les notes suivantes ont été extraites de parties successives d'un même cahier des charges (CDC).
+
+Fusionne-les en une seule liste de notes, regroupées par rubrique, en supprimant les doublons mais sans perdre aucun module, aucune fonction ni aucune règle de gestion.
+
+Notes à fusionner :
+
+\"\"\"{joined}\"\"\"
+"""
+
+
+def generate_reduce_prompt(extractions):
+    """Génère le prompt d'assemblage du DCF à partir des extractions (phase reduce)"""
+    joined = "\n\n".join(extractions)
+    return f"""
+Tu es un assistant expert en conception fonctionnelle de systèmes d'information, et tu dois rédiger un Dossier de Conception Fonctionnelle (DCF) détaillé et complet à partir des notes d'analyse d'un cahier des charges (CDC) fournies ci-dessous.
+
+Ces notes ont été extraites de l'intégralité du CDC, partie par partie. Le DCF que tu vas rédiger doit **respecter rigoureusement la structure suivante**, issue du guide d'élaboration DDI M IT 02.02, en fournissant des informations précises et exhaustives pour chaque section :
+
+---
+
+{DCF_STRUCTURE}
+
+---
+
+{DCF_GUIDELINES}
+
+Voici les notes d'analyse du CDC :
+
+\"\"\"{joined}\"\"\"
+
+Génère maintenant un DCF exhaustif couvrant l'ensemble des modules et des règles de gestion relevés, en développant particulièrement :
+- Les règles de gestion avec leur logique complète
+- Les scénarios d'utilisation typiques
+- Les cas limites à prendre en compte
+- Les interfaces système détaillées
+- Les contraintes de performance
+"""
+
+
+def _split_sections(structure):
+    """Découpe la structure du DCF en blocs indexés par numéro de section ("1" à "6")"""
+    return {
+        block.split(".", 1)[0]: "### " + block.strip()
+        for block in structure.split("### ")[1:]
+    }
+
+
+DCF_SECTIONS = _split_sections(DCF_STRUCTURE)
+
+
+def generate_outline_prompt(chunk_digest):
+    """Génère le prompt de plan : modules du système et passages du CDC utiles à chaque section"""
+    return f"""
+Tu prépares la rédaction d'un Dossier de Conception Fonctionnelle (DCF) à partir d'un cahier des charges (CDC). Le CDC a été découpé en passages numérotés, dont tu disposes du début.
+
+Le DCF comporte les sections suivantes :
+1. Cadre général (présentation, références, environnement, terminologie et sigles)
+2. Architecture fonctionnelle (modules et synoptique)
+3. Spécifications fonctionnelles, détaillées module par module
+4. Reprise de l'existant
+5. Récapitulatif des règles de gestion
+6. Visa de validation
+
+Identifie les modules fonctionnels du système, puis indique pour chaque module et pour chaque autre section les numéros des passages du CDC nécessaires à leur rédaction. Un passage peut servir à plusieurs sections.
+
+Réponds uniquement par un objet JSON de la forme :
+{{"modules": [{{"name": "Nom du module", "chunks": [3, 4]}}], "sections": {{"1": [0, 1], "2": [2, 3], "4": [], "5": [3, 4], "6": [9]}}}}
+
+Passages du CDC :
+
+{chunk_digest}
+"""
+
+
+def generate_section_prompt(number, cdc_excerpts, modules):
+    """Génère le prompt de rédaction d'une section du DCF autre que la section 3"""
+    structure = DCF_SECTIONS[number]
+    module_list = "\n".join(f"- {name}" for name in modules) or "- Aucun module identifié"
+    return f"""
+Tu es un assistant expert en conception fonctionnelle de systèmes d'information, et tu rédiges une section d'un Dossier de Conception Fonctionnelle (DCF) à partir des passages d'un cahier des charges (CDC) fournis ci-dessous. Les autres sections du DCF sont rédigées séparément.
+
+Cette section doit **respecter rigoureusement la structure suivante**, issue du guide d'élaboration DDI M IT 02.02, en fournissant des informations précises et exhaustives :
+
+---
+
+{structure}
+
+---
+
+{DCF_GUIDELINES}
+
+Modules fonctionnels du système :
+{module_list}
+
+Passages du CDC utiles à cette section :
+
+\"\"\"{cdc_excerpts}\"\"\"
+
+Rédige maintenant uniquement cette section, en commençant par son titre « {structure.splitlines()[0]} ». Si les passages ne renseignent pas une rubrique, indique-le et formule des recommandations.
+"""
+
+
+def generate_module_prompt(module, modules, cdc_excerpts):
+    """Génère le prompt de rédaction des spécifications fonctionnelles d'un module (section 3)"""
+    module_list = "\n".join(f"- {name}" for name in modules)
+    return f"""
+Tu es un assistant expert en conception fonctionnelle de systèmes d'information, et tu rédiges, dans la section 3 (spécifications fonctionnelles) d'un Dossier de Conception Fonctionnelle (DCF), la partie consacrée au module « {module} ». Les autres modules sont rédigés séparément.
+
+Cette partie doit **respecter rigoureusement la structure suivante**, issue du guide d'élaboration DDI M IT 02.02, en fournissant des informations précises et exhaustives pour chaque fonction :
+
+---
+
+{DCF_SECTIONS["3"]}
+
+---
+
+{DCF_GUIDELINES}
+
+Modules fonctionnels du système :
+{module_list}
+
+Passages du CDC relatifs à ce module :
+
+\"\"\"{cdc_excerpts}\"\"\"
+
+Rédige maintenant les spécifications du module « {module} » uniquement. Commence directement par sa description, sans titre de module : le titre numéroté est ajouté lors de l'assemblage du DCF. Développe particulièrement les règles de gestion avec leur logique complète, les cas limites et les interfaces.
+"""
+
+
+def _text(description):
+    return {"type": "string", "description": description}
+
+
+def _texts(description):
+    return {"type": "array", "items": {"type": "string"}, "description": description}
+
+
+def _table(description, **columns):
+    return {"type": "array", "items": _object(**columns), "description": description}
+
+
+def _object(**properties):
+    # Forme exigée par les sorties structurées strictes : tous les champs sont requis
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False
+    }
+
+
+# Schéma JSON du DCF pour la génération structurée (voir dcf.structured) : une
+# propriété par section, dans l'ordre du document
+DCF_SCHEMA = _object(
+    cadre_general=_object(
+        presentation=_object(
+            objectifs=_texts("Objectifs stratégiques et opérationnels"),
+            perimetre=_texts("Périmètre fonctionnel"),
+            finalite=_text("Finalité du système"),
+            benefices=_texts("Bénéfices attendus"),
+            publics_cibles=_texts("Publics cibles")
+        ),
+        references=_object(
+            documents=_texts("Documents normatifs et documents projet"),
+            standards=_texts("Standards applicables"),
+            contraintes_reglementaires=_texts("Contraintes réglementaires")
+        ),
+        environnement=_object(
+            architecture_technique=_texts("Architecture technique"),
+            systemes_connectes=_table(
+                "Systèmes connectés", systeme=_text("Nom du système"), interface=_text("Nature de l'interface")
+            ),
+            contraintes_integration=_texts("Contraintes d'intégration"),
+            prerequis=_texts("Prérequis matériels et logiciels"),
+            deploiement=_texts("Environnement de déploiement")
+        ),
+        terminologie=_table("Glossaire et sigles", terme=_text("Terme ou sigle"), definition=_text("Définition"))
+    ),
+    architecture_fonctionnelle=_object(
+        modules=_table(
+            "Modules fonctionnels", nom=_text("Nom du module"), responsabilites=_texts("Responsabilités"),
+            interactions=_texts("Interactions avec les autres modules")
+        ),
+        synoptique=_table(
+            "Flux entre modules et systèmes, dans l'ordre des opérations", source=_text("Émetteur"),
+            destination=_text("Destinataire"), donnees=_text("Données et événement échangés")
+        )
+    ),
+    specifications=_table(
+        "Spécifications fonctionnelles, module par module",
+        nom=_text("Nom du module"),
+        finalite=_text("Finalité et portée"),
+        contraintes=_texts("Contraintes et hypothèses"),
+        fonctions=_table(
+            "Fonctions du module",
+            code=_text("Code unique de la fonction"),
+            nom=_text("Nom de la fonction"),
+            objectif=_text("Objectif métier"),
+            acteurs=_texts("Acteurs concernés"),
+            declencheurs=_texts("Événements déclencheurs"),
+            preconditions=_texts("Préconditions"),
+            postconditions=_texts("Postconditions"),
+            ihm=_texts("Impacts IHM"),
+            entrees=_texts("Entrées : format, source, validation"),
+            traitement=_texts("Étapes du traitement"),
+            sorties=_texts("Sorties : format, destination"),
+            regles=_texts("Identifiants des règles de gestion appliquées (voir regles_gestion)"),
+            erreurs=_texts("Cas d'erreur et gestion des exceptions")
+        )
+    ),
+    reprise=_object(
+        procedure=_texts("Stratégie de migration, conversion, nettoyage et validation des données"),
+        contraintes=_texts("Compatibilités, anomalies connues, limitations et périmètre exclu")
+    ),
+    regles_gestion=_table(
+        "Toutes les règles de gestion du CDC",
+        identifiant=_text("Identifiant unique, par exemple RG-001"),
+        libelle=_text("Libellé complet, sans abréviation"),
+        module=_text("Module associé"),
+        fonction=_text("Fonction associée"),
+        source=_text("Source métier"),
+        critere=_text("Critère d'application"),
+        exemple=_text("Exemple concret"),
+        exceptions=_text("Exceptions éventuelles")
+    ),
+    visa=_object(
+        validations=_table(
+            "Validations requises", domaine=_text("Domaine"), responsable=_text("Responsable"),
+            criteres=_text("Critères d'acceptation"), preuves=_text("Preuves de validation")
+        ),
+        planning=_texts("Planning de recette")
+    )
+)
+
+# Propriété du schéma correspondant à chaque section du DCF
+SCHEMA_SECTIONS = dict(zip(("1", "2", "3", "4", "5", "6"), DCF_SCHEMA["properties"]))
+
+_STRUCTURED_DIRECTIVES = """**Directives spécifiques :**
+1. Analyse minutieusement le CDC pour extraire toutes les exigences implicites et explicites
+2. Renseigne chaque champ avec des informations précises tirées du CDC, formulées de façon concise : pas de phrase d'introduction ni de mise en forme, le document est mis en page automatiquement
+3. Formule les règles de gestion intégralement, sans abréviation, et référence-les par leur identifiant dans les fonctions
+4. Laisse une liste vide lorsque le CDC ne renseigne pas une rubrique"""
+
+
+def section_schema(number):
+    """Schéma JSON réduit à une section du DCF"""
+    name = SCHEMA_SECTIONS[number]
+    return _object(**{name: DCF_SCHEMA["properties"][name]})
+
+
+def generate_structured_prompt(cdc_text, schema=None):
+    """Génère le prompt de la génération structurée : le DCF est renvoyé sous forme d'objet JSON
+
+    schema n'est à fournir que si le déploiement n'impose pas lui-même le
+    schéma de la réponse (sorties structurées non prises en charge).
+    """
+    schema_text = f"\nLa réponse doit respecter le schéma JSON suivant :\n{json.dumps(schema, ensure_ascii=False)}\n" \
+        if schema else ""
+    return f"""
+Tu es un assistant expert en conception fonctionnelle de systèmes d'information, et tu dois produire le contenu d'un Dossier de Conception Fonctionnelle (DCF) à partir d'un cahier des charges (CDC) fourni ci-dessous.
+
+Le DCF suit la structure du guide d'élaboration DDI M IT 02.02 ; son contenu est renvoyé sous forme d'un objet JSON dont chaque propriété correspond à une section :
+
+---
+
+{DCF_STRUCTURE}
+
+---
+
+{_STRUCTURED_DIRECTIVES}
+{schema_text}
+Voici le contenu du CDC à analyser :
+
+\"\"\"{cdc_text}\"\"\"
+
+Réponds uniquement par l'objet JSON du DCF.
+"""
+
+
+def generate_structured_section_prompt(number, cdc_text, problems, schema=None):
+    """Génère le prompt de reprise d'une section du DCF structuré jugée invalide"""
+    schema_text = f"\nLa réponse doit respecter le schéma JSON suivant :\n{json.dumps(schema, ensure_ascii=False)}\n" \
+        if schema else ""
+    problem_list = "\n".join(f"- {problem}" for problem in problems)
+    return f"""
+Tu es un assistant expert en conception fonctionnelle de systèmes d'information, et tu dois produire le contenu d'une section d'un Dossier de Conception Fonctionnelle (DCF) à partir d'un cahier des charges (CDC) fourni ci-dessous. Une première version de cette section était invalide :
+{problem_list}
+
+La section suit la structure du guide d'élaboration DDI M IT 02.02 :
+
+---
+
+{DCF_SECTIONS[number]}
+
+---
+
+{_STRUCTURED_DIRECTIVES}
+{schema_text}
+Voici le contenu du CDC à analyser :
+
+\"\"\"{cdc_text}\"\"\"
+
+Réponds uniquement par un objet JSON contenant cette section.
+"""
+
+
+# Empreinte des modèles ci-dessus : toute modification d'un prompt change la
+# version, et donc les clés du cache de résultats (voir dcf.cache)
+PROMPT_VERSION = hashlib.sha256("\0".join((
+    generate_prompt(""),
+    generate_prompt("", ""),
+    generate_map_prompt("", 1, 1),
+    generate_merge_prompt([]),
+    generate_reduce_prompt([]),
+    generate_outline_prompt(""),
+    *(generate_section_prompt(number, "", []) for number in DCF_SECTIONS if number != "3"),
+    generate_module_prompt("", [], ""),
+    generate_structured_prompt("", DCF_SCHEMA),
+    *(generate_structured_section_prompt(number, "", [], section_schema(number)) for number in SCHEMA_SECTIONS)
+)).encode("utf-8")).hexdigest()[:12]
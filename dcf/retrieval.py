@@ -0,0 +1,111 @@
+"""Index lexical local (BM25) des passages d'un CDC
+
+Chaque section du DCF n'a besoin que d'une partie du cahier des charges.
+L'index est construit en mémoire sur les unités du CDC (voir
+dcf.chunking.split_into_chunks), sans service externe, et renvoie pour une
+requête les passages les plus pertinents selon le classement BM25. Les
+mots sont comparés sans accents ni casse, au singulier approximatif, et
+les mots vides du français sont ignorés.
+"""
+
+import math
+import os
+import re
+import time
+import unicodedata
+from collections import Counter, defaultdict
+
+# Nombre de passages retenus par section ou module du DCF
+RETRIEVAL_TOP_K = int(os.environ.get("DCF_RETRIEVAL_TOP_K", "6"))
+# Paramètres usuels de BM25 : saturation de la fréquence et normalisation par la longueur
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a au aux avec ce ces cet cette d dans de des du elle elles en est et etre il ils j l la le les leur leurs
+lui m mais me meme n ne nos notre nous on ou par pas pour qu que qui s sa se ses son sont sur t ta te
+tes ton tu un une vos votre vous y ete etait sera seront doit doivent peut peuvent fait faire tout tous
+toute toutes autre autres ainsi afin lors dont sans sous entre plus tres chaque cas selon si
+the of and or to in for on with by is are be
+""".split())
+
+
+def fold(text):
+    """Texte en minuscules et sans accents"""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def tokenize(text):
+    """Termes d'indexation d'un texte : mots sans accents, hors mots vides, sans marque du pluriel"""
+    terms = []
+    for word in _WORD_RE.findall(fold(text)):
+        if word in STOPWORDS or len(word) < 2:
+            continue
+        if len(word) > 3 and word[-1] in "sx" and not word.isdigit():
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+class Bm25Index:
+    """Index BM25 d'une liste de textes
+
+    build_seconds donne la durée de construction ; queries et query_seconds
+    cumulent le nombre et la durée des recherches.
+    """
+
+    def __init__(self, texts, k1=BM25_K1, b=BM25_B):
+        start = time.perf_counter()
+        self.k1 = k1
+        self.b = b
+        self.lengths = []
+        self.postings = defaultdict(list)
+        for index, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            self.lengths.append(sum(counts.values()))
+            for term, count in counts.items():
+                self.postings[term].append((index, count))
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+        documents = len(self.lengths)
+        self.idf = {
+            term: math.log(1 + (documents - len(posting) + 0.5) / (len(posting) + 0.5))
+            for term, posting in self.postings.items()
+        }
+        self.build_seconds = time.perf_counter() - start
+        self.queries = 0
+        self.query_seconds = 0.0
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def scores(self, query):
+        """Score BM25 de chaque texte contenant au moins un terme de la requête"""
+        scores = defaultdict(float)
+        for term, weight in Counter(tokenize(query)).items():
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for index, count in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[index] / self.average_length)
+                scores[index] += weight * idf * count * (self.k1 + 1) / (count + norm)
+        return scores
+
+    def search(self, query, k=RETRIEVAL_TOP_K):
+        """Renvoie les k meilleurs (indice, score), du plus pertinent au moins pertinent"""
+        start = time.perf_counter()
+        ranked = sorted(self.scores(query).items(), key=lambda item: (-item[1], item[0]))[:k]
+        self.query_seconds += time.perf_counter() - start
+        self.queries += 1
+        return ranked
+
+    def stats(self):
+        return {
+            "documents": len(self),
+            "terms": len(self.postings),
+            "build_ms": self.build_seconds * 1000,
+            "queries": self.queries,
+            "query_ms": self.query_seconds / self.queries * 1000 if self.queries else 0.0
+        }
@@ -0,0 +1,407 @@
+"""Répartition des requêtes sur plusieurs déploiements Azure OpenAI
+
+Le routeur choisit, pour chaque requête, un déploiement parmi ceux
+configurés, par tirage pondéré : le poids déclaré est corrigé par l'état
+observé du déploiement (temps jusqu'au premier token et taux d'erreur en
+moyenne mobile exponentielle, quota restant annoncé par les en-têtes
+x-ratelimit-remaining-*). Un déploiement qui renvoie une erreur 429 ou une
+erreur transitoire est écarté le temps indiqué (Retry-After) ou d'un
+backoff, et la requête repart sur un autre.
+
+Avec hedge_after, si aucun token n'est arrivé après ce délai, une requête
+de secours identique part sur un autre déploiement : la première à
+terminer (ou, en streaming, à produire son premier token) est retenue et
+l'autre est fermée, ce qui interrompt la génération côté Azure.
+
+Les requêtes passent toujours en streaming, seul moyen de mesurer le
+premier token et d'annuler proprement la requête perdante ; la
+consommation de tokens est alors estimée (un fragment = un token).
+"""
+
+import hashlib
+import queue
+import random
+import threading
+import time
+from dataclasses import dataclass
+from urllib.parse import urlparse
+
+from .chunking import estimate_tokens
+from .llm import (
+    DEFAULT_TEMPERATURE, MAX_RETRIES, _backoff, _estimate_request_tokens, _messages, _retry_after, get_client,
+    get_rate_limiter, retryable_errors
+)
+
+# Poids des dernières mesures dans les moyennes mobiles
+EWMA_ALPHA = 0.2
+# Temps jusqu'au premier token supposé pour un déploiement encore jamais appelé
+DEFAULT_LATENCY_SECONDS = 2.0
+# Au-delà, le quota restant annoncé par Azure n'est plus considéré comme à jour
+QUOTA_HEADERS_TTL_SECONDS = 60
+# Pénalité d'un déploiement dont le quota restant ne couvre pas la requête
+LOW_QUOTA_FACTOR = 0.05
+
+_END = object()
+
+
+@dataclass(frozen=True)
+class Route:
+    """Un déploiement Azure OpenAI vers lequel router les requêtes"""
+    endpoint: str
+    deployment: str
+    weight: float = 1.0
+
+    @property
+    def name(self):
+        return f"{self.deployment} @ {urlparse(self.endpoint).netloc or self.endpoint}"
+
+
+def parse_routes(text):
+    """Lit une liste de déploiements, un par ligne : « endpoint, déploiement[, poids] »
+
+    Les lignes vides et celles qui commencent par # sont ignorées.
+    """
+    routes = []
+    for number, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        fields = [field.strip() for field in line.split(",")]
+        if len(fields) not in (2, 3) or not all(fields):
+            raise ValueError(f"Ligne {number} : format attendu « endpoint, déploiement[, poids] »")
+        try:
+            weight = float(fields[2]) if len(fields) == 3 else 1.0
+        except ValueError:
+            raise ValueError(f"Ligne {number} : poids invalide « {fields[2]} »") from None
+        if weight <= 0:
+            raise ValueError(f"Ligne {number} : le poids doit être positif")
+        routes.append(Route(fields[0], fields[1], weight))
+    return routes
+
+
+class RouteHealth:
+    """État observé d'un déploiement, partagé par tous les routeurs du processus"""
+
+    def __init__(self):
+        self.latency = None
+        self.error_rate = 0.0
+        self.remaining_requests = None
+        self.remaining_tokens = None
+        self.quota_updated_at = 0.0
+        self.cooldown_until = 0.0
+        self.consecutive_failures = 0
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.hedges = 0
+        self._lock = threading.Lock()
+
+    def started(self):
+        with self._lock:
+            self.in_flight += 1
+            self.requests += 1
+
+    def finished(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def record_first_token(self, seconds):
+        with self._lock:
+            self.latency = seconds if self.latency is None else (
+                EWMA_ALPHA * seconds + (1 - EWMA_ALPHA) * self.latency
+            )
+
+    def record_success(self):
+        with self._lock:
+            self.error_rate *= 1 - EWMA_ALPHA
+            self.consecutive_failures = 0
+
+    def record_failure(self, error):
+        with self._lock:
+            self.failures += 1
+            self.error_rate = EWMA_ALPHA + (1 - EWMA_ALPHA) * self.error_rate
+            if isinstance(error, retryable_errors()):
+                delay = _retry_after(error)
+                if delay is None:
+                    delay = _backoff(self.consecutive_failures)
+                self.cooldown_until = max(self.cooldown_until, time.monotonic() + delay)
+            self.consecutive_failures += 1
+            return self.cooldown_until - time.monotonic()
+
+    def record_hedge(self):
+        with self._lock:
+            self.hedges += 1
+
+    def record_headers(self, headers):
+        requests = headers.get("x-ratelimit-remaining-requests")
+        tokens = headers.get("x-ratelimit-remaining-tokens")
+        with self._lock:
+            if requests is not None and requests.isdigit():
+                self.remaining_requests = int(requests)
+                self.quota_updated_at = time.monotonic()
+            if tokens is not None and tokens.isdigit():
+                self.remaining_tokens = int(tokens)
+                self.quota_updated_at = time.monotonic()
+
+    def score(self, weight, tokens, now, default_latency):
+        """Poids effectif du déploiement pour une requête de tokens tokens (0 = indisponible)"""
+        with self._lock:
+            if now < self.cooldown_until:
+                return 0.0
+            score = weight / (self.latency or default_latency) * (1 - self.error_rate) ** 2 / (1 + self.in_flight)
+            if now - self.quota_updated_at < QUOTA_HEADERS_TTL_SECONDS and (
+                self.remaining_requests == 0
+                or (self.remaining_tokens is not None and self.remaining_tokens < tokens)
+            ):
+                score *= LOW_QUOTA_FACTOR
+            return score
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "latency": self.latency,
+                "error_rate": self.error_rate,
+                "remaining_requests": self.remaining_requests,
+                "remaining_tokens": self.remaining_tokens,
+                "cooling_down": max(0.0, self.cooldown_until - time.monotonic()),
+                "in_flight": self.in_flight,
+                "requests": self.requests,
+                "failures": self.failures,
+                "hedges": self.hedges
+            }
+
+
+_health_lock = threading.Lock()
+_health = {}
+
+
+def get_health(route):
+    """Renvoie l'état partagé d'un déploiement (indépendant de son poids)"""
+    key = (route.endpoint, route.deployment)
+    with _health_lock:
+        health = _health.get(key)
+        if health is None:
+            health = _health[key] = RouteHealth()
+        return health
+
+
+class _Cancelled(Exception):
+    pass
+
+
+class _Attempt:
+    """Une requête en streaming vers un déploiement, consommée dans un thread dédié"""
+
+    def __init__(self, router, route, prompt, temperature, signal):
+        self.route = route
+        self.health = get_health(route)
+        self.parts = []
+        self.deltas = queue.Queue()
+        self.error = None
+        self.first_token = False
+        self.finished = False
+        self._router = router
+        self._prompt = prompt
+        self._temperature = temperature
+        self._signal = signal
+        self._cancelled = threading.Event()
+        self._stream = None
+        threading.Thread(target=self._run, name=f"dcf-route-{route.deployment}", daemon=True).start()
+
+    def cancel(self):
+        self._cancelled.set()
+        stream = self._stream
+        if stream is not None:
+            # Débloque aussitôt le thread s'il attend encore des données
+            try:
+                stream.close()
+            except Exception:
+                pass
+
+    def _notify(self, **changes):
+        with self._signal:
+            for name, value in changes.items():
+                setattr(self, name, value)
+            self._signal.notify_all()
+
+    def _run(self):
+        route = self.route
+        self.health.started()
+        try:
+            limiter = get_rate_limiter(route.endpoint, route.deployment)
+            client = get_client(self._router.api_key, route.endpoint)
+
+            def send():
+                limiter.acquire(_estimate_request_tokens(self._prompt))
+                if self._cancelled.is_set():
+                    raise _Cancelled()
+                return client.chat.completions.with_raw_response.create(
+                    model=route.deployment,
+                    messages=_messages(self._prompt),
+                    temperature=self._temperature,
+                    stream=True
+                )
+
+            started = time.perf_counter()
+            response = send()
+            self.health.record_headers(response.headers)
+            stream = self._stream = response.parse()
+            try:
+                for chunk in stream:
+                    if self._cancelled.is_set():
+                        raise _Cancelled()
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if not delta:
+                        continue
+                    if not self.first_token:
+                        self.health.record_first_token(time.perf_counter() - started)
+                        self._notify(first_token=True)
+                    self.parts.append(delta)
+                    self.deltas.put(delta)
+            finally:
+                # Fermer le flux coupe la connexion : Azure interrompt la génération
+                stream.close()
+            self.health.record_success()
+        except _Cancelled:
+            pass
+        except Exception as e:
+            if self._cancelled.is_set():
+                # Erreur de lecture provoquée par la fermeture du flux
+                return
+            from openai import RateLimitError
+
+            delay = self.health.record_failure(e)
+            if isinstance(e, RateLimitError) and delay > 0:
+                get_rate_limiter(route.endpoint, route.deployment).pause(delay)
+            self.error = e
+        finally:
+            self.health.finished()
+            self.deltas.put(_END)
+            self._notify(finished=True)
+
+
+class Router:
+    """Envoie les requêtes vers le déploiement le plus favorable parmi routes
+
+    hedge_after (secondes) déclenche une requête de secours sur un autre
+    déploiement si aucun token n'est arrivé dans ce délai ; None la désactive,
+    de même qu'un routeur à un seul déploiement.
+    """
+
+    def __init__(self, routes, api_key, hedge_after=None, max_retries=MAX_RETRIES):
+        if not routes:
+            raise ValueError("Aucun déploiement configuré")
+        self.routes = list(routes)
+        self.api_key = api_key
+        self.hedge_after = (hedge_after or None) if len(self.routes) > 1 else None
+        self.max_retries = max_retries
+        self._random = random.Random()
+
+    @property
+    def primary(self):
+        return self.routes[0]
+
+    def pick(self, tokens=0, exclude=(), wait=True, strict=False):
+        """Tire un déploiement au sort selon son poids effectif
+
+        Si tous sont écartés (erreurs récentes), attend que le premier redevienne
+        disponible, ou renvoie None avec wait=False. Les déploiements de exclude
+        ne sont choisis qu'à défaut d'autre, et jamais avec strict=True.
+        """
+        while True:
+            now = time.monotonic()
+            health = {route: get_health(route) for route in self.routes}
+            known = [h.latency for h in health.values() if h.latency is not None]
+            default_latency = sorted(known)[len(known) // 2] if known else DEFAULT_LATENCY_SECONDS
+            scores = {route: health[route].score(route.weight, tokens, now, default_latency) for route in self.routes}
+            candidates = [route for route in self.routes if scores[route] > 0 and route not in exclude]
+            if not candidates and not strict:
+                candidates = [route for route in self.routes if scores[route] > 0]
+            if candidates:
+                return self._random.choices(candidates, weights=[scores[route] for route in candidates])[0]
+            if not wait:
+                return None
+            time.sleep(max(0.05, min(h.cooldown_until for h in health.values()) - now))
+
+    def _race(self, prompt, temperature, until_first_token):
+        """Lance la requête, puis sa doublure éventuelle ; renvoie la tentative gagnante"""
+        signal = threading.Condition()
+        tokens = _estimate_request_tokens(prompt)
+        attempts = [_Attempt(self, self.pick(tokens), prompt, temperature, signal)]
+        deadline = time.monotonic() + self.hedge_after if self.hedge_after else None
+        with signal:
+            while True:
+                winners = [
+                    attempt for attempt in attempts
+                    if (attempt.finished and attempt.error is None) or (until_first_token and attempt.first_token)
+                ]
+                if winners:
+                    winner = winners[0]
+                    break
+                if all(attempt.finished for attempt in attempts):
+                    raise attempts[-1].error
+                timeout = None
+                if deadline is not None:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0 and not attempts[0].first_token and not attempts[0].finished:
+                        # Pas de doublure vers le déploiement déjà en retard, ni d'attente : sinon, pas de secours
+                        route = self.pick(tokens, exclude={attempts[0].route}, wait=False, strict=True)
+                        if route is not None:
+                            get_health(route).record_hedge()
+                            attempts.append(_Attempt(self, route, prompt, temperature, signal))
+                        deadline = timeout = None
+                signal.wait(timeout)
+        for attempt in attempts:
+            if attempt is not winner:
+                attempt.cancel()
+        return winner
+
+    def _retrying(self, prompt, temperature, until_first_token):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self._race(prompt, temperature, until_first_token)
+            except retryable_errors():
+                # Le déploiement fautif est écarté : la tentative suivante part ailleurs
+                if attempt == self.max_retries:
+                    raise
+
+    def complete(self, prompt, temperature=DEFAULT_TEMPERATURE, usage=None):
+        """Équivalent de dcf.llm.complete, réparti sur les déploiements du routeur"""
+        winner = self._retrying(prompt, temperature, until_first_token=False)
+        if usage is not None:
+            usage.record(estimate_tokens(prompt), len(winner.parts))
+        return "".join(winner.parts)
+
+    def stream(self, prompt, temperature=DEFAULT_TEMPERATURE):
+        """Équivalent de dcf.llm.stream_complete : la première tentative à produire un token est suivie"""
+        winner = self._retrying(prompt, temperature, until_first_token=True)
+        try:
+            while True:
+                delta = winner.deltas.get()
+                if delta is _END:
+                    break
+                yield delta
+            if winner.error is not None:
+                raise winner.error
+        finally:
+            winner.cancel()
+
+    def stats(self):
+        """État de chaque déploiement, pour l'affichage"""
+        return [{"route": route.name, "weight": route.weight, **get_health(route).as_dict()} for route in self.routes]
+
+
+_routers_lock = threading.Lock()
+_routers = {}
+
+
+def get_router(routes, api_key, hedge_after=None):
+    """Renvoie le routeur partagé du processus pour ces déploiements, cette clé et ce délai de secours"""
+    key = (tuple(routes), hashlib.sha256(api_key.encode("utf-8")).hexdigest(), hedge_after or None)
+    with _routers_lock:
+        router = _routers.get(key)
+        if router is None:
+            router = _routers[key] = Router(routes, api_key, hedge_after)
+        return router
@@ -0,0 +1,321 @@
+"""Génération du DCF section par section, avec régénération incrémentale
+
+Le CDC est découpé en unités stables (voir dcf.chunking.split_into_chunks),
+identifiées par l'empreinte de leur texte. Un appel de plan identifie les
+modules du système et, pour chaque section du DCF (1, 2, 4, 5, 6) et chaque
+module de la section 3, les unités du CDC dont sa rédaction dépend. Chaque
+section est ensuite rédigée par une requête distincte, en parallèle, et
+stockée dans le cache sous une clé dérivée des empreintes de ses unités.
+
+Lorsqu'une nouvelle version d'un CDC déjà traité est générée, ses unités sont
+alignées sur celles de la version précédente : le plan est réutilisé (sauf si
+des passages ont été ajoutés) et seules les sections dont une unité a changé
+sont régénérées, les autres étant relues depuis le cache.
+
+Avec retrieval_k, les passages de chaque section ne sont plus ceux désignés
+par le plan mais les retrieval_k plus pertinents selon un index BM25 local
+(voir dcf.retrieval), interrogé avec la structure attendue de la section ou
+le nom du module : chaque requête ne reçoit qu'une petite partie du CDC.
+"""
+
+import difflib
+import hashlib
+import json
+import re
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+
+from .budget import fit_prompt
+from .cache import normalize_text
+from .chunking import split_into_chunks
+from .mapreduce import DEFAULT_MAX_WORKERS, run_parallel
+from .prompts import (
+    DCF_SECTIONS, PROMPT_VERSION, generate_module_prompt, generate_outline_prompt, generate_section_prompt
+)
+from .retrieval import Bm25Index
+
+# Sections rédigées d'un seul tenant ; la section 3 l'est module par module
+WHOLE_SECTIONS = ("1", "2", "4", "5", "6")
+SECTION_3_TITLE = DCF_SECTIONS["3"].splitlines()[0].split(" (")[0]
+# Longueur du début de chaque passage présenté à l'appel de plan, réduite
+# pour les CDC volumineux afin que le plan tienne dans DIGEST_MAX_CHARS
+DIGEST_CHARS = 300
+DIGEST_MIN_CHARS = 80
+DIGEST_MAX_CHARS = 200000
+
+# Titres de passages ajoutés au nom d'un module pour rechercher ses passages
+QUERY_HEADINGS = 8
+
+_JSON_RE = re.compile(r"\{.*\}", re.DOTALL)
+
+
+@dataclass
+class SectionUnit:
+    """Partie du DCF rédigée par une requête : une section, ou un module de la section 3"""
+    unit_id: str
+    title: str
+    chunks: list
+    key: str = None
+    text: str = None
+    regenerated: bool = False
+
+
+@dataclass
+class SectionedResult:
+    """Résultat d'une génération par sections"""
+    dcf: str
+    units: list
+    chunk_count: int
+    changed_chunks: int
+    replanned: bool
+    prompts: dict = field(default_factory=dict)
+    retrieval: dict = None
+
+    @property
+    def regenerated(self):
+        return sum(unit.regenerated for unit in self.units)
+
+
+def _digest(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def chunk_hashes(chunks):
+    """Empreintes des unités du CDC, insensibles aux différences d'espacement"""
+    return [hashlib.sha256(normalize_text(chunk.text).encode("utf-8")).hexdigest() for chunk in chunks]
+
+
+def lineage_key(lineage, deployment):
+    """Clé du manifeste de la dernière génération d'un CDC (identifié par exemple par son nom de fichier)"""
+    return _digest("lineage", PROMPT_VERSION, deployment, lineage)
+
+
+def align_chunks(old_hashes, new_hashes):
+    """Aligne les unités de deux versions d'un CDC
+
+    Renvoie (correspondance ancien indice -> nouvel indice, indices des
+    nouvelles unités modifiées ou ajoutées, présence d'ajouts). Une unité
+    remplacée à la même place est considérée comme modifiée : elle hérite des
+    dépendances de l'ancienne.
+    """
+    mapping = {}
+    changed = set()
+    inserted = False
+    matcher = difflib.SequenceMatcher(None, old_hashes, new_hashes, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            mapping.update(zip(range(i1, i2), range(j1, j2)))
+        elif tag == "replace" and i2 - i1 == j2 - j1:
+            mapping.update(zip(range(i1, i2), range(j1, j2)))
+            changed.update(range(j1, j2))
+        elif tag in ("replace", "insert"):
+            changed.update(range(j1, j2))
+            inserted = True
+    return mapping, changed, inserted
+
+
+def parse_outline(response, chunk_count):
+    """Lit le plan renvoyé par le modèle ; à défaut, toutes les sections dépendent de tout le CDC
+
+    Les modules cités plusieurs fois sous le même nom (à la casse et aux
+    espaces près) sont fusionnés, avec l'union de leurs passages.
+    """
+    everything = list(range(chunk_count))
+
+    def indices(values):
+        return sorted({int(v) for v in values if str(v).isdigit() and int(v) < chunk_count})
+
+    try:
+        data = json.loads(_JSON_RE.search(response).group(0))
+        merged = {}
+        for module in data.get("modules", []):
+            name = str(module.get("name", "")).strip()
+            if not name:
+                continue
+            entry = merged.setdefault(" ".join(name.lower().split()), {"name": name, "chunks": []})
+            entry["chunks"] = sorted(set(entry["chunks"]) | set(indices(module.get("chunks", []))))
+        modules = list(merged.values())
+        sections = {number: indices(data.get("sections", {}).get(number, [])) for number in WHOLE_SECTIONS}
+    except (AttributeError, TypeError, ValueError, KeyError):
+        return {"modules": [], "sections": {number: everything for number in WHOLE_SECTIONS}}
+    return {"modules": modules, "sections": sections}
+
+
+def _remap_outline(outline, mapping):
+    def remap(chunks):
+        return sorted(mapping[i] for i in chunks if i in mapping)
+
+    # Un module dont tous les passages ont été supprimés disparaît du DCF
+    return {
+        "modules": [
+            {"name": module["name"], "chunks": remap(module["chunks"])} for module in outline["modules"]
+            if remap(module["chunks"]) or not module["chunks"]
+        ],
+        "sections": {number: remap(chunks) for number, chunks in outline["sections"].items()}
+    }
+
+
+def _chunk_digest(chunks):
+    length = max(DIGEST_MIN_CHARS, min(DIGEST_CHARS, DIGEST_MAX_CHARS // len(chunks)))
+    return "\n\n".join(
+        f"[{chunk.index}] " + " ".join(chunk.text[:length].split()) for chunk in chunks
+    )
+
+
+def build_units(outline, chunk_count):
+    """Liste les parties du DCF à rédiger, dans l'ordre du document"""
+    modules = outline["modules"] or [{"name": "Système", "chunks": list(range(chunk_count))}]
+    units = [
+        SectionUnit(number, DCF_SECTIONS[number].splitlines()[0], outline["sections"][number])
+        for number in ("1", "2")
+    ]
+    units += [
+        SectionUnit(f"3:{index}", module["name"], module["chunks"]) for index, module in enumerate(modules, 1)
+    ]
+    units += [
+        SectionUnit(number, DCF_SECTIONS[number].splitlines()[0], outline["sections"][number])
+        for number in ("4", "5", "6")
+    ]
+    return units, [module["name"] for module in modules]
+
+
+def retrieval_query(unit, chunks):
+    """Texte de la recherche des passages d'une partie du DCF
+
+    Pour une section, sa structure attendue ; pour un module, son nom (répété
+    pour primer) et les titres des passages que le plan lui attribue.
+    """
+    if not unit.unit_id.startswith("3:"):
+        return DCF_SECTIONS[unit.unit_id]
+    headings = [chunks[i].text.strip().split("\n", 1)[0] for i in unit.chunks[:QUERY_HEADINGS]]
+    return " ".join([unit.title] * 3 + headings)
+
+
+def assemble(units):
+    """Assemble les parties rédigées en un DCF complet"""
+    parts = []
+    position = 0
+    for unit in units:
+        if unit.unit_id.startswith("3:"):
+            if position == 0:
+                parts.append(SECTION_3_TITLE)
+            position += 1
+            parts.append(f"#### 3.{position}. {unit.title}\n\n{unit.text.strip()}")
+        else:
+            parts.append(unit.text.strip())
+    return "\n\n".join(parts)
+
+
+def generate_dcf_sections(cdc_text, complete, deployment, cache=None, lineage=None, read_cache=True,
+                          max_workers=DEFAULT_MAX_WORKERS, on_progress=None, timer=None, retrieval_k=None):
+    """Génère le DCF section par section, en ne rédigeant que les sections dont le CDC a changé
+
+    complete est une fonction prompt -> texte. cache (ResultCache) conserve le
+    plan, les sections rédigées et, pour chaque lineage (nom du CDC), le
+    manifeste de la dernière génération qui sert de référence à la suivante.
+    on_progress(phase, done, total) est appelé avec phase valant "outline" ou
+    "sections". Avec retrieval_k, chaque partie reçoit les retrieval_k passages
+    du CDC les plus pertinents (voir retrieval_query).
+    """
+    chunks = split_into_chunks(cdc_text)
+    if not chunks:
+        raise ValueError("Le CDC ne contient aucun texte exploitable.")
+    hashes = chunk_hashes(chunks)
+
+    def progress(phase, done, total):
+        if on_progress:
+            on_progress(phase, done, total)
+
+    def measure(phase):
+        return timer.stage(phase) if timer else nullcontext()
+
+    def cached(key):
+        return cache.get(key) if cache is not None and read_cache else None
+
+    previous = None
+    if lineage:
+        manifest = cached(lineage_key(lineage, deployment))
+        previous = json.loads(manifest) if manifest else None
+
+    # Plan : repris de la version précédente si aucun passage n'a été ajouté
+    outline = None
+    changed = set(range(len(chunks)))
+    if previous:
+        mapping, changed, inserted = align_chunks(previous["chunks"], hashes)
+        if not inserted:
+            outline = _remap_outline(previous["outline"], mapping)
+    replanned = outline is None
+    outline_key = _digest("outline", PROMPT_VERSION, deployment, *hashes)
+    if outline is None:
+        response = cached(outline_key)
+        if response is None:
+            progress("outline", 0, 1)
+            with measure("outline"):
+                response = complete(
+                    fit_prompt(_chunk_digest(chunks), deployment, build=generate_outline_prompt).prompt
+                )
+            if cache is not None:
+                cache.put(outline_key, response)
+        outline = parse_outline(response, len(chunks))
+        progress("outline", 1, 1)
+
+    units, modules = build_units(outline, len(chunks))
+    retrieval = None
+    if retrieval_k:
+        with measure("index"):
+            index = Bm25Index(chunk.text for chunk in chunks)
+        with measure("retrieval"):
+            for unit in units:
+                hits = index.search(retrieval_query(unit, chunks), retrieval_k)
+                # Aucun terme en commun : les passages du plan sont conservés
+                unit.chunks = sorted(i for i, _ in hits) or unit.chunks
+        retrieval = index.stats()
+    prompts = {}
+    for unit in units:
+        dependencies = [hashes[i] for i in unit.chunks]
+        excerpts = "\n\n".join(chunks[i].text.strip() for i in unit.chunks)
+        if unit.unit_id.startswith("3:"):
+            unit.key = _digest("module", PROMPT_VERSION, deployment, unit.title, *dependencies)
+            build = lambda text: generate_module_prompt(unit.title, modules, text)
+        else:
+            # La section 2 décrit les modules : elle dépend aussi de leur liste
+            names = modules if unit.unit_id == "2" else ()
+            unit.key = _digest("section", PROMPT_VERSION, deployment, unit.unit_id, *names, "|", *dependencies)
+            build = lambda text: generate_section_prompt(unit.unit_id, text, modules)
+        unit.text = cached(unit.key)
+        if unit.text is None:
+            prompts[unit.unit_id] = fit_prompt(excerpts, deployment, build=build).prompt
+
+    pending = [unit for unit in units if unit.text is None]
+    done = 0
+    progress("sections", done, len(pending))
+
+    def on_done():
+        nonlocal done
+        done += 1
+        progress("sections", done, len(pending))
+
+    with measure("sections"):
+        texts = run_parallel([prompts[unit.unit_id] for unit in pending], complete, max_workers, on_done, timer)
+    for unit, text in zip(pending, texts):
+        unit.text = text
+        unit.regenerated = True
+        if cache is not None:
+            cache.put(unit.key, text)
+
+    if cache is not None and lineage:
+        cache.put(lineage_key(lineage, deployment), json.dumps({"chunks": hashes, "outline": outline}))
+
+    return SectionedResult(
+        dcf=assemble(units),
+        units=units,
+        chunk_count=len(chunks),
+        changed_chunks=len(changed),
+        replanned=replanned,
+        prompts=prompts,
+        retrieval=retrieval
+    )
@@ -0,0 +1,338 @@
+"""Génération structurée du DCF : le modèle remplit un schéma JSON, la mise en page est locale
+
+Le modèle ne rédige plus de markdown : il renvoie un objet JSON conforme à
+dcf.prompts.DCF_SCHEMA (une propriété par section, modules, fonctions et
+tableau des règles de gestion), imposé par les sorties structurées d'Azure
+OpenAI. Le document est ensuite composé localement (titres, listes,
+tableaux) et exporté en Word ou en texte comme un DCF rédigé en markdown.
+
+Chaque section est validée séparément ; seules les sections invalides
+(réponse tronquée, champ manquant, aucune spécification...) sont
+redemandées, chacune par une requête limitée à son propre schéma. Si le
+déploiement ne prend pas en charge les schémas JSON, la génération se
+rabat sur le mode objet JSON, le schéma étant alors décrit dans le prompt.
+"""
+
+import json
+from dataclasses import dataclass, field
+
+from .budget import fit_prompt
+from .mapreduce import DEFAULT_MAX_WORKERS, run_parallel
+from .prompts import (
+    DCF_SCHEMA, DCF_SECTIONS, SCHEMA_SECTIONS, generate_structured_prompt, generate_structured_section_prompt,
+    section_schema
+)
+from .timing import StageTimer
+
+# Nouvelles demandes au plus pour une même section invalide
+MAX_SECTION_RETRIES = 2
+JSON_OBJECT_FORMAT = {"type": "json_object"}
+
+# Titre de chaque sous-section, repris de la structure du DCF (« 1.1. Présentation générale du système »)
+_SUBSECTIONS = {
+    number: [line.strip() for line in text.splitlines()[1:] if line[:1].isdigit()]
+    for number, text in DCF_SECTIONS.items()
+}
+
+
+def response_format(name, schema):
+    """Paramètre response_format imposant un schéma JSON strict à la réponse"""
+    return {"type": "json_schema", "json_schema": {"name": name, "schema": schema, "strict": True}}
+
+
+def _schema_unsupported(error):
+    # Déploiement ou version d'API sans sorties structurées : l'erreur porte sur response_format
+    message = str(error).lower()
+    return "response_format" in message or "json_schema" in message
+
+
+def parse_json(text):
+    """Objet JSON de la réponse du modèle ; None si elle n'en contient pas"""
+    text = (text or "").strip()
+    if text.startswith("```"):
+        text = text.strip("`").removeprefix("json").strip()
+    try:
+        value = json.loads(text)
+    except ValueError:
+        return None
+    return value if isinstance(value, dict) else None
+
+
+def validate(value, schema, path="$"):
+    """Écarts entre une valeur et un schéma (sous-ensemble de JSON Schema utilisé par DCF_SCHEMA)"""
+    expected = schema["type"]
+    if expected == "object":
+        if not isinstance(value, dict):
+            return [f"{path} : objet attendu"]
+        problems = []
+        for name, child in schema["properties"].items():
+            if name not in value:
+                problems.append(f"{path}.{name} : champ manquant")
+            else:
+                problems.extend(validate(value[name], child, f"{path}.{name}"))
+        return problems
+    if expected == "array":
+        if not isinstance(value, list):
+            return [f"{path} : liste attendue"]
+        problems = []
+        for index, item in enumerate(value):
+            problems.extend(validate(item, schema["items"], f"{path}[{index}]"))
+        return problems
+    if not isinstance(value, str):
+        return [f"{path} : texte attendu"]
+    return []
+
+
+def validate_section(number, data):
+    """Problèmes de la section number dans l'objet data ; liste vide si elle est exploitable"""
+    name = SCHEMA_SECTIONS[number]
+    if not isinstance(data, dict) or name not in data:
+        return [f"{name} : section absente"]
+    value = data[name]
+    problems = validate(value, DCF_SCHEMA["properties"][name], name)
+    if problems:
+        return problems
+    if name == "specifications":
+        if not value:
+            problems.append("specifications : aucun module spécifié")
+        problems.extend(
+            f"specifications[{index}] : aucune fonction pour le module {module['nom']}"
+            for index, module in enumerate(value) if not module["fonctions"]
+        )
+    elif name == "regles_gestion":
+        identifiers = [rule["identifiant"].strip() for rule in value]
+        if not all(identifiers):
+            problems.append("regles_gestion : règle sans identifiant")
+        duplicates = sorted({identifier for identifier in identifiers if identifiers.count(identifier) > 1})
+        if duplicates:
+            problems.append(f"regles_gestion : identifiants en double ({', '.join(duplicates)})")
+    return problems
+
+
+def _cell(text):
+    return " ".join(text.split()).replace("|", "\\|") or "-"
+
+
+def _table(headers, rows):
+    lines = ["| " + " | ".join(headers) + " |", "|" + "---|" * len(headers)]
+    lines.extend("| " + " | ".join(_cell(value) for value in row) + " |" for row in rows)
+    return lines
+
+
+def _items(label, values, indent=""):
+    values = [value for value in values if value.strip()]
+    if not values:
+        return []
+    if label is None:
+        return [f"{indent}- {value}" for value in values]
+    if len(values) == 1:
+        return [f"{indent}- **{label} :** {values[0]}"]
+    return [f"{indent}- **{label} :**"] + [f"{indent}  - {value}" for value in values]
+
+
+def _render_cadre_general(data, titles):
+    presentation, references, environnement = data["presentation"], data["references"], data["environnement"]
+    lines = [titles[0]]
+    lines += _items("Objectifs", presentation["objectifs"])
+    lines += _items("Périmètre fonctionnel", presentation["perimetre"])
+    lines += _items("Finalité", [presentation["finalite"]])
+    lines += _items("Bénéfices attendus", presentation["benefices"])
+    lines += _items("Publics cibles", presentation["publics_cibles"])
+    lines += ["", titles[1]]
+    lines += _items("Documents", references["documents"])
+    lines += _items("Standards applicables", references["standards"])
+    lines += _items("Contraintes réglementaires", references["contraintes_reglementaires"])
+    lines += ["", titles[2]]
+    lines += _items("Architecture technique", environnement["architecture_technique"])
+    if environnement["systemes_connectes"]:
+        lines += ["", "**Systèmes connectés :**", ""]
+        lines += _table(
+            ("Système", "Interface"),
+            ((item["systeme"], item["interface"]) for item in environnement["systemes_connectes"])
+        )
+        lines.append("")
+    lines += _items("Contraintes d'intégration", environnement["contraintes_integration"])
+    lines += _items("Prérequis", environnement["prerequis"])
+    lines += _items("Déploiement", environnement["deploiement"])
+    lines += ["", titles[3], ""]
+    lines += _table(("Terme", "Définition"), ((item["terme"], item["definition"]) for item in data["terminologie"]))
+    return lines
+
+
+def _render_architecture(data, titles):
+    lines = [titles[0]]
+    for module in data["modules"]:
+        lines.append(f"- **{module['nom']}**")
+        lines += _items("Responsabilités", module["responsabilites"], "  ")
+        lines += _items("Interactions", module["interactions"], "  ")
+    lines += ["", titles[1], ""]
+    lines += _table(
+        ("Étape", "Émetteur", "Destinataire", "Flux"),
+        ((str(index), flow["source"], flow["destination"], flow["donnees"])
+         for index, flow in enumerate(data["synoptique"], 1))
+    )
+    return lines
+
+
+def _render_specifications(data, titles):
+    lines = []
+    for index, module in enumerate(data, 1):
+        lines += ["", f"#### 3.{index}. {module['nom']}"]
+        lines += _items("Finalité et portée", [module["finalite"]])
+        lines += _items("Contraintes et hypothèses", module["contraintes"])
+        for function in module["fonctions"]:
+            title = f"{function['code']} - {function['nom']}" if function["code"].strip() else function["nom"]
+            lines += ["", f"##### {title}"]
+            lines += _items("Objectif métier", [function["objectif"]])
+            lines += _items("Acteurs", [", ".join(function["acteurs"])])
+            lines += _items("Déclencheurs", function["declencheurs"])
+            lines += _items("Préconditions", function["preconditions"])
+            lines += _items("Postconditions", function["postconditions"])
+            lines += _items("Impacts IHM", function["ihm"])
+            lines += _items("Entrées", function["entrees"])
+            lines += _items("Traitement", function["traitement"])
+            lines += _items("Sorties", function["sorties"])
+            lines += _items("Règles de gestion", [", ".join(function["regles"])])
+            lines += _items("Cas d'erreur", function["erreurs"])
+    return lines
+
+
+def _render_reprise(data, titles):
+    return [titles[0]] + _items(None, data["procedure"]) + ["", titles[1]] + _items(None, data["contraintes"])
+
+
+def _render_regles(data, titles):
+    return [""] + _table(
+        ("Identifiant", "Libellé", "Module / fonction", "Source", "Critère d'application", "Exemple", "Exceptions"),
+        (
+            (rule["identifiant"], rule["libelle"], " / ".join(filter(None, (rule["module"], rule["fonction"]))),
+             rule["source"], rule["critere"], rule["exemple"], rule["exceptions"])
+            for rule in data
+        )
+    )
+
+
+def _render_visa(data, titles):
+    lines = [""] + _table(
+        ("Domaine", "Responsable", "Critères d'acceptation", "Preuves de validation"),
+        ((item["domaine"], item["responsable"], item["criteres"], item["preuves"]) for item in data["validations"])
+    )
+    return lines + [""] + _items("Planning de recette", data["planning"])
+
+
+_RENDERERS = {
+    "cadre_general": _render_cadre_general,
+    "architecture_fonctionnelle": _render_architecture,
+    "specifications": _render_specifications,
+    "reprise": _render_reprise,
+    "regles_gestion": _render_regles,
+    "visa": _render_visa
+}
+
+
+def render_section(number, data):
+    """Markdown de la section number à partir de sa valeur JSON (supposée valide)"""
+    title = DCF_SECTIONS[number].splitlines()[0].split(" (")[0]
+    lines = [title] + _RENDERERS[SCHEMA_SECTIONS[number]](data, _SUBSECTIONS[number])
+    return "\n".join(lines).strip()
+
+
+def render_markdown(data, invalid=()):
+    """Compose le DCF en markdown ; les sections de invalid sont signalées comme incomplètes"""
+    parts = []
+    for number, name in SCHEMA_SECTIONS.items():
+        if number in invalid:
+            title = DCF_SECTIONS[number].splitlines()[0].split(" (")[0]
+            parts.append(f"{title}\n> Section incomplète : la réponse du modèle n'a pas pu être validée.")
+        else:
+            parts.append(render_section(number, data[name]))
+    return "\n\n".join(parts) + "\n"
+
+
+@dataclass
+class StructuredResult:
+    """Résultat d'une génération structurée"""
+    data: dict
+    dcf: str
+    retried: list = field(default_factory=list)
+    invalid: list = field(default_factory=list)
+    json_schema: bool = True
+
+
+def generate_dcf_structured(cdc_text, call, deployment, page_offsets=None, max_workers=DEFAULT_MAX_WORKERS,
+                            on_progress=None, timer=None, max_retries=MAX_SECTION_RETRIES):
+    """Génère le DCF au format JSON puis le compose localement
+
+    call(prompt, response_format) envoie une requête et renvoie le texte de la
+    réponse. on_progress(phase, done, total) est appelé avec phase valant
+    "generation" puis, si des sections sont à reprendre, "repair".
+    """
+    timer = timer or StageTimer()
+    json_schema = True
+
+    def progress(phase, done, total):
+        if on_progress:
+            on_progress(phase, done, total)
+
+    def send(prompt_for, schema, name):
+        # prompt_for(schema embarqué ou None) -> prompt ; bascule en mode objet JSON si besoin
+        from openai import BadRequestError
+
+        nonlocal json_schema
+        if json_schema:
+            try:
+                return call(prompt_for(None), response_format(name, schema))
+            except BadRequestError as e:
+                if not _schema_unsupported(e):
+                    raise
+                json_schema = False
+        return call(prompt_for(schema), JSON_OBJECT_FORMAT)
+
+    def full_prompt(schema):
+        return fit_prompt(
+            cdc_text, deployment, page_offsets, build=lambda text: generate_structured_prompt(text, schema)
+        ).prompt
+
+    progress("generation", 0, 1)
+    with timer.stage("generation"):
+        data = parse_json(send(full_prompt, DCF_SCHEMA, "dcf")) or {}
+    progress("generation", 1, 1)
+
+    problems = {number: validate_section(number, data) for number in SCHEMA_SECTIONS}
+    problems = {number: found for number, found in problems.items() if found}
+    retried = sorted(problems)
+    for _ in range(max_retries):
+        if not problems:
+            break
+        numbers = sorted(problems)
+        done = 0
+        progress("repair", done, len(numbers))
+
+        def repair(number):
+            def prompt_for(schema):
+                return fit_prompt(
+                    cdc_text, deployment, page_offsets,
+                    build=lambda text: generate_structured_section_prompt(number, text, problems[number], schema)
+                ).prompt
+            return parse_json(send(prompt_for, section_schema(number), f"dcf_section_{number}"))
+
+        def on_done():
+            nonlocal done
+            done += 1
+            progress("repair", done, len(numbers))
+
+        with timer.stage("repair"):
+            answers = run_parallel(numbers, repair, max_workers=max_workers, on_done=on_done, timer=timer)
+        for number, answer in zip(numbers, answers):
+            found = validate_section(number, answer)
+            if found:
+                problems[number] = found
+            else:
+                data[SCHEMA_SECTIONS[number]] = answer[SCHEMA_SECTIONS[number]]
+                del problems[number]
+
+    invalid = sorted(problems)
+    timer.metadata.update(structured_retried=retried, structured_invalid=invalid, json_schema=json_schema)
+    return StructuredResult(
+        data=data, dcf=render_markdown(data, invalid), retried=retried, invalid=invalid, json_schema=json_schema
+    )
@@ -0,0 +1,118 @@
+"""Mesure des temps de traitement par étape du pipeline de génération
+
+Chaque génération produit une ligne JSON (horodatage, identifiant, durées
+par étape et métadonnées) dans un journal append-only, exploitable pour
+repérer les régressions de performance en charge.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from .cache import DEFAULT_CACHE_DIR
+
+# Journal partagé par l'application, la file de travaux et la ligne de commande,
+# quel que soit le dossier depuis lequel ils sont lancés
+DEFAULT_LOG_DIR = os.environ.get("DCF_LOG_DIR", DEFAULT_CACHE_DIR)
+DEFAULT_LOG_PATH = os.environ.get("DCF_TIMINGS_LOG", os.path.join(DEFAULT_LOG_DIR, "timings.jsonl"))
+
+# Libellés des étapes connues, dans l'ordre du pipeline
+STAGE_LABELS = {
+    "extraction": "Extraction du texte",
+    "analysis": "Pré-extraction des sigles et règles",
+    "prompt": "Construction du prompt",
+    "cache": "Consultation du cache",
+    "queue": "Attente avant envoi",
+    "ttft": "Premier token",
+    "generation": "Génération",
+    "map": "Analyse des segments",
+    "merge": "Fusion des analyses",
+    "reduce": "Rédaction du DCF",
+    "outline": "Plan du DCF",
+    "index": "Indexation du CDC",
+    "retrieval": "Recherche des passages",
+    "sections": "Rédaction des sections",
+    "repair": "Reprise des sections invalides",
+    "export_docx": "Export Word",
+    "export_txt": "Export TXT"
+}
+
+_log_lock = threading.Lock()
+
+
+def stage_rows(stages):
+    """Met en forme des durées par étape (StageTimer.as_dict) en lignes pour l'affichage"""
+    order = list(STAGE_LABELS) + sorted(set(stages) - set(STAGE_LABELS))
+    return [
+        {
+            "Étape": STAGE_LABELS.get(name, name),
+            "Durée (s)": stages[name]["seconds"],
+            "Occurrences": stages[name]["count"]
+        }
+        for name in order if name in stages
+    ]
+
+
+class StageTimer:
+    """Accumule les durées des étapes d'une génération
+
+    Une étape mesurée plusieurs fois (par exemple l'attente de chaque segment
+    en mode map-reduce) est cumulée ; son nombre d'occurrences et sa durée
+    maximale sont conservés. Utilisable depuis plusieurs threads.
+    """
+
+    def __init__(self, **metadata):
+        self.run_id = uuid.uuid4().hex[:12]
+        self.metadata = metadata
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds):
+        with self._lock:
+            total, count, longest = self._stages.get(name, (0.0, 0, 0.0))
+            self._stages[name] = (total + seconds, count + 1, max(longest, seconds))
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def get(self, name):
+        """Renvoie la durée cumulée d'une étape, ou None si elle n'a pas été mesurée"""
+        with self._lock:
+            entry = self._stages.get(name)
+        return entry[0] if entry else None
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                name: {"seconds": round(total, 4), "count": count, "max": round(longest, 4)}
+                for name, (total, count, longest) in self._stages.items()
+            }
+
+    def rows(self):
+        """Renvoie les étapes sous forme de lignes (libellé, durée, occurrences) pour l'affichage"""
+        return stage_rows(self.as_dict())
+
+    def to_record(self):
+        return {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "run_id": self.run_id,
+            "stages": self.as_dict(),
+            **self.metadata
+        }
+
+    def write_jsonl(self, path=DEFAULT_LOG_PATH):
+        """Ajoute les mesures au journal JSON lines"""
+        line = json.dumps(self.to_record(), ensure_ascii=False)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with _log_lock, open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
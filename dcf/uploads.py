@@ -0,0 +1,163 @@
+"""Réception des fichiers volumineux : écriture sur disque et contrôle d'admission
+
+Un fichier uploadé au-delà de SPOOL_THRESHOLD_BYTES est écrit dans un
+fichier temporaire, que PyMuPDF et le lecteur DOCX ouvrent par son chemin :
+son contenu n'est pas recopié en mémoire à côté du tampon de Streamlit.
+
+Les extractions simultanées d'un processus partagent un budget mémoire
+(MemoryBudget) : une extraction qui ne tient pas dans la part restante
+attend qu'une autre se termine, au lieu d'exposer le serveur à un arrêt
+faute de mémoire lorsque plusieurs utilisateurs envoient de gros fichiers.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+MB = 1024 * 1024
+SPOOL_THRESHOLD_BYTES = int(os.environ.get("DCF_SPOOL_THRESHOLD_MB", "16")) * MB
+DEFAULT_MEMORY_BUDGET_BYTES = int(os.environ.get("DCF_EXTRACTION_MEMORY_MB", "512")) * MB
+# Mémoire de travail d'une extraction, rapportée à la taille du fichier
+# (structures de MuPDF ou de lxml) ; le texte extrait est compté à part
+EXTRACTION_MEMORY_FACTOR = 2
+# Nombre maximal de caractères de texte par octet de fichier : un DOCX est
+# une archive compressée, dont le texte peut dépasser la taille
+TEXT_CHARS_PER_BYTE = {".docx": 4}
+# Octets par caractère du texte en mémoire : une apostrophe typographique
+# suffit à faire passer une chaîne Python à 2 octets par caractère, et le
+# texte est présent deux fois au moment de la jointure (pages et résultat)
+TEXT_BYTES_PER_CHAR = 2 * 2
+SPOOL_BLOCK_BYTES = MB
+
+
+def file_size(fileobj):
+    """Taille d'un fichier ouvert, sans le lire"""
+    size = getattr(fileobj, "size", None)
+    if size is not None:
+        return size
+    position = fileobj.tell()
+    try:
+        return fileobj.seek(0, os.SEEK_END)
+    finally:
+        fileobj.seek(position)
+
+
+def extraction_cost(size, suffix=""):
+    """Estimation de la mémoire nécessaire à l'extraction d'un fichier de size octets, texte joint compris
+
+    suffix est l'extension du fichier (".pdf", ".docx"...).
+    """
+    text_chars = size * TEXT_CHARS_PER_BYTE.get(suffix, 1)
+    return size * EXTRACTION_MEMORY_FACTOR + text_chars * TEXT_BYTES_PER_CHAR
+
+
+@contextmanager
+def spooled(fileobj, threshold=SPOOL_THRESHOLD_BYTES, suffix=""):
+    """Fournit un fichier uploadé sous une forme acceptée par dcf.extraction
+
+    En dessous du seuil, le fichier ouvert lui-même ; au-delà, le chemin d'une
+    copie temporaire sur disque, supprimée à la sortie du bloc.
+    """
+    if file_size(fileobj) <= threshold:
+        yield fileobj
+        return
+    handle, path = tempfile.mkstemp(prefix="dcf_upload_", suffix=suffix)
+    try:
+        with os.fdopen(handle, "wb") as spool:
+            if hasattr(fileobj, "getbuffer"):
+                # Tampon en mémoire (UploadedFile) : écrit sans copie intermédiaire
+                with fileobj.getbuffer() as view:
+                    spool.write(view)
+            else:
+                fileobj.seek(0)
+                shutil.copyfileobj(fileobj, spool, SPOOL_BLOCK_BYTES)
+        yield path
+    finally:
+        os.remove(path)
+
+
+class MemoryBudget:
+    """Budget mémoire partagé par les extractions simultanées d'un processus
+
+    Une réservation plus grosse que le budget entier est admise quand plus
+    rien d'autre n'est en cours, pour qu'un très gros fichier finisse par
+    passer au lieu d'attendre indéfiniment.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MEMORY_BUDGET_BYTES):
+        self.max_bytes = max_bytes
+        self.in_use = 0
+        self.active = 0
+        self._waiting = deque()
+        self._cond = threading.Condition()
+
+    def _fits(self, nbytes):
+        return not self.active or self.in_use + nbytes <= self.max_bytes
+
+    def acquire(self, nbytes, on_wait=None):
+        """Réserve nbytes, en attendant si besoin ; renvoie le temps d'attente
+
+        Les demandes en attente sont servies dans leur ordre d'arrivée : un
+        gros fichier n'est pas doublé indéfiniment par de plus petits. on_wait
+        est appelé une fois, avant de commencer à attendre (pour prévenir
+        l'utilisateur que sa demande est en file d'attente), hors du verrou : un
+        rappel lent ou en erreur ne bloque ni les libérations ni les autres
+        demandes.
+        """
+        start = time.monotonic()
+        with self._cond:
+            if not self._waiting and self._fits(nbytes):
+                self.in_use += nbytes
+                self.active += 1
+                return time.monotonic() - start
+            ticket = object()
+            self._waiting.append(ticket)
+        try:
+            if on_wait is not None:
+                on_wait()
+            with self._cond:
+                while self._waiting[0] is not ticket or not self._fits(nbytes):
+                    self._cond.wait()
+                self.in_use += nbytes
+                self.active += 1
+        finally:
+            with self._cond:
+                self._waiting.remove(ticket)
+                # La demande suivante est peut-être admissible elle aussi
+                self._cond.notify_all()
+        return time.monotonic() - start
+
+    def release(self, nbytes):
+        with self._cond:
+            self.in_use -= nbytes
+            self.active -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def reserve(self, nbytes, on_wait=None):
+        self.acquire(nbytes, on_wait)
+        try:
+            yield
+        finally:
+            self.release(nbytes)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "in_use": self.in_use,
+                "max_bytes": self.max_bytes,
+                "active": self.active,
+                "waiting": len(self._waiting)
+            }
+
+
+_memory_budget = MemoryBudget()
+
+
+def get_memory_budget():
+    """Budget mémoire des extractions du processus"""
+    return _memory_budget
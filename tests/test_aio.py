@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from dcf.aio import agenerate_dcf_map_reduce
+from dcf.mapreduce import generate_dcf_map_reduce
+
+CDC = "\n\n".join(f"Exigence {i} : le système conserve l'historique des dossiers." * 20 for i in range(40))
+
+
+def _answer(prompt):
+    return f"notes ({len(prompt)} caractères)"
+
+
+def test_fan_out_matches_the_threaded_version():
+    expected = generate_dcf_map_reduce(CDC, _answer, max_workers=3, segment_tokens=500)
+
+    async def send(prompt):
+        await asyncio.sleep(0)
+        return _answer(prompt)
+
+    result = asyncio.run(agenerate_dcf_map_reduce(CDC, send, max_workers=3, segment_tokens=500))
+    assert len(result.segments) > 1
+    assert result.extractions == expected.extractions
+    assert result.reduce_prompt == expected.reduce_prompt
+    assert result.dcf == expected.dcf
+
+
+def test_fan_out_is_bounded_by_max_workers():
+    running = 0
+    peak = 0
+    phases = []
+
+    async def send(prompt):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return "notes"
+
+    asyncio.run(agenerate_dcf_map_reduce(
+        CDC, send, max_workers=2, segment_tokens=500, on_progress=lambda phase, done, total: phases.append(phase)
+    ))
+    assert peak == 2
+    assert phases[0] == "map" and phases[-1] == "reduce"
+
+
+def test_first_error_cancels_the_other_requests():
+    calls = 0
+    cancelled = 0
+
+    async def send(prompt):
+        nonlocal calls, cancelled
+        calls += 1
+        if calls == 1:
+            raise RuntimeError("quota")
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled += 1
+            raise
+        return "notes"
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(agenerate_dcf_map_reduce(CDC, send, max_workers=4, segment_tokens=500))
+    assert cancelled > 0
+
+
+class _Router:
+    def complete(self, prompt, usage=None):
+        return "### 1. CADRE GENERAL\nTexte."
+
+
+class _BrokenHistory:
+    def add(self, *args, **kwargs):
+        raise RuntimeError("disque plein")
+
+
+def test_history_failures_do_not_fail_the_generation(monkeypatch):
+    import dcf.aio
+
+    def broken_export(dcf, memo=None):
+        raise KeyError("no style with name 'Heading 0'")
+
+    monkeypatch.setattr(dcf.aio, "word_document", broken_export)
+    result = asyncio.run(dcf.aio.agenerate_dcf(
+        "Le système gère les dossiers.", "clé", "https://exemple", "gpt-4o", router=_Router(), history=_BrokenHistory()
+    ))
+    assert result.ok and result.dcf.startswith("### 1.")
@@ -0,0 +1,51 @@
+import pytest
+
+import dcf.budget
+from dcf.budget import count_tokens, fit_prompt
+from dcf.chunking import estimate_tokens
+
+DEPLOYMENT = "gpt-4"
+
+
+@pytest.fixture
+def without_tokenizer(monkeypatch):
+    monkeypatch.setattr(dcf.budget, "get_encoding", lambda deployment: None)
+
+
+def _largest_fitting(available):
+    """Longueur du plus long texte sans espaces dont le décompte tient dans available tokens"""
+    low, high = 0, available * 8
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens("x" * middle, DEPLOYMENT) <= available:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def test_fallback_overestimates_the_character_heuristic(without_tokenizer):
+    text = "Le système vérifie l'éligibilité des bénéficiaires à chaque étape du dossier. " * 50
+    assert count_tokens(text, DEPLOYMENT) > estimate_tokens(text)
+
+
+def test_cdc_at_the_boundary_is_sent_whole(without_tokenizer):
+    empty = fit_prompt("", DEPLOYMENT)
+    available = empty.input_budget - empty.prompt_tokens
+    length = _largest_fitting(available)
+
+    budget = fit_prompt("x" * length, DEPLOYMENT)
+    assert budget.fits and not budget.compressed and not budget.exact
+    assert budget.prompt_tokens <= budget.input_budget
+
+    budget = fit_prompt("x" * (length + 8), DEPLOYMENT)
+    assert not budget.fits
+    assert budget.prompt_tokens <= budget.input_budget
+
+
+def test_counts_with_the_tokenizer_when_available():
+    pytest.importorskip("tiktoken")
+    budget = fit_prompt("Le système gère les dossiers.", "gpt-4o")
+    if not budget.exact:
+        pytest.skip("encodage tiktoken indisponible hors ligne")
+    assert budget.fits and budget.prompt_tokens < budget.input_budget
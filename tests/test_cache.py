@@ -0,0 +1,32 @@
+from dcf.cache import ResultCache, make_cache_key
+
+
+def test_key_ignores_spacing_but_not_the_generation_settings():
+    key = make_cache_key("Le système\n\ngère  les dossiers.", "v1", "gpt-4o", 0.7)
+    assert key == make_cache_key(" Le système gère les dossiers. ", "v1", "gpt-4o", 0.7)
+    assert key != make_cache_key("Le système gère les dossiers.", "v2", "gpt-4o", 0.7)
+    assert key != make_cache_key("Le système gère les dossiers.", "v1", "gpt-4o", 0)
+    assert key != make_cache_key("Le système gère les dossiers.", "v1", "gpt-4o", 0.7, mode="retrieval")
+
+
+def test_entries_survive_a_reopening(tmp_path):
+    key = make_cache_key("CDC", "v1", "gpt-4o", 0.7)
+    ResultCache(str(tmp_path)).put(key, "### 1. CADRE GENERAL\nTexte accentué.")
+
+    cache = ResultCache(str(tmp_path))
+    assert len(cache) == 1
+    assert cache.get(key) == "### 1. CADRE GENERAL\nTexte accentué."
+    assert cache.get(make_cache_key("autre CDC", "v1", "gpt-4o", 0.7)) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ResultCache(str(tmp_path), max_entries=2)
+    cache.put("a" * 64, "premier")
+    cache.put("b" * 64, "deuxième")
+    # Un accès rend l'entrée la plus récente
+    cache.get("a" * 64)
+    cache.put("c" * 64, "troisième")
+    assert cache.get("b" * 64) is None
+    assert cache.get("a" * 64) == "premier" and cache.get("c" * 64) == "troisième"
+    assert cache.stats()["evictions"] == 1
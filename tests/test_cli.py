@@ -0,0 +1,38 @@
+import os
+
+import pytest
+
+from dcf.cli import output_names, relative_inputs
+
+
+def test_same_name_in_different_folders_keeps_the_folders():
+    paths = [os.path.join("in", "a", "cdc.txt"), os.path.join("in", "b", "cdc.txt")]
+    relative = relative_inputs(paths)
+    assert relative == {paths[0]: "a/cdc.txt", paths[1]: "b/cdc.txt"}
+    assert sorted(output_names(relative).values()) == ["a/cdc", "b/cdc"]
+
+
+def test_same_stem_in_one_folder_is_told_apart_by_extension():
+    paths = [os.path.join("in", "x.pdf"), os.path.join("in", "x.docx"), os.path.join("in", "y.txt")]
+    assert sorted(output_names(relative_inputs(paths)).values()) == ["x_docx", "x_pdf", "y"]
+
+
+def test_remaining_conflicts_are_rejected():
+    with pytest.raises(ValueError):
+        output_names({"in/x.txt": "x.txt", "./in/x.txt": "x.txt"})
+
+
+def test_failed_files_leave_a_timing_record(tmp_path):
+    import json
+
+    from dcf.cli import main
+
+    empty = tmp_path / "vide.txt"
+    empty.write_text("   ", encoding="utf-8")
+    log = tmp_path / "timings.jsonl"
+    main([
+        str(empty), "-o", str(tmp_path / "out"), "--api-key", "clé", "--endpoint", "https://exemple",
+        "--no-cache", "--timings-log", str(log)
+    ])
+    records = [json.loads(line) for line in log.read_text(encoding="utf-8").splitlines()]
+    assert [record["outcome"] for record in records] == ["error"]
@@ -0,0 +1,47 @@
+import io
+
+from dcf.docx_reader import extract_docx
+
+
+def _docx(build):
+    from docx import Document
+
+    doc = Document()
+    build(doc)
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def test_headings_lists_and_tables_keep_their_structure():
+    def build(doc):
+        doc.add_heading("Cahier des charges", level=1)
+        doc.add_paragraph("Le système gère les dossiers.")
+        doc.add_heading("Règles de gestion", level=2)
+        doc.add_paragraph("Un dossier clos ne peut être rouvert", style="List Bullet")
+        table = doc.add_table(rows=3, cols=2)
+        for row, cells in zip(table.rows, [("Sigle", "Définition"), ("SI", "Système | information"), ("", "")]):
+            for cell, text in zip(row.cells, cells):
+                cell.text = text
+        doc.add_paragraph("Fin du document.")
+
+    assert extract_docx(_docx(build)) == (
+        "# Cahier des charges\n"
+        "Le système gère les dossiers.\n"
+        "## Règles de gestion\n"
+        "- Un dossier clos ne peut être rouvert\n"
+        "| Sigle | Définition |\n| --- | --- |\n| SI | Système \\| information |\n"
+        "Fin du document.\n"
+    )
+
+
+def test_nested_tables_are_flattened_into_their_cell():
+    def build(doc):
+        cell = doc.add_table(rows=1, cols=2).rows[0].cells
+        cell[0].text = "Module"
+        nested = cell[1].add_table(rows=1, cols=1)
+        nested.rows[0].cells[0].text = "Import"
+
+    text = extract_docx(_docx(build))
+    assert text.startswith("| Module | Import |\n| --- | --- |")
+    assert text.count("Import") == 1
@@ -0,0 +1,40 @@
+from dcf.export import markdown_to_docx
+
+
+def _headings(text):
+    return [
+        (paragraph.style.name, paragraph.text) for paragraph in markdown_to_docx(text).paragraphs
+        if paragraph.style.name.startswith("Heading")
+    ]
+
+
+def test_numbered_subsections_sit_below_their_section():
+    # Forme du modèle de prompt et du rendu structuré : section à dièses, sous-sections numérotées
+    dcf = "### 1. CADRE GENERAL\n1.1. Présentation générale du système\nTexte.\n1.1.1. Objectifs\n" \
+          "### 2. ARCHITECTURE FONCTIONNELLE\n2.1. Modules fonctionnels\n"
+    assert _headings(dcf) == [
+        ("Heading 3", "1. CADRE GENERAL"),
+        ("Heading 4", "1.1. Présentation générale du système"),
+        ("Heading 5", "1.1.1. Objectifs"),
+        ("Heading 3", "2. ARCHITECTURE FONCTIONNELLE"),
+        ("Heading 4", "2.1. Modules fonctionnels"),
+    ]
+
+
+def test_numbered_headings_without_sections_keep_their_depth():
+    assert _headings("1.2. Références\n3.1.4 Règles\n") == [
+        ("Heading 2", "1.2. Références"), ("Heading 3", "3.1.4 Règles")
+    ]
+
+
+def test_structured_rendering_exports_a_consistent_outline():
+    from dcf.structured import render_section
+
+    levels = [int(style.split()[-1]) for style, _ in _headings(render_section("4", {"procedure": "Import des dossiers.", "contraintes": "Arrêt d'une nuit."}))]
+    assert levels and levels[0] < min(levels[1:])
+
+
+def test_deep_number_under_a_shallow_heading_keeps_a_valid_level():
+    assert _headings("# 3.1.2 Règles\n1.1 Sous-partie\n") == [
+        ("Heading 1", "3.1.2 Règles"), ("Heading 2", "1.1 Sous-partie")
+    ]
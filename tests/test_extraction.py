@@ -0,0 +1,36 @@
+import io
+
+from dcf.extraction import PDF_MIME, extract_upload
+from dcf.uploads import extraction_cost
+
+
+def _pdf(pages):
+    import fitz
+
+    doc = fitz.open()
+    for text in pages:
+        doc.new_page().insert_text((72, 72), text)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+class _Upload(io.BytesIO):
+    """Fichier en mémoire dont le contenu ne doit pas être recopié par read()"""
+
+    def read(self, *args):
+        raise AssertionError("le PDF a été recopié")
+
+
+def test_small_pdf_upload_is_read_from_its_buffer():
+    upload = _Upload(_pdf(["Page un", "Page deux"]))
+    document = extract_upload(upload, PDF_MIME, pdf_workers=1)
+    assert "Page un" in document.text and "Page deux" in document.text
+    assert len(document.page_offsets) == 2
+    # La vue sur le tampon est relâchée : le fichier reste modifiable
+    upload.write(b"")
+
+
+def test_extraction_cost_counts_the_joined_text():
+    assert extraction_cost(1000) > 1000 * 3
+    assert extraction_cost(1000, ".docx") > extraction_cost(1000, ".pdf")
@@ -0,0 +1,49 @@
+import sqlite3
+from contextlib import closing
+
+from dcf.history import HistoryStore
+
+DCF = "### 1. CADRE GENERAL\nLe système gère les dossiers."
+
+
+def _store(tmp_path, **kwargs):
+    return HistoryStore(str(tmp_path / "historique.sqlite3"), **kwargs)
+
+
+def test_a_generation_is_read_back_from_another_connection(tmp_path):
+    store = _store(tmp_path)
+    entry_id = store.add("CDC_Allocations.pdf", "empreinte", "gpt-4o", "v1", DCF, mode="direct",
+                         stages={"llm": 1.5}, tokens={"total_tokens": 42}, docx=b"PK docx")
+    with closing(sqlite3.connect(store.path)) as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    entry = HistoryStore(store.path).get(entry_id)
+    assert entry.dcf == DCF and entry.dcf_chars == len(DCF)
+    assert entry.stages == {"llm": 1.5} and entry.tokens == {"total_tokens": 42}
+    assert store.get_docx(entry_id) == b"PK docx"
+    assert store.find("empreinte", deployment="gpt-4o").id == entry_id
+    assert store.find("empreinte", deployment="gpt-35") is None
+
+
+def test_search_reads_metadata_only(tmp_path):
+    store = _store(tmp_path)
+    store.add("CDC_Allocations.pdf", "a", "gpt-4o", "v1", DCF, build_docx=False)
+    store.add("cdc_archivage.docx", "b", "gpt-4o", "v1", DCF, build_docx=False)
+    store.add("100%_CDC.pdf", "c", "gpt-4o", "v1", DCF, build_docx=False)
+
+    assert [entry.file_name for entry in store.search()] == ["100%_CDC.pdf", "cdc_archivage.docx",
+                                                              "CDC_Allocations.pdf"]
+    assert all(entry.dcf is None for entry in store.search())
+    assert [entry.file_name for entry in store.search("CDC_AR")] == ["cdc_archivage.docx"]
+    assert [entry.file_name for entry in store.search("100%")] == ["100%_CDC.pdf"]
+
+
+def test_entry_without_document_and_purge(tmp_path):
+    store = _store(tmp_path, max_entries=2)
+    first = store.add("premier.pdf", "a", "gpt-4o", "v1", DCF, build_docx=False)
+    assert store.get_docx(first) is None
+    for name in ("deuxième.pdf", "troisième.pdf"):
+        store.add(name, "a", "gpt-4o", "v1", DCF, build_docx=False)
+    store.purge()
+    assert store.count() == 2 and store.get(first) is None
+    assert store.delete(store.search()[0].id) and store.count() == 1
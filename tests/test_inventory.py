@@ -0,0 +1,89 @@
+from dcf.inventory import analyze_cdc
+
+CDC = """1. CONTEXTE
+IMPORTANT : Le système doit conserver les dossiers dix ans.
+ATTENTION : toute modification d'un dossier clos est interdite.
+- CNAF : Caisse nationale des allocations familiales
+La CNAF transmet les dossiers au SI.
+"""
+
+
+def test_uppercase_words_are_not_acronyms():
+    inventory = analyze_cdc(CDC)
+    assert "IMPORTANT" not in inventory.acronyms
+    assert "ATTENTION" not in inventory.acronyms
+    table = inventory.glossary_table()
+    assert "IMPORTANT" not in table and "ATTENTION" not in table
+
+
+def test_only_matching_definitions_are_removed_from_the_prompt():
+    inventory = analyze_cdc(CDC)
+    assert "IMPORTANT : Le système doit conserver les dossiers dix ans." in inventory.text
+    assert "ATTENTION : toute modification d'un dossier clos est interdite." in inventory.text
+    assert "[CNAF : voir l'inventaire]" in inventory.text
+    assert inventory.acronyms["CNAF"].expansion == "Caisse nationale des allocations familiales"
+
+
+RULES_CDC = """2. REGLES
+| Identifiant | Règle | Priorité |
+|---|---|---|
+| RG-001 | Le montant saisi doit être positif | Haute |
+| RG-002 | Un dossier clos ne peut être rouvert | Basse |
+Le contrôle RG-001 s'applique aussi aux avoirs.
+"""
+
+
+def test_rules_table_is_inventoried_and_replaced():
+    inventory = analyze_cdc(RULES_CDC)
+    assert inventory.rules["RG-001"].text == "Le montant saisi doit être positif (Priorité : Haute)"
+    assert inventory.rules["RG-001"].occurrences == 2
+    assert inventory.rules["RG-002"].section == "2. REGLES"
+    assert "Le montant saisi" not in inventory.text
+    assert "[Règles RG-001" in inventory.text
+    assert "| RG-002 | Un dossier clos ne peut être rouvert (Priorité : Basse) | 2. REGLES |" in inventory.rules_table()
+
+
+def test_rule_definition_continues_on_the_following_lines():
+    cdc = "- RG-010 : Le dossier est transmis au service instructeur\nau plus tard deux jours après sa saisie.\n" \
+          "Le service accuse réception.\n"
+    inventory = analyze_cdc(cdc)
+    assert inventory.rules["RG-010"].text == \
+        "Le dossier est transmis au service instructeur au plus tard deux jours après sa saisie."
+    assert inventory.text == "[RG-010 : voir l'inventaire]\nLe service accuse réception.\n"
+
+
+def test_missing_sections_are_added_before_the_next_one():
+    inventory = analyze_cdc(RULES_CDC + "- CNAF : Caisse nationale des allocations familiales\n")
+    dcf = "### 1. CADRE GENERAL\n1.1. Présentation\nTexte.\n### 2. ARCHITECTURE\nTexte.\n### 6. ANNEXES\n"
+    completed = inventory.complete_dcf(dcf)
+    lines = completed.splitlines()
+    assert lines.index("1.4. Terminologie et sigles") < lines.index("### 2. ARCHITECTURE")
+    assert lines.index("### 5. RECAPITULATIF DES REGLES DE GESTION") < lines.index("### 6. ANNEXES")
+    assert "| CNAF | Caisse nationale des allocations familiales |" in completed
+    assert "| RG-001 |" in completed
+
+
+def test_existing_sections_are_replaced():
+    inventory = analyze_cdc(RULES_CDC)
+    dcf = "1.4. Terminologie et sigles\nTableau rédigé par le modèle.\n### 2. ARCHITECTURE\n" \
+          "### 5. RECAPITULATIF DES REGLES DE GESTION\n| RG-999 | inventée |\n"
+    completed = inventory.complete_dcf(dcf)
+    assert "rédigé par le modèle" not in completed and "RG-999" not in completed
+    assert completed.count("1.4. Terminologie et sigles") == 1
+
+
+def test_page_starts_follow_the_replacements():
+    page_1 = "1. CONTEXTE\n- RG-001 : Le montant doit être positif.\nTexte de la page 1.\n"
+    glossary = "| Sigle | Définition |\n|---|---|\n| CNAF | Caisse nationale des allocations familiales |\n"
+    page_2 = "| SI | Système d'information |\nTexte de la page 2.\n"
+    page_3 = "Texte de la page 3.\n"
+    text = page_1 + glossary + page_2 + page_3
+    # Le glossaire commence en page 1 et se termine en page 2
+    offsets = [0, len(page_1) + len(glossary), len(page_1) + len(glossary) + len(page_2)]
+    inventory = analyze_cdc(text, offsets)
+
+    compact = inventory.text
+    start_2, start_3 = inventory.page_offsets[1:]
+    assert compact[start_2:].startswith("[Glossaire : voir l'inventaire]")
+    assert compact[start_3:] == page_3
+    assert inventory.acronyms["SI"].pages == [1]
@@ -0,0 +1,60 @@
+import os
+import socket
+import threading
+import time
+
+from dcf.jobs import FAILED, QUEUED, RUNNING, JobQueue, JobStore
+
+
+def test_claim_takes_the_oldest_queued_job_once(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    first = store.submit("hôte:1", "a.txt", "Premier CDC", {"deployment": "gpt-4o"})
+    store.submit("hôte:1", "b.txt", "Second CDC", {"deployment": "gpt-4o"}, page_offsets=[0, 5])
+    store.submit("autre:2", "c.txt", "CDC d'un autre processus", {})
+
+    job = store.claim_next("hôte:1")
+    assert job["id"] == first and job["cdc_text"] == "Premier CDC"
+    assert store.get(first).status == RUNNING
+    assert store.claim_next("hôte:1")["page_offsets"] == [0, 5]
+    assert store.claim_next("hôte:1") is None
+
+
+def test_jobs_of_a_stopped_process_are_failed(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    host = socket.gethostname()
+    # Un pid au-delà de la limite du noyau ne peut pas être vivant
+    orphan = store.submit(f"{host}:4194305", "a.txt", "CDC", {})
+    store.claim_next(f"{host}:4194305")
+    waiting = store.submit(f"{host}:4194305", "b.txt", "CDC", {})
+    alive = store.submit(f"{host}:{os.getpid()}", "c.txt", "CDC", {})
+
+    store.recover_orphans()
+    assert store.get(orphan).status == FAILED
+    assert store.get(waiting).status == FAILED
+    assert store.get(alive).status == QUEUED
+
+
+class _BusyStore(JobStore):
+    """Base dont la prise d'un travail attend un autre processus"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.claiming = threading.Event()
+        self.unblock = threading.Event()
+
+    def claim_next(self, owner):
+        self.claiming.set()
+        self.unblock.wait(5)
+        return None
+
+
+def test_submit_does_not_wait_for_a_pending_claim(tmp_path):
+    store = _BusyStore(str(tmp_path / "jobs.sqlite3"))
+    queue = JobQueue(store, concurrency=1).start()
+    assert store.claiming.wait(2)
+
+    started = time.perf_counter()
+    job_id = queue.submit("a.txt", "CDC", "clé", "https://exemple", "gpt-4o")
+    assert time.perf_counter() - started < 1
+    assert queue.cancel(job_id)
+    store.unblock.set()
@@ -0,0 +1,56 @@
+import pytest
+
+import dcf.llm
+from dcf.llm import RateLimiter
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(dcf.llm, "time", clock)
+    return clock
+
+
+def test_requests_wait_for_the_bucket_to_refill(clock):
+    # 60 requêtes/min : seau de 10 requêtes (fenêtre de 10 s), une requête par seconde ensuite
+    limiter = RateLimiter(rpm=60)
+    assert all(limiter.try_acquire(0) == 0 for _ in range(10))
+    assert limiter.try_acquire(0) == pytest.approx(1.0)
+    clock.now += 1
+    assert limiter.try_acquire(0) == 0
+
+
+def test_tokens_are_settled_with_the_actual_usage(clock):
+    limiter = RateLimiter(tpm=6000)
+    assert limiter.try_acquire(5000) == 0
+    assert limiter.try_acquire(2000) == pytest.approx(10.0)
+    # La requête n'a consommé que 1000 tokens : le reste est rendu au seau
+    limiter.settle(5000, 1000)
+    assert limiter.try_acquire(2000) == 0
+
+
+def test_a_request_larger_than_the_bucket_passes_once_it_is_full(clock):
+    limiter = RateLimiter(tpm=1000)
+    assert limiter.try_acquire(5000) == 0
+    assert limiter.try_acquire(5000) == pytest.approx(60.0)
+
+
+def test_retry_after_pauses_every_request(clock):
+    limiter = RateLimiter(rpm=600, tpm=100000)
+    limiter.pause(20)
+    assert limiter.try_acquire(10) == pytest.approx(20.0)
+    clock.now += 20
+    assert limiter.try_acquire(10) == 0
+
+
+def test_no_quota_never_waits(clock):
+    limiter = RateLimiter()
+    assert all(limiter.try_acquire(100000) == 0 for _ in range(100))
@@ -0,0 +1,35 @@
+import pytest
+
+import dcf.mapreduce
+from dcf.chunking import split_into_segments
+from dcf.mapreduce import generate_dcf_map_reduce
+
+CDC = "\n\n".join(f"Exigence {i} : le système conserve l'historique des dossiers." * 20 for i in range(40))
+
+
+def test_notes_over_the_budget_are_merged_before_the_final_call(monkeypatch):
+    monkeypatch.setattr(dcf.mapreduce, "REDUCE_INPUT_TOKENS", 400)
+    prompts = []
+
+    def complete(prompt):
+        prompts.append(prompt)
+        return "Notes. " * 30
+
+    result = generate_dcf_map_reduce(CDC, complete, segment_tokens=500)
+    assert result.merge_rounds >= 1
+    assert prompts[-1] == result.reduce_prompt
+
+
+def test_notes_that_cannot_shrink_are_not_sent(monkeypatch):
+    monkeypatch.setattr(dcf.mapreduce, "REDUCE_INPUT_TOKENS", 400)
+    prompts = []
+
+    def complete(prompt):
+        prompts.append(prompt)
+        # Chaque note dépasse à elle seule la moitié du budget : aucun regroupement possible
+        return "Notes détaillées. " * 60
+
+    with pytest.raises(ValueError, match="dépassent"):
+        generate_dcf_map_reduce(CDC, complete, segment_tokens=500)
+    # Seule la phase map a été envoyée
+    assert len(prompts) == len(split_into_segments(CDC, 500))
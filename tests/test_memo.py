@@ -0,0 +1,41 @@
+import io
+
+from dcf.memo import MemoCache, content_hash, estimate_size
+
+VALUE = "x" * 1000
+
+
+def test_least_recently_used_values_are_evicted():
+    memo = MemoCache(max_bytes=estimate_size(VALUE) * 4)
+    for key in "abcd":
+        memo.put(key, VALUE)
+    # Une lecture rend la valeur la plus récente
+    assert memo.get("a") == VALUE
+    memo.put("e", VALUE)
+    assert memo.get("b") is None
+    assert [memo.get(key) for key in "acde"] == [VALUE] * 4
+    assert memo.stats()["evictions"] == 1
+    assert memo.stats()["bytes"] <= memo.max_bytes
+
+
+def test_oversized_values_are_returned_but_not_kept():
+    memo = MemoCache(max_bytes=estimate_size(VALUE) * 4)
+    memo.put("petit", VALUE)
+    assert memo.put("gros", VALUE * 2) == VALUE * 2
+    assert memo.get("gros") is None and memo.get("petit") == VALUE
+
+
+def test_values_are_computed_once():
+    memo = MemoCache()
+    calls = []
+    for _ in range(3):
+        assert memo.get_or_compute(("docx", content_hash("DCF")), lambda: calls.append(1) or "document") == "document"
+    assert len(calls) == 1
+    assert memo.stats()["hits"] == 2
+
+
+def test_uploads_hash_like_their_content():
+    upload = io.BytesIO(b"%PDF-1.7")
+    assert content_hash(upload) == content_hash(b"%PDF-1.7")
+    # Le tampon n'est plus exporté : le fichier reste modifiable
+    upload.write(b"suite")
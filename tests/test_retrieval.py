@@ -0,0 +1,29 @@
+from dcf.retrieval import Bm25Index, tokenize
+
+PASSAGES = [
+    "Le système calcule les allocations mensuelles des bénéficiaires.",
+    "Les dossiers clos sont archivés pendant dix ans.",
+    "L'archivage des dossiers s'effectue chaque nuit ; les dossiers archivés restent consultables.",
+    "L'écran d'accueil présente le tableau de bord.",
+]
+
+
+def test_terms_ignore_accents_case_plurals_and_stopwords():
+    assert tokenize("Les Dossiers ARCHIVÉS de l'année") == ["dossier", "archive", "annee"]
+
+
+def test_search_returns_the_top_k_passages_by_relevance():
+    index = Bm25Index(PASSAGES)
+    assert [position for position, _ in index.search("archivage des dossiers", k=2)] == [2, 1]
+    assert len(index.search("dossier", k=1)) == 1
+
+
+def test_passages_without_a_query_term_are_not_returned():
+    index = Bm25Index(PASSAGES)
+    assert [position for position, _ in index.search("allocation")] == [0]
+    assert index.search("interface de paiement") == []
+    assert index.stats()["queries"] == 2
+
+
+def test_empty_index():
+    assert Bm25Index([]).search("dossier") == []
@@ -0,0 +1,20 @@
+from dcf.router import Route, Router
+
+PRIMARY = Route("https://principal.openai.azure.com/", "gpt-4o")
+SECONDARY = Route("https://secours.openai.azure.com/", "gpt-4o")
+
+
+def test_strict_exclusion_never_falls_back_to_the_excluded_route():
+    router = Router([PRIMARY], "cle")
+    assert router.pick(exclude={PRIMARY}, wait=False) == PRIMARY
+    assert router.pick(exclude={PRIMARY}, wait=False, strict=True) is None
+
+
+def test_strict_exclusion_picks_another_route():
+    router = Router([PRIMARY, SECONDARY], "cle")
+    assert router.pick(exclude={PRIMARY}, wait=False, strict=True) == SECONDARY
+
+
+def test_no_hedging_with_a_single_route():
+    assert Router([PRIMARY], "cle", hedge_after=5).hedge_after is None
+    assert Router([PRIMARY, SECONDARY], "cle", hedge_after=5).hedge_after == 5
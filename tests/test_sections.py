@@ -0,0 +1,25 @@
+import json
+
+from dcf.sections import build_units, parse_outline
+
+
+def test_modules_with_the_same_name_are_merged():
+    response = json.dumps({"modules": [
+        {"name": "Gestion des demandes", "chunks": [0, 1]},
+        {"name": "Instruction", "chunks": [2]},
+        {"name": "gestion  des demandes", "chunks": [3]}
+    ]})
+    outline = parse_outline(response, 4)
+    assert outline["modules"] == [
+        {"name": "Gestion des demandes", "chunks": [0, 1, 3]}, {"name": "Instruction", "chunks": [2]}
+    ]
+
+
+def test_module_units_have_distinct_ids():
+    outline = {
+        "modules": [{"name": "Module", "chunks": [0]}, {"name": "Module", "chunks": [1]}],
+        "sections": {number: [0, 1] for number in ("1", "2", "4", "5", "6")}
+    }
+    units, _ = build_units(outline, 2)
+    ids = [unit.unit_id for unit in units]
+    assert len(ids) == len(set(ids))
@@ -0,0 +1,90 @@
+import json
+
+import openai
+
+from dcf.prompts import DCF_SCHEMA
+from dcf.structured import JSON_OBJECT_FORMAT, generate_dcf_structured, validate, validate_section
+
+CDC = "Le système gère les dossiers d'allocation et leur archivage."
+
+
+def _sample(schema, path=""):
+    """Valeur conforme au schéma : un élément par liste, le chemin du champ comme texte"""
+    if schema["type"] == "object":
+        return {name: _sample(child, f"{path}.{name}") for name, child in schema["properties"].items()}
+    if schema["type"] == "array":
+        return [_sample(schema["items"], path)]
+    return path.lstrip(".")
+
+
+def test_validation_reports_every_problem_with_its_path():
+    schema = DCF_SCHEMA["properties"]["regles_gestion"]
+    rule = _sample(schema)[0]
+    assert validate([rule], schema, "regles_gestion") == []
+    assert validate([{**rule, "identifiant": 1}, {}], schema, "regles_gestion") == [
+        "regles_gestion[0].identifiant : texte attendu",
+        *(f"regles_gestion[1].{name} : champ manquant" for name in schema["items"]["properties"])
+    ]
+    assert validate("texte", schema, "regles_gestion") == ["regles_gestion : liste attendue"]
+
+
+def test_sections_are_checked_beyond_the_schema():
+    data = _sample(DCF_SCHEMA)
+    assert all(not validate_section(number, data) for number in "123456")
+    data["specifications"] = []
+    data["regles_gestion"] *= 2
+    assert validate_section("3", data) == ["specifications : aucun module spécifié"]
+    assert validate_section("5", data) == ["regles_gestion : identifiants en double (regles_gestion.identifiant)"]
+    assert validate_section("6", {}) == ["visa : section absente"]
+
+
+def test_only_invalid_sections_are_requested_again():
+    data = _sample(DCF_SCHEMA)
+    del data["reprise"]
+    formats = []
+
+    def call(prompt, response_format):
+        formats.append(response_format["json_schema"]["name"])
+        if response_format["json_schema"]["name"] == "dcf":
+            return "```json\n" + json.dumps(data) + "\n```"
+        return json.dumps({"reprise": _sample(DCF_SCHEMA)["reprise"]})
+
+    result = generate_dcf_structured(CDC, call, "gpt-4o", max_workers=2)
+    assert formats == ["dcf", "dcf_section_4"]
+    assert result.retried == ["4"] and result.invalid == []
+    assert "reprise.procedure" in result.dcf
+
+
+def test_sections_still_invalid_are_marked_incomplete():
+    data = _sample(DCF_SCHEMA)
+    data["specifications"] = []
+
+    def call(prompt, response_format):
+        return json.dumps(data)
+
+    result = generate_dcf_structured(CDC, call, "gpt-4o", max_workers=2, max_retries=1)
+    assert result.invalid == ["3"]
+    assert "Section incomplète" in result.dcf
+
+
+class _SchemaRejected(openai.BadRequestError):
+    """Refus de response_format par un déploiement sans sorties structurées"""
+
+    def __init__(self):
+        Exception.__init__(self, "Invalid parameter: 'response_format' of type 'json_schema' is not supported")
+
+
+def test_json_object_mode_without_structured_outputs():
+    formats = []
+
+    def call(prompt, response_format):
+        formats.append(response_format)
+        if response_format["type"] == "json_schema":
+            raise _SchemaRejected()
+        # Le schéma est alors décrit dans le prompt
+        assert '"regles_gestion"' in prompt
+        return json.dumps(_sample(DCF_SCHEMA))
+
+    result = generate_dcf_structured(CDC, call, "gpt-4o")
+    assert formats[1:] == [JSON_OBJECT_FORMAT]
+    assert not result.json_schema and result.invalid == []
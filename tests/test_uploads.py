@@ -0,0 +1,34 @@
+import threading
+
+import pytest
+
+from dcf.uploads import MemoryBudget
+
+
+def test_on_wait_runs_outside_the_lock():
+    budget = MemoryBudget(max_bytes=10)
+    budget.acquire(10)
+    released = threading.Event()
+
+    def on_wait():
+        # Une libération depuis un autre thread ne doit pas attendre la fin du rappel
+        thread = threading.Thread(target=lambda: (budget.release(10), released.set()))
+        thread.start()
+        assert released.wait(2)
+
+    budget.acquire(5, on_wait=on_wait)
+    assert budget.stats() == {"in_use": 5, "max_bytes": 10, "active": 1, "waiting": 0}
+
+
+def test_failing_on_wait_leaves_the_queue():
+    budget = MemoryBudget(max_bytes=10)
+    budget.acquire(10)
+
+    def on_wait():
+        raise RuntimeError("affichage impossible")
+
+    with pytest.raises(RuntimeError):
+        budget.acquire(5, on_wait=on_wait)
+    assert budget.stats()["waiting"] == 0
+    budget.release(10)
+    budget.acquire(5)